@@ -1,23 +1,13 @@
 # generate_market_project.py
 # Creates the "Multi-Asset Market Analytics Dashboard" project locally and zips it.
-import os, textwrap, zipfile, shutil
+import os, sys, textwrap, zipfile, shutil
 import pandas as pd
 import numpy as np
 from datetime import datetime, timezone
 
 BASE = os.path.abspath("market-analytics-dashboard-full")
-
-if os.path.exists(BASE):
-    shutil.rmtree(BASE)
-os.makedirs(BASE, exist_ok=True)
-os.makedirs(os.path.join(BASE, "data", "equities"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "data", "forex"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "data", "commodities"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "data", "bonds"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "data", "cleaned"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "notebooks"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "dashboard"), exist_ok=True)
-os.makedirs(os.path.join(BASE, "docs"), exist_ok=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "market-analytics-dashboard-full"))
+from market_analytics import kpis as kpi_registry  # KPI columns of make_demo
 
 # requirements.txt
 requirements = textwrap.dedent("""\
@@ -32,8 +22,6 @@ requirements = textwrap.dedent("""\
     requests
     openpyxl
 """)
-with open(os.path.join(BASE, "requirements.txt"), "w") as f:
-    f.write(requirements)
 
 # README.md
 readme = textwrap.dedent(f"""\
@@ -84,8 +72,6 @@ readme = textwrap.dedent(f"""\
     - Yield curve slope (10Y - 2Y)
 
     """)
-with open(os.path.join(BASE, "README.md"), "w") as f:
-    f.write(readme)
 
 # notebooks / scripts
 notebooks = {
@@ -234,10 +220,6 @@ notebooks = {
         """)
 }
 
-for name, content in notebooks.items():
-    with open(os.path.join(BASE, "notebooks", name), "w") as f:
-        f.write(content)
-
 # Streamlit app
 streamlit_app = textwrap.dedent("""\
     # dashboard/streamlit_app.py
@@ -302,8 +284,6 @@ streamlit_app = textwrap.dedent("""\
         out = pd.DataFrame(rows).sort_values('return_pct', ascending=False)
         st.write(out.head(20))
     """)
-with open(os.path.join(BASE, "dashboard", "streamlit_app.py"), "w") as f:
-    f.write(streamlit_app)
 
 # KPI docs
 kpi_defs = textwrap.dedent("""\
@@ -333,46 +313,93 @@ kpi_defs = textwrap.dedent("""\
     ## Yield Curve Slope
     10Y yield - 2Y yield
     """)
-with open(os.path.join(BASE, "docs", "KPI_definitions.md"), "w") as f:
-    f.write(kpi_defs)
 
-# Create demo cleaned CSVs for a few assets so dashboard works
-dates = pd.bdate_range(end=pd.Timestamp.today(), periods=180)
-def make_demo(name, start_price):
-    prices = start_price * np.cumprod(1 + np.random.normal(0, 0.008, size=len(dates)))
+# Synthetic market data. make_demo builds one asset (OHLCV plus the KPI columns the cleaning
+# stage adds); make_universe writes N seeded assets x M bars of raw OHLCV for benchmarks.
+def demo_dates(periods=180, end=None):
+    return pd.bdate_range(end=pd.Timestamp.today().normalize() if end is None else end, periods=periods)
+
+def make_demo(name, start_price, dates=None, seed=None, out_dir=None, kpis=True):
+    # Same seed -> same frame. With out_dir, writes <out_dir>/<name>_clean.csv (or <name>.csv
+    # when kpis=False, i.e. raw input for the cleaning stage).
+    dates = demo_dates() if dates is None else dates
+    rng = np.random.default_rng(seed)
+    n = len(dates)
+    prices = start_price * np.cumprod(1 + rng.normal(0, 0.008, size=n))
     df = pd.DataFrame({
         "Date": dates,
-        "Open": prices * (1 + np.random.normal(0,0.002,len(dates))),
-        "High": prices * (1 + np.abs(np.random.normal(0,0.006,len(dates)))),
-        "Low": prices * (1 - np.abs(np.random.normal(0,0.006,len(dates)))),
+        "Open": prices * (1 + rng.normal(0,0.002,n)),
+        "High": prices * (1 + np.abs(rng.normal(0,0.006,n))),
+        "Low": prices * (1 - np.abs(rng.normal(0,0.006,n))),
         "Close": prices,
         "Adj Close": prices,
-        "Volume": np.random.randint(1e6, 5e6, size=len(dates))
+        "Volume": rng.integers(1_000_000, 5_000_000, size=n)
     })
-    df['Daily_Return'] = df['Close'].pct_change()
-    df['Cumulative_Return'] = (1+df['Daily_Return']).cumprod()-1
-    df['MA_20'] = df['Close'].rolling(20).mean()
-    df['MA_50'] = df['Close'].rolling(50).mean()
-    df['Volatility_7'] = df['Daily_Return'].rolling(7).std()
-    df['Volatility_30'] = df['Daily_Return'].rolling(30).std()
-    df['Spread'] = (df['High'] - df['Low']) / df['Close']
-    df.to_csv(os.path.join(BASE, "data", "cleaned", f"{name}_clean.csv"), index=False)
-
-make_demo("aapl", 150)
-make_demo("infy", 18)
-make_demo("tcs", 35)
-make_demo("nifty", 20000)
-
-# zip the project
-zip_path = os.path.abspath("market-analytics-dashboard-full.zip")
-with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-    for root, dirs, files in os.walk(BASE):
-        for file in files:
-            full = os.path.join(root, file)
-            arcname = os.path.relpath(full, os.path.dirname(BASE))
-            zf.write(full, arcname)
-print("Project created at:", BASE)
-print("Zip created at:", zip_path)
-
-
-
+    if kpis:
+        # the same registered KPI columns the cleaning stage stores
+        df, _ = kpi_registry.compute(df)
+    if out_dir is not None:
+        fname = f"{name}_clean.csv" if kpis else f"{name}.csv"
+        df.to_csv(os.path.join(out_dir, fname), index=False)
+    return df
+
+def universe_names(n_assets):
+    return [f"syn{i:05d}" for i in range(n_assets)]
+
+def make_universe(n_assets, n_bars, out_dir, seed=0, end='2025-12-31', kpis=False):
+    # Writes n_assets seeded assets of n_bars business days each to out_dir; asset i always gets
+    # the same data for a given seed, whatever n_assets is. Returns the asset names.
+    os.makedirs(out_dir, exist_ok=True)
+    dates = demo_dates(n_bars, end)
+    names = universe_names(n_assets)
+    for i, name in enumerate(names):
+        start_price = float(np.random.default_rng([seed, i, 0]).uniform(10, 1000))
+        make_demo(name, start_price, dates=dates, seed=[seed, i], out_dir=out_dir, kpis=kpis)
+    return names
+
+def main():
+    if os.path.exists(BASE):
+        shutil.rmtree(BASE)
+    os.makedirs(BASE, exist_ok=True)
+    os.makedirs(os.path.join(BASE, "data", "equities"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "data", "forex"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "data", "commodities"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "data", "bonds"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "data", "cleaned"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "notebooks"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "dashboard"), exist_ok=True)
+    os.makedirs(os.path.join(BASE, "docs"), exist_ok=True)
+
+    with open(os.path.join(BASE, "requirements.txt"), "w") as f:
+        f.write(requirements)
+    with open(os.path.join(BASE, "README.md"), "w") as f:
+        f.write(readme)
+    for name, content in notebooks.items():
+        with open(os.path.join(BASE, "notebooks", name), "w") as f:
+            f.write(content)
+    with open(os.path.join(BASE, "dashboard", "streamlit_app.py"), "w") as f:
+        f.write(streamlit_app)
+    with open(os.path.join(BASE, "docs", "KPI_definitions.md"), "w") as f:
+        f.write(kpi_defs)
+
+    # Create demo cleaned CSVs for a few assets so dashboard works
+    dates = demo_dates()
+    cleaned = os.path.join(BASE, "data", "cleaned")
+    make_demo("aapl", 150, dates=dates, out_dir=cleaned)
+    make_demo("infy", 18, dates=dates, out_dir=cleaned)
+    make_demo("tcs", 35, dates=dates, out_dir=cleaned)
+    make_demo("nifty", 20000, dates=dates, out_dir=cleaned)
+
+    # zip the project
+    zip_path = os.path.abspath("market-analytics-dashboard-full.zip")
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for root, dirs, files in os.walk(BASE):
+            for file in files:
+                full = os.path.join(root, file)
+                arcname = os.path.relpath(full, os.path.dirname(BASE))
+                zf.write(full, arcname)
+    print("Project created at:", BASE)
+    print("Zip created at:", zip_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,705 @@
+# Pipeline benchmarks on a seeded synthetic universe (make_universe from generate_market_project.py).
+# Times each stage and records its peak RSS at several scales, and writes the results as JSON
+# (with the git commit) so runs can be compared between commits:
+#
+#   python benchmarks/run_benchmarks.py --scales 100,1000 --bars 1260
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json benchmarks/results/new.json
+#
+# Every run also checks each KPI kernel engine against the pandas reference on the sampled
+# assets (full histories, histories split into incremental runs, and flat / short / gapped edge
+# cases), records the errors and exits non-zero on a mismatch. Without numba, the numba kernel's
+# body is checked in the interpreter (engine 'python') and the numba engine is reported skipped.
+# The same checks, per engine and edge case, are the pytest suite tests/test_kernels.py.
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(PROJECT_DIR))  # generate_market_project.py lives at the repo root
+
+import numpy as np
+import pandas as pd
+import generate_market_project as gen
+from market_analytics import (backtest, balancer, cache, calendars, curves, downsample, kernels, live, metrics, parallel, pipeline,
+                              plane, query, returns, risk, scripts, snapshot, store)
+
+RESULTS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'results')
+CHART_POINTS = 2000  # the dashboard's default chart size
+LONG_SERIES = 2_000_000
+CURVES, CURVE_TENORS = 20, 120  # yield curves (e.g. one per issuer) x quoted tenors
+PARITY_RTOL = 1e-12
+SPAN_CALLS = 200_000
+CALENDAR_ASSETS = 200  # assets split across two markets for the calendar alignment stages
+DASHBOARD = os.path.join(PROJECT_DIR, 'dashboard', 'streamlit_app.py')
+# Runs the dashboard in a fresh interpreter (cold imports and caches) with streamlit's AppTest:
+# its first run, a rerun and a switch to the Screener tab, each as seen by the test client and
+# inside the script (its dashboard.run span; the client adds ~0.25 s of set-up to a first run).
+# 'preload' first does what `python -m market_analytics dashboard` does while its server starts.
+DASHBOARD_PROBE = '''
+import json, sys, time
+mode, script, project = sys.argv[1:4]
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+sys.path.insert(0, project)
+from market_analytics import metrics
+out = {'streamlit_import_seconds': round(time.perf_counter() - t0, 4)}
+if mode == 'preload':
+    t0 = time.perf_counter()
+    from market_analytics import cache, cli
+    cli.preload()
+    cache.default_cache().warming.join()
+    out['preload_seconds'] = round(time.perf_counter() - t0, 4)
+metrics.enable()
+app = AppTest.from_file(script, default_timeout=600)
+
+def run(name):
+    spent = lambda: metrics.snapshot()['spans'].get('dashboard.run', {}).get('seconds', 0.0)
+    before, t0 = spent(), time.perf_counter()
+    app.run()
+    out[name + '_seconds'] = round(time.perf_counter() - t0, 4)
+    out[name + '_script_seconds'] = round(spent() - before, 4)
+
+run('first_run')
+run('rerun')
+app.session_state['panel'] = 'Screener'
+run('screener_tab')
+out['exceptions'] = len(app.exception)
+print(json.dumps(out))
+'''
+READERS = 4  # concurrent dashboard-like reader processes in the data plane memory stages
+# A reader holds five columns of every asset, from the data plane or read with pandas, then waits
+# (stdin) while its memory is sampled.
+READER_PROBE = '''
+import sys
+import numpy as np
+mode, project = sys.argv[1:3]
+sys.path.insert(0, project)
+from market_analytics import plane, store
+columns = ['Date', 'Close', 'Daily_Return', 'MA_20', 'Volatility_30']
+shared = plane.attach() if mode == 'plane' else None
+frames = [shared.frame(a, columns) if shared else store.read_asset(a, columns) for a in store.list_assets()]
+for df in frames:
+    for c in columns[1:]:
+        np.nansum(df[c].to_numpy())  # touch every page
+print('ready', flush=True)
+sys.stdin.readline()
+'''
+BALANCER_REQUESTS = 1000
+BACKTEST_GRID = dict(fast=range(5, 55, 5), slow=range(60, 260, 20), vol_target=0.1)  # 100 combinations
+BACKTEST_BASELINE_ASSETS = 100  # the per-asset pandas loop runs on this many and is scaled up
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is in KiB on Linux and bytes on macOS; it is a high-water mark, not current RSS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def smaps_mb(pid):
+    # Proportional (shared pages split between their users) and private memory of a process.
+    out = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Pss', 'Private_Clean', 'Private_Dirty'):
+                out[key] = int(value.split()[0]) / 1024
+    return out['Pss'], out['Private_Clean'] + out['Private_Dirty']
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class PeakRSS:
+    # Samples this process's RSS in a background thread while a stage runs.
+    def __init__(self, interval=0.005):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def _sample(self):
+        while self.running:
+            self.peak = max(self.peak, rss_bytes())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def measure(stage, func, results, scale, bars):
+    with PeakRSS() as mem:
+        t0 = time.perf_counter()
+        info = func()
+        seconds = time.perf_counter() - t0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    row = {'assets': scale, 'bars': bars, 'stage': stage, 'seconds': round(seconds, 6),
+           'peak_rss_mb': round(mem.peak / 2**20, 2), 'rss_delta_mb': round((mem.peak - mem.start) / 2**20, 2),
+           'children_max_rss_mb': round(children / 2**20, 2)}
+    if isinstance(info, dict):
+        row.update(info)
+    results.append(row)
+    print(f"  {stage:<24} {seconds:10.4f}s  peak {row['peak_rss_mb']:9.1f} MB  (+{row['rss_delta_mb']:.1f})")
+    return info
+
+
+def append_bar(raw_dir, every=1):
+    # Adds one new business-day bar to every raw CSV (or every `every`-th one), for the
+    # incremental cleaning and pipeline stages.
+    for i, fname in enumerate(sorted(f for f in os.listdir(raw_dir) if f.endswith('.csv'))):
+        if i % every:
+            continue
+        path = os.path.join(raw_dir, fname)
+        with open(path, 'rb') as f:
+            f.seek(-min(4096, os.path.getsize(path)), os.SEEK_END)
+            last = f.read().splitlines()[-1].decode().split(',')
+        last[0] = (pd.Timestamp(last[0]) + pd.offsets.BDay(1)).strftime('%Y-%m-%d')
+        with open(path, 'a') as f:
+            f.write(','.join(last) + '\n')
+
+
+def ewma_cov_reference(x, halflife):
+    # Pairwise EWMA covariance one pair at a time (weights halving every `halflife` dates back
+    # from the last one), to check the risk engine's incremental sums.
+    t = x.shape[1]
+    w = 0.5 ** ((t - 1 - np.arange(t)) / halflife)
+    out = np.full((len(x), len(x)), np.nan)
+    for i in range(len(x)):
+        for j in range(len(x)):
+            ok = ~np.isnan(x[i]) & ~np.isnan(x[j])
+            if ok.sum() >= 2:
+                ww, xi, xj = w[ok] / w[ok].sum(), x[i, ok], x[j, ok]
+                out[i, j] = (ww * (xi - ww @ xi) * (xj - ww @ xj)).sum()
+    return out
+
+
+def engines():
+    return [e for e in kernels.ENGINES if e != 'numba' or kernels.HAVE_NUMBA]
+
+
+def parity_engines():
+    # Engines checked against pandas: without numba, its kernel's body runs interpreted instead.
+    return ['numba' if kernels.HAVE_NUMBA else 'python', 'numpy']
+
+
+def parity_cases(seed=0, n=1500):
+    # (name, close, high, low) edge cases on top of the sampled assets.
+    rng = np.random.default_rng([seed, 10])
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, n))
+    flat = close.copy()
+    flat[200:260] = flat[200]  # stale quotes: zero-variance windows
+    gapped = close.copy()
+    gapped[[5, 300, 301, 900]] = np.nan
+    return [('random', close), ('flat', flat), ('gapped', gapped), ('short', close[:12]), ('single', close[:1])]
+
+
+def max_error(got, ref):
+    # Largest error relative to max(1, |ref|); inf if the NaN positions differ.
+    worst = 0.0
+    for name, r in ref.items():
+        g = got[name]
+        if not np.array_equal(np.isnan(g), np.isnan(r)):
+            return float('inf')
+        ok = ~np.isnan(r)
+        if ok.any():
+            worst = max(worst, float(np.max(np.abs(g[ok] - r[ok]) / np.maximum(1, np.abs(r[ok])))))
+    return worst
+
+
+def kpi_parity(series, engine, split=0.6):
+    # Max error of an engine against the pandas reference over every series, computed in one go
+    # and again as two incremental runs carrying the tail closes and cumulative factor.
+    worst = 0.0
+    for close, high, low in series:
+        ref, ref_factor = kernels.fused_kpis(close, high, low, engine='pandas')
+        got, factor = kernels.fused_kpis(close, high, low, engine=engine)
+        worst = max(worst, max_error(got, ref), abs(factor - ref_factor) / abs(ref_factor))
+        cut = int(len(close) * split)
+        tail = min(cut, 50)
+        first, f1 = kernels.fused_kpis(close[:cut], high[:cut], low[:cut], engine=engine)
+        second, f2 = kernels.fused_kpis(close[cut - tail:], high[cut:], low[cut:], start=tail, factor=f1,
+                                        engine=engine)
+        joined = {k: np.concatenate([first[k], second[k]]) for k in ref}
+        worst = max(worst, max_error(joined, ref), abs(f2 - ref_factor) / abs(ref_factor))
+    return worst
+
+
+def load_series(raw_dir, limit=None):
+    series = []
+    for fname in sorted(os.listdir(raw_dir))[:limit]:
+        if fname.endswith('.csv'):
+            df = pd.read_csv(os.path.join(raw_dir, fname), usecols=['Close', 'High', 'Low'])
+            series.append((df['Close'].to_numpy('float64'), df['High'].to_numpy('float64'),
+                           df['Low'].to_numpy('float64')))
+    return series
+
+
+def check_parity(series, seed=0):
+    # Returns {engine: max error} over the given series plus the edge cases.
+    cases = series + [(c, c * 1.01, c * 0.99) for _, c in parity_cases(seed)]
+    if not kernels.HAVE_NUMBA:
+        print('  parity numba    skipped: numba is not installed (its kernel is checked interpreted, as python)')
+    errors = {e: kpi_parity(cases, e) for e in parity_engines()}
+    for e, err in errors.items():
+        print(f"  parity {e:<8} max rel error {err:.3g}  {'ok' if err <= PARITY_RTOL else 'FAILED'}")
+    return errors
+
+
+def run_scale(n_assets, bars, seed, workers, results):
+    clean_mod = scripts.load('02_data_cleaning')
+    kpi_mod = scripts.load('03_kpi_calculations')
+    summary_mod = scripts.load('05_daily_market_summary')
+    raw_dir = os.path.join('data', 'equities')
+    print(f'{n_assets} assets x {bars} bars')
+
+    measure('generate', lambda: {'files': len(gen.make_universe(n_assets, bars, raw_dir, seed=seed))},
+            results, n_assets, bars)
+
+    series = load_series(raw_dir)
+    errors = check_parity(series[:20], seed)
+    for engine in engines():
+        kernels.fused_kpis(*series[0], engine=engine)  # compile / warm up outside the timing
+
+        def kernel(engine=engine):
+            for close, high, low in series:
+                kernels.fused_kpis(close, high, low, engine=engine)
+            return {'series': len(series), 'max_rel_error': errors.get(engine, 0.0)}
+        measure(f'kpi_kernel_{engine}', kernel, results, n_assets, bars)
+
+    def clean():
+        cleaned, failures, _ = clean_mod.clean_all(raw_dir, workers=workers, chunksize=max(1, n_assets // (workers * 8)))
+        return {'rows': int(sum(len(d) for d, _, _ in cleaned.values())), 'failures': len(failures)}
+    measure('clean_full', clean, results, n_assets, bars)
+
+    append_bar(raw_dir)
+
+    def clean_incremental():
+        cleaned, failures, _ = clean_mod.clean_all(raw_dir, incremental=True, workers=workers,
+                                                   chunksize=max(1, n_assets // (workers * 8)))
+        return {'rows': int(sum(len(d) for d, _, _ in cleaned.values())), 'failures': len(failures)}
+    measure('clean_incremental_1bar', clean_incremental, results, n_assets, bars)
+
+    # the same day's cleaning with instrumentation on (spans and counters merged back from the
+    # workers), and the cost of one span with it off and on
+    append_bar(raw_dir)
+    metrics.reset()
+    metrics.enable()
+
+    def clean_instrumented():
+        info = clean_incremental()
+        recorded = metrics.snapshot()
+        return dict(info, clean_equity_calls=recorded['spans'].get('clean_equity', {}).get('calls', 0),
+                    rows_written=recorded['counters'].get('store_rows_written', 0))
+    measure('clean_incremental_metrics', clean_instrumented, results, n_assets, bars)
+
+    def span_overhead():
+        out = {}
+        for on in (False, True):
+            metrics.enable(on)
+            t0 = time.perf_counter()
+            for _ in range(SPAN_CALLS):
+                with metrics.span('bench'):
+                    pass
+            out[f"ns_per_span_{'on' if on else 'off'}"] = round((time.perf_counter() - t0) / SPAN_CALLS * 1e9, 1)
+        return out
+    measure('metrics_span_overhead', span_overhead, results, n_assets, bars)
+    metrics.enable(False)
+    metrics.reset()
+
+    # the pipeline DAG on the same store: a first run records fingerprints, then a day on which
+    # 5% of the assets got a new bar, then a run with nothing changed
+    pipeline_mod = scripts.load('run_pipeline')
+
+    def run_pipeline():
+        report = pipeline.Pipeline(pipeline_mod.build(), workers=workers).run(log=None)
+        statuses = [r['status'] for r in report]
+        return {'tasks': len(report), 'ran': statuses.count('ran'), 'cached': statuses.count('cached')}
+    measure('pipeline_first_run', run_pipeline, results, n_assets, bars)
+    append_bar(raw_dir, every=20)
+    measure('pipeline_5pct_changed', run_pipeline, results, n_assets, bars)
+    measure('pipeline_unchanged', run_pipeline, results, n_assets, bars)
+
+    measure('kpi_aggregate', lambda: {'rows': len(kpi_mod.latest_kpis_table(snapshot.load()))},
+            results, n_assets, bars)
+    measure('kpi_snapshot_rebuild', lambda: {'rows': len(snapshot.build(workers=workers))},
+            results, n_assets, bars)
+    measure('top_movers', lambda: {'rows': len(summary_mod.top_movers(20))}, results, n_assets, bars)
+
+    rm = measure('returns_build', lambda: returns.build(), results, n_assets, bars)
+    subset = rm.assets[:min(500, len(rm.assets))]
+    measure('correlation', lambda: {'matrix': rm.correlation(subset).shape[0]}, results, n_assets, bars)
+
+    # two markets with different holidays (the synthetic universe shares one calendar): each
+    # asset's prices lose its market's holidays, then returns on the sessions both markets
+    # traded, against an inner join of the price frames in pandas
+    rng = np.random.default_rng([seed, 40])
+    holidays = {m: set(rng.choice(len(rm.dates), len(rm.dates) // 50, replace=False)) for m in ('XNYS', 'XNSE')}
+    split = {a: 'XNYS' if i % 2 else 'XNSE' for i, a in enumerate(rm.assets[:CALENDAR_ASSETS])}
+    prices, series = {}, {}
+    for a, m in split.items():
+        keep = np.array([j not in holidays[m] for j in range(len(rm.dates))])
+        p = pd.Series(np.cumprod(1 + np.nan_to_num(rm.values[rm.index[a]]))[keep], index=rm.dates[keep])
+        prices[a] = p
+        series[a] = (p.index.to_numpy('datetime64[ns]'), p.pct_change().to_numpy())
+    two = returns.merge(None, series)
+    measure('calendar_build', lambda: {'markets': len(calendars.build(two, split).markets)}, results, n_assets, bars)
+    two = returns.ReturnsMatrix(two.assets, two.dates, two.values, calendars.build(two, split))
+    corr = measure('calendar_sessions_corr', lambda: two.correlation(method='sessions'), results, n_assets, bars)
+    ref = measure('calendar_pandas_join', lambda: pd.concat(prices, axis=1, join='inner').pct_change().iloc[1:].corr(),
+                  results, n_assets, bars)
+    inner = two.correlation(method='inner')
+    results[-2]['max_abs_error_pandas'] = float(np.nanmax(np.abs(corr.to_numpy() - ref.to_numpy())))
+    results[-2]['max_abs_error_inner'] = float(np.nanmax(np.abs(inner.to_numpy() - ref.to_numpy())))
+
+    # risk engine: every date but the last from scratch, then the last one as a daily update,
+    # against recomputing that day's window covariance with pandas
+    rm = returns.get()
+    before = returns.ReturnsMatrix(rm.assets, rm.dates[:-1], rm.values[:, :-1])
+    bench = rm.assets[0]
+    measure('risk_full_build', lambda: {'dates': risk.update(before, benchmark=bench)[1]}, results, n_assets, bars)
+    engine = measure('risk_daily_update', lambda: risk.update(rm, benchmark=bench)[0], results, n_assets, bars)
+    frame = rm.frame()
+    window = frame.iloc[-risk.WINDOW:]
+    ref = measure('risk_pandas_window', lambda: window.cov(min_periods=2), results, n_assets, bars)
+    full = risk.update(rm, benchmark=bench, full=True, write_out=False)[0]
+    results[-2].update({  # the daily update's row
+        'max_abs_error_pandas': float(np.nanmax(np.abs(engine.covariance().to_numpy() - ref.to_numpy()))),
+        'max_abs_error_ewma': float(np.nanmax(np.abs(engine.covariance(rm.assets[:50], kind='ewma').to_numpy()
+                                                     - ewma_cov_reference(np.asarray(rm.values[:50]), risk.HALFLIFE)))),
+        'max_abs_error_vs_full': float(np.nanmax(np.abs(engine.covariance(kind='ewma').to_numpy()
+                                                         - full.covariance(kind='ewma').to_numpy())))})
+
+    # store-wide queries: a two-condition screen on the last date, a year of per-asset averages
+    # and the year's worst drawdowns, against reading every asset into pandas
+    day = pd.Timestamp(rm.dates[-2])  # the last date every asset has a bar on
+    year = day - pd.DateOffset(years=1)
+    where = [('Volatility_30', '>', 0.0075), ('Spread', '<', 0.01)]
+    found = measure('query_screen', lambda: query.screen(where, day, ['Close']), results, n_assets, bars)
+    data = query.dataset()
+    query.screen(where, day, ['Close'], data=data)  # reads the footers once, as the dashboard's cache does
+    measure('query_screen_reused', lambda: {'assets_found': len(query.screen(where, day, ['Close'], data=data))},
+            results, n_assets, bars)
+    measure('query_aggregate', lambda: {'rows': len(query.aggregate({'vol': ('Volatility_30', 'mean')}, start=year))},
+            results, n_assets, bars)
+    worst = measure('query_drawdowns', lambda: query.drawdowns(20, start=year), results, n_assets, bars)
+
+    def pandas_screen():
+        (_, _, min_vol), (_, _, max_spread) = where
+        screened, falls = [], {}
+        for a in store.list_assets():
+            df = store.read_asset(a, ['Date', 'Close', 'Volatility_30', 'Spread'])
+            last = df[df['Date'] == day]
+            if len(last) and last['Volatility_30'].iloc[-1] > min_vol and last['Spread'].iloc[-1] < max_spread:
+                screened.append(a)
+            close = df.loc[df['Date'] >= year, 'Close']
+            falls[a] = (close / close.cummax() - 1).min() * 100
+        return screened, pd.Series(falls).nsmallest(20)
+    screened, falls = measure('query_pandas_baseline', pandas_screen, results, n_assets, bars)
+    results[-1].update({'screen_matches': sorted(screened) == sorted(found.index),
+                        'max_abs_error_drawdown': float(np.max(np.abs(worst['drawdown_pct'].to_numpy()
+                                                                      - falls.to_numpy())))})
+    results[-5]['assets_found'] = len(found)
+    results[-2]['worst_pct'] = round(float(worst['drawdown_pct'].iloc[0]), 4)
+
+    frames = cache.FrameCache()
+    sample = store.list_assets()[:50]
+
+    def load_all():
+        # what the dashboard does per asset: snapshot tiles plus the two downsampled charts
+        payload = 0
+        for a in sample:
+            frames.snapshot()
+            payload = max(payload, len(frames.chart(a, 'Close', points=CHART_POINTS, method='lttb')),
+                          len(frames.chart(a, 'Daily_Return', points=CHART_POINTS, method='minmax')))
+        return {'loads': len(sample), 'hit_rate': round(frames.stats()['hit_rate'], 4), 'max_points': payload}
+    measure('dashboard_load_cold', load_all, results, n_assets, bars)
+    measure('dashboard_load_warm', load_all, results, n_assets, bars)
+
+    # start-up: the CLI's command list, and the dashboard in a fresh interpreter as served by
+    # `streamlit run` (everything loaded by the first session) and by the CLI (preloaded)
+    measure('cli_help', lambda: subprocess.run([sys.executable, '-m', 'market_analytics', '--help'], cwd=PROJECT_DIR,
+                                               check=True, capture_output=True), results, n_assets, bars)
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    results[-1]['interpreter_seconds'] = round(time.perf_counter() - t0, 4)  # of which the bare interpreter
+
+    def dashboard_start(mode):
+        out = subprocess.run([sys.executable, '-c', DASHBOARD_PROBE, mode, DASHBOARD, PROJECT_DIR],
+                             capture_output=True, text=True)
+        if out.returncode:
+            return {'error': (out.stderr.strip().splitlines() or ['failed'])[-1]}
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    measure('dashboard_start_cold', lambda: dashboard_start('cold'), results, n_assets, bars)
+    measure('dashboard_start_preloaded', lambda: dashboard_start('preload'), results, n_assets, bars)
+
+    # live updates: one feed bar for every asset (up to 1000), timed from send until the
+    # throttled publish that carries all of them, and one store-watch pass with nothing changed
+    service = live.LiveService(port=0, poll=3600, throttle=0.05).start()
+    snap = service.snapshot()
+    feed = [{'asset': a, 'Date': (pd.Timestamp(snap.loc[a, 'Date']) + pd.Timedelta(minutes=1)).isoformat(),
+             'Open': c, 'High': c * 1.001, 'Low': c * 0.999, 'Close': c * 1.0005, 'Volume': 1000}
+            for a, c in snap['Close'].iloc[:1000].items()]
+    live.send_bars(feed[:1], service.port)  # warm up the feed path
+
+    def wait_version(v, timeout=30):
+        t0 = time.perf_counter()
+        while service.version < v and time.perf_counter() - t0 < timeout:
+            time.sleep(0.001)
+
+    wait_version(1)
+
+    def live_feed():
+        version = service.version
+        live.send_bars(feed[1:], service.port)
+        while service.stats['feed_bars'] < len(feed):
+            time.sleep(0.001)
+        wait_version(version + 1)
+        return {'bars': len(feed), 'version': service.version}
+    measure('live_feed_publish', live_feed, results, n_assets, bars)
+    measure('live_store_poll', lambda: {'changed': len(service._changed_assets())}, results, n_assets, bars)
+    service.stop()
+
+    def long_chart():
+        # a multi-year minute-bar series: build the tiers, then a full-range and a zoomed query
+        rng = np.random.default_rng([seed, 20])
+        dates = np.datetime64('2015-01-01', 'ns') + np.arange(LONG_SERIES, dtype='int64') * 60 * 10**9
+        tiers = downsample.Tiers(dates, np.cumsum(rng.normal(size=LONG_SERIES)))
+        full = tiers.query(points=CHART_POINTS)[0]
+        zoom = tiers.query(dates[LONG_SERIES // 2], dates[LONG_SERIES // 2 + 1500], CHART_POINTS)[0]
+        return {'rows': LONG_SERIES, 'levels': len(tiers.levels), 'full_points': len(full), 'zoom_points': len(zoom)}
+    measure('chart_tiers_long', long_chart, results, n_assets, bars)
+
+    # yield curves (~2% of the quotes missing): slopes / butterflies for every date of every curve
+    rng = np.random.default_rng([seed, 30])
+    labels = [f'{m}M' for m in np.unique(np.round(np.geomspace(1, 360, CURVE_TENORS)).astype(int))]
+    dates = pd.bdate_range('2015-01-01', periods=bars)
+    curve_set = []
+    for i in range(CURVES):
+        values = 3 + np.cumsum(rng.normal(0, 0.02, (bars, len(labels))), axis=0)
+        values[rng.random(values.shape) < 0.02] = np.nan
+        curve_set.append(curves.Curve(f'C{i}', dates, labels, values))
+    targets = np.array([0.25, 2.0, 5.0, 10.0, 30.0])
+    curve = curve_set[-1]
+    got = curve.at(targets)
+    err = 0.0  # against np.interp, one row at a time
+    for row, y in zip(curve.values, got):
+        ok = ~np.isnan(row)
+        err = max(err, float(np.max(np.abs(np.interp(targets, curve.tenors[ok], row[ok]) - y))))
+    # slopes / butterflies, also of the curve without its tenors beyond 20Y: a leg outside the
+    # tenors quoted on a date is NaN rather than extrapolated
+    keep = curve.tenors <= 20
+    short = curves.Curve('short', dates, [t for t, k in zip(curve.labels, keep) if k], curve.values[:, keep])
+    mismatches = 0
+    for c in (curve, short):
+        got = c.metrics()
+        for name, legs in list(curves.SLOPES.items()) + list(curves.BUTTERFLIES.items()):
+            years = np.array([curves.tenor_years(t) for t in legs])
+            sign = np.array([-1.0, 1.0]) if len(legs) == 2 else np.array([-1.0, 2.0, -1.0])
+            for row, y in zip(c.values, got[name].to_numpy()):
+                ok = ~np.isnan(row)
+                inside = ok.any() and c.tenors[ok][0] <= years.min() and years.max() <= c.tenors[ok][-1] + 1e-9
+                ref = sign @ np.interp(years, c.tenors[ok], row[ok]) if inside else np.nan
+                if np.isnan(ref) != np.isnan(y):
+                    mismatches += 1
+                elif not np.isnan(ref):
+                    err = max(err, abs(ref - y))
+
+    def curve_analytics():
+        rows = sum(len(c.metrics()) for c in curve_set)
+        return {'curves': CURVES, 'tenors': len(labels), 'rows': rows, 'max_abs_error': err,
+                'nan_mismatches': mismatches}
+    measure('curve_analytics', curve_analytics, results, n_assets, bars)
+
+    # the shared data plane: a full publish, one after 5% of the assets were re-cleaned, and what a
+    # dashboard worker does to attach to it
+    def plane_publish(full):
+        vdir, read = plane.publish(full=full)
+        size = sum(os.path.getsize(os.path.join(vdir, f)) for f in os.listdir(vdir))
+        return {'assets_read': len(read), 'plane_mb': round(size / 2**20, 2)}
+    measure('plane_publish_full', lambda: plane_publish(True), results, n_assets, bars)
+    append_bar(raw_dir, every=20)
+    clean_incremental()
+    measure('plane_publish_incremental', lambda: plane_publish(False), results, n_assets, bars)
+    sample = store.list_assets()[0]
+    measure('plane_attach', lambda: {'rows': len(plane.attach().frame(sample, ['Date', 'Close']))},
+            results, n_assets, bars)
+
+    # READERS processes holding the same data at once, as dashboard workers do: with pandas every
+    # one has its own copy, with the plane they share the page cache's
+    def readers(mode):
+        procs = [subprocess.Popen([sys.executable, '-c', READER_PROBE, mode, PROJECT_DIR], stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True) for _ in range(READERS)]
+        try:
+            if any(p.stdout.readline().strip() != 'ready' for p in procs):
+                return {'error': 'reader failed'}
+            mem = [smaps_mb(p.pid) for p in procs]
+        finally:
+            for p in procs:
+                p.stdin.close()
+                p.wait()
+        return {'readers': READERS, 'pss_total_mb': round(sum(m[0] for m in mem), 2),
+                'private_mb_per_reader': round(sum(m[1] for m in mem) / READERS, 2)}
+    if os.path.exists('/proc/self/smaps_rollup'):
+        measure('readers_memory_pandas', lambda: readers('pandas'), results, n_assets, bars)
+        measure('readers_memory_plane', lambda: readers('plane'), results, n_assets, bars)
+
+    # the load balancer's cost per request (a new connection each) over two minimal HTTP backends
+    backends = [ThreadingHTTPServer(('127.0.0.1', 0), _OkHandler) for _ in range(2)]
+    for server in backends:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    lb = balancer.Balancer([s.server_address for s in backends], port=0)
+    ready = threading.Event()
+    threading.Thread(target=lb.run, args=(ready.set,), daemon=True).start()
+    ready.wait(10)
+
+    def get(port, n):
+        for _ in range(n):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+    measure('balancer_requests', lambda: get(lb.port, BALANCER_REQUESTS) or {'requests': BALANCER_REQUESTS},
+            results, n_assets, bars)
+    t0 = time.perf_counter()
+    get(backends[0].server_address[1], BALANCER_REQUESTS)
+    results[-1]['direct_seconds'] = round(time.perf_counter() - t0, 6)
+    results[-1]['connections'] = lb.stats['connections']
+    for server in backends:
+        server.shutdown()
+        server.server_close()
+
+    # the backtest engine: a 100-combination sweep over the whole universe, against one
+    # combination done the way a per-asset pandas loop would, scaled up to the same sweep
+    universe = measure('backtest_load', lambda: backtest.load(), results, n_assets, bars)
+    results[-1]['dates'] = len(universe.dates)
+    combos = backtest.grid(**BACKTEST_GRID)
+
+    def sweep():
+        stats, _ = backtest.sweep(universe, combos, workers)
+        return {'combinations': len(combos), 'workers': workers, 'rows': len(stats)}
+    measure('backtest_sweep', sweep, results, n_assets, bars)
+    results[-1]['ms_per_combination'] = round(results[-1]['seconds'] * 1000 / len(combos), 3)
+    params = combos[len(combos) // 2]
+    sample = universe.assets[:BACKTEST_BASELINE_ASSETS]
+    engine = backtest.evaluate(universe, **params).stats['pnl']
+
+    def pandas_backtest():
+        err = 0.0
+        for i, a in enumerate(sample):
+            # on its market's sessions, carrying a close over the ones the asset has no bar on
+            sessions = universe.dates[universe.session[i]]
+            df = store.read_asset(a, ['Date', 'Close', 'Spread']).set_index('Date').reindex(sessions).ffill()
+            r = df['Close'].pct_change()
+            signal = np.sign(df['Close'].rolling(params['fast']).mean() - df['Close'].rolling(params['slow']).mean())
+            size = (params['vol_target'] / (r.rolling(backtest.VOL_WINDOW).std() * backtest.YEAR ** 0.5))
+            w = (signal * size.clip(upper=backtest.MAX_LEVERAGE)).fillna(0)
+            held = w.shift(1).fillna(0)
+            net = held * r.fillna(0) - (w - held).abs() * df['Spread'].fillna(0) * backtest.COST_FACTOR
+            err = max(err, abs(net.sum() - engine[a]))
+        return {'baseline_assets': len(sample), 'max_abs_error': err}
+    measure('backtest_pandas_baseline', pandas_backtest, results, n_assets, bars)
+    results[-1]['sweep_seconds_estimate'] = round(results[-1]['seconds'] * len(universe.assets) / max(len(sample), 1)
+                                                  * len(combos), 1)
+    return errors
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    base = {(r['assets'], r['bars'], r['stage']): r for r in old['results']}
+    print(f"{'assets':>7} {'stage':<24} {'old s':>10} {'new s':>10} {'ratio':>7} {'old MB':>9} {'new MB':>9}")
+    for r in new['results']:
+        o = base.get((r['assets'], r['bars'], r['stage']))
+        if o is None:
+            continue
+        ratio = r['seconds'] / o['seconds'] if o['seconds'] else float('nan')
+        print(f"{r['assets']:>7} {r['stage']:<24} {o['seconds']:>10.4f} {r['seconds']:>10.4f} {ratio:>7.2f} "
+              f"{o['peak_rss_mb']:>9.1f} {r['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on a synthetic universe.')
+    parser.add_argument('--scales', default='100,1000', help='comma-separated asset counts, e.g. 100,1000,10000')
+    parser.add_argument('--bars', type=int, default=1260, help='business-day bars per asset')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=parallel.default_workers())
+    parser.add_argument('--out', default=None, help='results JSON (default benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary working directories')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files and exit')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results, errors = [], {}
+    cwd = os.getcwd()
+    for n_assets in [int(s) for s in args.scales.split(',') if s]:
+        # The scripts use paths relative to the project root, so each scale runs in its own
+        # scratch directory with a fresh data/ tree.
+        workdir = tempfile.mkdtemp(prefix=f'bench-{n_assets}-')
+        os.chdir(workdir)
+        try:
+            for engine, err in run_scale(n_assets, args.bars, args.seed, args.workers, results).items():
+                errors[engine] = max(err, errors.get(engine, 0.0))
+        finally:
+            os.chdir(cwd)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    meta = {'commit': commit, 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'workers': args.workers,
+            'seed': args.seed, 'kpi_engine': kernels.ENGINE, 'kpi_parity': errors,
+            'numba': kernels.HAVE_NUMBA}
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit or 'nocommit'}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    print('Results written to', out)
+    if any(e > PARITY_RTOL for e in errors.values()):
+        sys.exit('KPI kernel parity check failed')
+
+
+if __name__ == '__main__':
+    main()
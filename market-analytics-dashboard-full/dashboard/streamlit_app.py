@@ -1,61 +1,240 @@
 # dashboard/streamlit_app.py
-import streamlit as st
-import pandas as pd
-import plotly.express as px
 import os
+import sys
+import time
+import streamlit as st
 
+run_started = time.perf_counter()
 st.set_page_config(page_title='Market Analytics Dashboard', layout='wide')
 st.title('Multi-Asset Market Analytics Dashboard (FICC + Equities) - Data Analyst View')
 
-CLEAN_DIR = 'data/cleaned'
-assets = sorted([f.replace('_clean.csv','') for f in os.listdir(CLEAN_DIR) if f.endswith('_clean.csv')])
+# The page shell above reaches the browser before these imports (pandas alone is most of a cold
+# start); later reruns find them loaded.
+import pandas as pd
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import cache, curves, downsample, live, metrics, query, snapshot
+
+@st.cache_resource
+def frame_cache():
+    # The server process's cache, shared by every session; frames in it are read-only. The
+    # store-wide data (snapshot, returns, risk, curves, query dataset) loads in the background
+    # meanwhile, so switching to a panel finds it ready; `python -m market_analytics dashboard`
+    # starts that (and these imports) while the server is still starting.
+    frames = cache.default_cache()
+    frames.warm()
+    return frames
+
+@st.cache_resource
+def live_service():
+    # One update service per server process: watches the store and, with MARKET_FEED_PORT set,
+    # accepts bars from a local feed (market_analytics/live.py).
+    port = os.environ.get('MARKET_FEED_PORT')
+    service = live.LiveService(port=int(port) if port else None).start()
+    metrics.register('live', lambda: dict(service.stats, version=service.version))
+    return service
+
+@st.cache_resource
+def metrics_server():
+    # Prometheus endpoint of this server process, with MARKET_METRICS=1 and MARKET_METRICS_PORT set.
+    port = os.environ.get('MARKET_METRICS_PORT')
+    return metrics.serve(int(port)) if metrics.enabled and port else None
+
+def line_chart(df, x, ys, title, markers=False):
+    # Figures are built with graph_objects: plotly.express costs tens of ms per figure per rerun.
+    fig = go.Figure([go.Scatter(x=df[x], y=df[y], name=y, mode='lines+markers' if markers else 'lines') for y in ys])
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=ys[0] if len(ys) == 1 else None, showlegend=len(ys) > 1)
+    return fig
+
+# seconds between live refreshes of the KPI tiles (in-memory reads, no file access)
+LIVE_REFRESH = float(os.environ.get('MARKET_LIVE_REFRESH', 0.5))
+SCREEN_COLUMNS = ['Close', 'Daily_Return', 'MA_20', 'MA_50', 'Volatility_7', 'Volatility_30', 'Spread', 'Amihud']
+SCREEN_CONDITIONS = 3
+
+frames = frame_cache()
+metrics_server()
+with metrics.span('dashboard.load'):
+    assets = frames.assets()
+    curve_names = curves.list_curves()
 
-if not assets:
+if not assets and not curve_names:
     st.warning('No cleaned assets found. Run data collection & cleaning notebooks first.')
-else:
+if assets:
     asset = st.sidebar.selectbox('Choose asset', options=assets)
-    df = pd.read_csv(os.path.join(CLEAN_DIR, asset + '_clean.csv'), parse_dates=['Date'])
-
-    st.subheader(f'{asset.upper()} — Latest price & KPIs')
-    latest = df.iloc[-1]
-    c1, c2, c3 = st.columns(3)
-    c1.metric('Latest Close', f"{latest['Close']:.2f}")
-    c1.metric('Latest Daily Return (%)', f"{latest['Daily_Return']*100:.2f}")
-    c2.metric('20d MA', f"{latest['MA_20']:.2f}" if not pd.isna(latest['MA_20']) else 'n/a')
-    c2.metric('50d MA', f"{latest['MA_50']:.2f}" if not pd.isna(latest['MA_50']) else 'n/a')
-    vol30 = df['Daily_Return'].rolling(30).std().iloc[-1]
-    c3.metric('30d Volatility (ann., %)', f"{vol30*(252**0.5)*100:.2f}" if not pd.isna(vol30) else 'n/a')
-
-    fig = px.line(df, x='Date', y='Close', title=f"{asset.upper()} Price")
-    st.plotly_chart(fig, use_container_width=True)
-
-    st.subheader('Returns & Volatility')
-    fig2 = px.line(df, x='Date', y='Daily_Return', title='Daily Returns')
-    st.plotly_chart(fig2, use_container_width=True)
-
-    # Correlation
-    st.subheader('Correlation with other assets (returns)')
-    other = st.multiselect('Compare with', options=[a for a in assets if a!=asset], default=assets[:2])
-    if other:
-        dfs = [df[['Date','Daily_Return']].rename(columns={'Daily_Return':asset})]
-        for o in other:
-            d = pd.read_csv(os.path.join(CLEAN_DIR, o + '_clean.csv'), parse_dates=['Date'])
-            dfs.append(d[['Date','Daily_Return']].rename(columns={'Daily_Return':o}))
-        merged = dfs[0]
-        for d in dfs[1:]:
-            merged = merged.merge(d, on='Date', how='inner')
-        corr = merged.set_index('Date').corr()
-        st.write(corr)
-        fig3 = px.imshow(corr, text_auto=True, title='Return Correlation Matrix')
-        st.plotly_chart(fig3, use_container_width=True)
+    # Charts are downsampled server-side to at most `points` points; narrowing the date range
+    # re-queries it, down to full resolution once the range holds fewer rows than that.
+    points = st.sidebar.slider('Chart points', 500, downsample.MAX_POINTS, 2000, step=500,
+                               help='Points per chart; about two per horizontal pixel is enough.')
+    with metrics.span('dashboard.load'):
+        dates = frames.tiers(asset, 'Close').levels[0][0]
+    start, end = None, None
+    if len(dates) > 1:
+        first, last = pd.Timestamp(dates[0]).to_pydatetime(), pd.Timestamp(dates[-1]).to_pydatetime()
+        start, end = st.sidebar.slider('Date range', min_value=first, max_value=last, value=(first, last),
+                                       format='YYYY-MM-DD', key=f'range-{asset}')
+    others = [a for a in assets if a != asset]
+    other = st.sidebar.multiselect('Compare with', options=others, default=others[:2],
+                                   help='Assets of the correlation matrix and the covariance table.')
+
+    live_on = st.sidebar.toggle('Live updates', value=os.environ.get('MARKET_LIVE') == '1',
+                                help='Refresh the KPI tiles from the store watcher / bar feed as they change.')
+
+    @st.fragment(run_every=LIVE_REFRESH if live_on else None)
+    def kpi_tiles(asset):
+        # Live: only this fragment reruns; it asks the shared service for the snapshot rows that
+        # changed since the version this session last drew.
+        if live_on:
+            service = live_service()
+            version, rows = service.changes(st.session_state.get('live_version', -1))
+            if rows is None:  # first draw, or too far behind: start from the full snapshot
+                st.session_state['live_rows'] = {}
+            else:
+                st.session_state.setdefault('live_rows', {}).update(rows)
+            st.session_state['live_version'] = version
+            snap = service.snapshot()
+            row = st.session_state['live_rows'].get(asset)
+            latest = pd.Series(row) if row is not None else snap.loc[asset] if asset in snap.index else None
+        else:
+            snap = frames.snapshot()
+            latest = snap.loc[asset] if asset in snap.index else None
+        if latest is None:
+            latest = pd.Series(snapshot.asset_row(asset))
+        st.subheader(f'{asset.upper()} — Latest price & KPIs')
+        c1, c2, c3 = st.columns(3)
+        c1.metric('Latest Close', f"{latest['Close']:.2f}")
+        c1.metric('Latest Daily Return (%)', f"{latest['Daily_Return']*100:.2f}")
+        c2.metric('20d MA', f"{latest['MA_20']:.2f}" if not pd.isna(latest['MA_20']) else 'n/a')
+        c2.metric('50d MA', f"{latest['MA_50']:.2f}" if not pd.isna(latest['MA_50']) else 'n/a')
+        vol30 = latest['Volatility_30']
+        c3.metric('30d Volatility (ann., %)', f"{vol30*(252**0.5)*100:.2f}" if not pd.isna(vol30) else 'n/a')
+        amihud = latest.get('Amihud', None)
+        c3.metric('Amihud illiquidity', f"{amihud:.3g}" if not pd.isna(amihud) else 'n/a')
+        if live_on:
+            st.caption(f"Live · version {st.session_state['live_version']} · last bar "
+                       f"{pd.Timestamp(latest['Date']):%Y-%m-%d %H:%M:%S}")
+            with st.expander('Live top movers'):
+                st.write(snapshot.top_movers(snap, 10))
+
+    kpi_tiles(asset)
+
+# Panels are lazy tabs: a run draws only the open one, so its data is loaded (and its charts
+# built) when it is shown rather than on every rerun of the page.
+panels = (['Prices', 'Correlation', 'Risk', 'Screener'] if assets else []) + (['Yield curves'] if curve_names else [])
+tabs = dict(zip(panels, st.tabs(panels, key='panel', on_change='rerun'))) if panels else {}
+
+if 'Prices' in tabs and tabs['Prices'].open:
+    with tabs['Prices']:
+        with metrics.span('dashboard.load'):
+            prices = frames.chart(asset, 'Close', start, end, points, method='lttb')
+            rets = frames.chart(asset, 'Daily_Return', start, end, points, method='minmax')  # keeps spikes
+        with metrics.span('dashboard.plot'):
+            st.plotly_chart(line_chart(prices, 'Date', ['Close'], f"{asset.upper()} Price"), width='stretch')
+
+        st.subheader('Returns & Volatility')
+        with metrics.span('dashboard.plot'):
+            st.plotly_chart(line_chart(rets, 'Date', ['Daily_Return'], 'Daily Returns'), width='stretch')
+
+if 'Correlation' in tabs and tabs['Correlation'].open:
+    with tabs['Correlation']:
+        st.subheader('Correlation with other assets (returns)')
+        if not other:
+            st.info('Choose assets to compare with in the sidebar.')
+        else:
+            with metrics.span('dashboard.merge'):
+                # live: the matrix with today's session returns from the store watcher / feed
+                rm = live_service().returns() if live_on else frames.returns()
+                missing = [a for a in [asset] + other if a not in rm]
+                corr = rm.correlation([a for a in [asset] + other if a in rm], method='sessions')
+            if missing:
+                st.info('No returns published yet for: ' + ', '.join(missing))
+            st.write(corr)
+            with metrics.span('dashboard.plot'):
+                fig3 = go.Figure(go.Heatmap(z=corr.to_numpy(), x=list(corr.columns), y=list(corr.index),
+                                            zmin=-1, zmax=1, texttemplate='%{z:.2f}'))
+                fig3.update_layout(title='Return Correlation Matrix', yaxis_autorange='reversed')
+                st.plotly_chart(fig3, width='stretch')
+
+# Risk: results of the last risk run (notebooks/06_risk_engine.py), read from the store
+if 'Risk' in tabs and tabs['Risk'].open:
+    with tabs['Risk']:
+        with metrics.span('dashboard.load'):
+            results = frames.risk()
+        if results is None or not len(results.var):
+            st.info('No risk results yet: run notebooks/06_risk_engine.py (or the pipeline).')
+        else:
+            st.subheader(f'Risk (trailing {results.window} dates, EWMA half-life {results.halflife:g})')
+            pct = lambda v: f'{v * 100:.2f}' if not pd.isna(v) else 'n/a'
+            c1, c2, c3, c4 = st.columns(4)
+            if asset in results.index:
+                beta = results.betas().loc[asset]
+                c1.metric(f'Beta to {results.benchmark} (rolling)', f"{beta['beta_rolling']:.2f}" if not pd.isna(beta['beta_rolling']) else 'n/a')
+                c2.metric(f'Beta to {results.benchmark} (EWMA)', f"{beta['beta_ewma']:.2f}" if not pd.isna(beta['beta_ewma']) else 'n/a')
+            latest_var = results.var.iloc[-1]
+            c3.metric('Portfolio VaR 95% / 99% (hist., %)', f"{pct(latest_var['hist_var_95'])} / {pct(latest_var['hist_var_99'])}")
+            c4.metric('Portfolio VaR 95% / 99% (EWMA, %)', f"{pct(latest_var['ewma_var_95'])} / {pct(latest_var['ewma_var_99'])}")
+            with metrics.span('dashboard.plot'):
+                var_history = results.var[['hist_var_95', 'hist_var_99']].dropna(how='all') * 100
+                st.plotly_chart(line_chart(var_history.reset_index(), 'Date', ['hist_var_95', 'hist_var_99'],
+                                           'Portfolio 1-day historical VaR (% of value)'), width='stretch')
+            selected = [a for a in [asset] + other if a in results.index]
+            if len(selected) > 1:
+                with st.expander('Covariance of the selected assets'):
+                    kind = st.radio('Estimator', ['rolling', 'ewma'], horizontal=True)
+                    st.write(results.covariance(selected, kind))
+
+# Screener: store-wide scans (market_analytics/query.py), cached until an asset changes
+if 'Screener' in tabs and tabs['Screener'].open:
+    with tabs['Screener']:
+        with metrics.span('dashboard.load'):
+            latest_day = frames.query(query.latest_date)
+        with st.form('screener'):
+            day = st.date_input('Date', value=latest_day)
+            conditions = []
+            for i in range(SCREEN_CONDITIONS):
+                c1, c2, c3 = st.columns(3)
+                column = c1.selectbox('Column', ['(none)'] + SCREEN_COLUMNS, key=f'screen-column-{i}')
+                op = c2.selectbox('Condition', ['>', '>=', '<', '<='], key=f'screen-op-{i}')
+                value = c3.number_input('Value', value=0.0, step=0.001, format='%.6g', key=f'screen-value-{i}')
+                if column != '(none)':
+                    conditions.append((column, op, value))
+            st.form_submit_button('Screen')
+        with metrics.span('dashboard.load'):
+            found = frames.query(query.screen, tuple(conditions), pd.Timestamp(day), tuple(SCREEN_COLUMNS))
+        st.caption(f'{len(found)} asset(s) on {pd.Timestamp(day):%Y-%m-%d}')
+        st.dataframe(found)
+        c1, c2 = st.columns(2)
+        since = c1.date_input('Worst drawdowns since', value=pd.Timestamp(latest_day.year, 1, 1))
+        worst = c2.slider('Assets shown', 5, 50, 20, step=5)
+        with metrics.span('dashboard.load'):
+            st.dataframe(frames.query(query.drawdowns, worst, pd.Timestamp(since)))
+
+if 'Yield curves' in tabs and tabs['Yield curves'].open:
+    with tabs['Yield curves']:
+        name = st.selectbox('Curve', options=curve_names)
+        with metrics.span('dashboard.load'):
+            curve = frames.curve(name)
+        shape = pd.DataFrame({'Maturity (years)': curve.tenors, 'Latest': curve.values[-1]})
+        # the curve a year (about 252 sessions) earlier, for comparison
+        if len(curve.dates) > 252:
+            shape['1y ago'] = curve.values[-253]
+        with metrics.span('dashboard.plot'):
+            st.plotly_chart(line_chart(shape, 'Maturity (years)', [c for c in shape if c != 'Maturity (years)'],
+                                       f"{name} curve on {pd.Timestamp(curve.dates[-1]):%Y-%m-%d} (%)", markers=True),
+                            width='stretch')
+        legs = list(curves.SLOPES) + list(curves.BUTTERFLIES)
+        latest_legs = curve.last().metrics().iloc[0]
+        for col, leg in zip(st.columns(len(legs)), legs):
+            col.metric(f'{leg} (bp)', f'{latest_legs[leg] * 100:.0f}' if not pd.isna(latest_legs[leg]) else 'n/a')
+        leg = st.selectbox('Slope / butterfly history', options=legs)
+        history = frames.curve_chart(name, leg, points=downsample.MAX_POINTS // 2)
+        with metrics.span('dashboard.plot'):
+            st.plotly_chart(line_chart(history, 'Date', [leg], f'{name} {leg} (percentage points)'),
+                            width='stretch')
 
 st.sidebar.markdown('---')
 if st.sidebar.button('Show top movers (latest day)'):
-    rows = []
-    for f in os.listdir('data/cleaned'):
-        if f.endswith('_clean.csv'):
-            d = pd.read_csv(os.path.join('data/cleaned', f), parse_dates=['Date'])
-            rows.append({'asset': f.replace('_clean.csv',''), 'return_pct': float(d['Daily_Return'].iloc[-1]*100)})
-    import pandas as pd
-    out = pd.DataFrame(rows).sort_values('return_pct', ascending=False)
-    st.write(out.head(20))
+    st.write(snapshot.top_movers(frames.snapshot(), 20))
+
+if metrics.enabled:
+    metrics.record('dashboard.run', time.perf_counter() - run_started)
@@ -0,0 +1 @@
+# Shared helpers used by the notebooks/ scripts and the Streamlit dashboard.
@@ -0,0 +1,4 @@
+# python -m market_analytics <command> [args]: see market_analytics/cli.py
+from market_analytics import cli
+
+cli.main()
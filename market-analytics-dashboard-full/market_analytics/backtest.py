@@ -0,0 +1,244 @@
+# Vectorized backtests of moving-average crossover signals over the whole cleaned universe at
+# once: every asset's Close and Spread on one date axis (assets x dates), and each parameter
+# combination evaluated with whole-array operations instead of a loop over assets.
+#
+#   u = backtest.load()                                     # from the data plane where current
+#   r = backtest.evaluate(u, fast=20, slow=100, vol_target=0.10)
+#   r.stats                                                 # per-asset P&L, Sharpe, drawdown...
+#   stats, summary = backtest.sweep(u, backtest.grid(fast=[10, 20], slow=[50, 100, 200]))
+#
+# The position held from one close to the next is sign(MA_fast - MA_slow) (long / flat with
+# long_only), optionally sized to vol_target annualized volatility from the trailing vol_window
+# returns (capped at max_leverage). A trade at a close costs its change in position times
+# cost_factor x Spread (the (High - Low) / Close proxy). P&L is additive, in units of capital.
+# Moving averages and volatilities are rolling sums over cumulative sums, so a window of any
+# length costs the same. Their windows count the sessions of each asset's market (the trading
+# calendar of market_analytics/calendars.py), as the stored MA_20 / Volatility_30 do: on the
+# other dates of the shared axis (other markets' sessions) an asset's close and position are
+# carried over, and they are left out of its windows and statistics.
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from market_analytics import calendars, metrics, parallel, plane, returns, store
+
+YEAR = 252
+COST_FACTOR = 0.5  # half the High-Low spread per unit traded: crossing half of a quoted spread
+MAX_LEVERAGE = 2.0
+VOL_WINDOW = 30
+STATS = ['days', 'pnl', 'ann_return', 'ann_vol', 'sharpe', 'max_drawdown', 'turnover', 'cost']
+_shared = None  # the universe a sweep's forked workers evaluate
+
+
+def _ffill(x):
+    # Carries each row's last non-NaN value forward (NaN before the first).
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return x[np.arange(x.shape[0])[:, None], idx]
+
+
+def _rolling_sum(csum, window):
+    # Sums over the trailing `window` dates from cumulative sums along axis 1.
+    out = csum.copy()
+    out[:, window:] -= csum[:, :-window]
+    return out
+
+
+class Universe:
+    def __init__(self, assets, dates, close, spread, markets=None):
+        # close / spread: assets x dates, NaN where an asset has no bar; markets: asset -> market
+        # (default: calendars.market_map()).
+        self.assets = list(assets)
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        close = np.asarray(close, dtype='float64')
+        self.calendar = calendars.build(returns.ReturnsMatrix(self.assets, self.dates, close), markets)
+        cal = self.calendar
+        code = np.array([cal.index[cal.market(a)] for a in self.assets], dtype='int64')
+        self.session = cal.sessions[code]
+        # per market: its assets' rows and its sessions' positions
+        self.groups = [(np.flatnonzero(code == m), np.flatnonzero(cal.sessions[m])) for m in np.unique(code)]
+        self.close = _ffill(close)
+        self.spread = np.nan_to_num(_ffill(np.asarray(spread, dtype='float64')))
+        self.listed = ~np.isnan(self.close)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.returns = np.full_like(self.close, np.nan)
+            self.returns[:, 1:] = self.close[:, 1:] / self.close[:, :-1] - 1
+        self._sums = {}
+
+    def _cumsum(self, name, g, x):
+        # Cumulative sums along the sessions of market group g of x() (computed once).
+        if (name, g) not in self._sums:
+            self._sums[name, g] = np.cumsum(x(), axis=1)
+        return self._sums[name, g]
+
+    def _by_session(self, compute):
+        # compute(g, cells) of each market group's assets on its sessions, put back on the whole
+        # axis (NaN on the dates the market had no session).
+        out = np.full(self.close.shape, np.nan)
+        for g, (rows, cols) in enumerate(self.groups):
+            cells = np.ix_(rows, cols)
+            out[cells] = compute(g, cells)
+        return out
+
+    def moving_average(self, window):
+        # NaN until an asset has `window` closes.
+        def compute(g, cells):
+            total = _rolling_sum(self._cumsum('close', g, lambda: np.nan_to_num(self.close[cells])), window)
+            count = _rolling_sum(self._cumsum('listed', g, lambda: self.listed[cells].astype('int32')), window)
+            with np.errstate(invalid='ignore'):
+                return np.where(count == window, total / window, np.nan)
+        return self._by_session(compute)
+
+    def volatility(self, window=VOL_WINDOW):
+        # Rolling sample standard deviation of the session-to-session returns; NaN until `window`
+        # returns. Kept, as every combination of a sweep sizes with the same one.
+        def compute(g, cells):
+            r = self.returns[cells]
+            seen = ~np.isnan(r)
+            r = np.where(seen, r, 0.0)
+            s1 = _rolling_sum(np.cumsum(r, axis=1), window)
+            s2 = _rolling_sum(np.cumsum(r * r, axis=1), window)
+            n = _rolling_sum(np.cumsum(seen, axis=1), window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = (s2 - s1 * s1 / window) / (window - 1)
+            return np.where(n == window, np.sqrt(np.maximum(var, 0.0)), np.nan)
+        if ('vol', window) not in self._sums:
+            self._sums['vol', window] = self._by_session(compute)
+        return self._sums['vol', window]
+
+
+def from_frames(frames, markets=None):
+    # Universe from {asset: DataFrame with Date, Close and Spread}.
+    dates = np.unique(np.concatenate([df['Date'].to_numpy('datetime64[ns]') for df in frames.values()])) \
+        if frames else np.array([], dtype='datetime64[ns]')
+    close = np.full((len(frames), len(dates)), np.nan)
+    spread = np.full_like(close, np.nan)
+    for i, df in enumerate(frames.values()):
+        pos = np.searchsorted(dates, df['Date'].to_numpy('datetime64[ns]'))
+        close[i, pos] = df['Close'].to_numpy('float64', na_value=np.nan)
+        spread[i, pos] = df['Spread'].to_numpy('float64', na_value=np.nan)
+    return Universe(list(frames), dates, close, spread, markets)
+
+
+@metrics.timed('backtest.load')
+def load(assets=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # The universe of the assets (default: every stored one), read from the data plane where it
+    # holds an asset as it is in the store, otherwise from the asset's files.
+    assets = store.list_assets(store_dir, clean_dir) if assets is None else list(assets)
+    shared = plane.attach(store_dir)
+    frames = {}
+    for a in assets:
+        if shared is not None and shared.current(a, store_dir, clean_dir):
+            frames[a] = shared.frame(a, ['Date', 'Close', 'Spread'])
+        else:
+            frames[a] = store.read_asset(a, ['Date', 'Close', 'Spread'], store_dir, clean_dir)
+    return from_frames(frames, calendars.market_map(store_dir))
+
+
+class Result:
+    # Daily arrays (assets x dates) of one parameter combination.
+    def __init__(self, universe, params, weights, net, turnover, costs):
+        self.universe, self.params = universe, params
+        self.weights, self.net, self.turnover, self.costs = weights, net, turnover, costs
+
+    def pnl(self):
+        # Dates x assets DataFrame of the daily net P&L.
+        u = self.universe
+        return pd.DataFrame(self.net.T, index=pd.DatetimeIndex(u.dates, name='Date'), columns=u.assets)
+
+    @property
+    def stats(self):
+        # Per-asset summary over its market's sessions since its first bar.
+        days = (self.universe.listed & self.universe.session).sum(axis=1)
+        return pd.DataFrame(_stats(self.net, days, self.turnover.sum(axis=1), self.costs.sum(axis=1)),
+                            index=pd.Index(self.universe.assets, name='asset'))
+
+    @property
+    def portfolio(self):
+        # The same summary for an equal-weight portfolio of the assets trading on each date.
+        listed = (self.universe.listed & self.universe.session).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            net = np.where(listed > 0, self.net.sum(axis=0) / listed, 0.0)[None, :]
+            turnover = (self.turnover.sum(axis=0) / np.maximum(listed, 1)).sum()
+            costs = (self.costs.sum(axis=0) / np.maximum(listed, 1)).sum()
+        stats = _stats(net, np.array([(listed > 0).sum()]), np.array([turnover]), np.array([costs]))
+        return {k: float(v[0]) for k, v in stats.items()}
+
+
+def _stats(net, days, turnover, costs):
+    years = np.maximum(days, 1) / YEAR
+    mean = net.sum(axis=1) / np.maximum(days, 1)
+    # net is 0 before an asset's first bar and off its sessions, so the squares only cover days
+    var = np.maximum((net * net).sum(axis=1) / np.maximum(days, 1) - mean * mean, 0.0) * days / np.maximum(days - 1, 1)
+    cum = np.cumsum(net, axis=1)
+    drawdown = (np.maximum.accumulate(np.maximum(cum, 0.0), axis=1) - cum).max(axis=1) if net.shape[1] else np.zeros(len(net))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sharpe = np.where(var > 0, mean / np.sqrt(var) * YEAR ** 0.5, np.nan)
+    return {'days': days, 'pnl': net.sum(axis=1), 'ann_return': mean * YEAR, 'ann_vol': np.sqrt(var * YEAR),
+            'sharpe': sharpe, 'max_drawdown': drawdown, 'turnover': turnover / years, 'cost': costs}
+
+
+def evaluate(universe, fast, slow, vol_target=None, vol_window=VOL_WINDOW, max_leverage=MAX_LEVERAGE,
+             long_only=False, cost_factor=COST_FACTOR):
+    u = universe
+    with np.errstate(invalid='ignore'):
+        signal = np.nan_to_num(np.sign(u.moving_average(fast) - u.moving_average(slow)))
+    if long_only:
+        signal = np.maximum(signal, 0.0)
+    if vol_target:
+        with np.errstate(divide='ignore'):
+            size = np.minimum(vol_target / (u.volatility(vol_window) * YEAR ** 0.5), max_leverage)
+        weights = np.nan_to_num(signal * size)  # no position until the volatility is known
+    else:
+        weights = signal
+    # positions change on the asset's sessions only: other markets' dates keep the last one
+    weights = np.nan_to_num(_ffill(np.where(u.session, weights, np.nan)))
+    held = np.zeros_like(weights)
+    held[:, 1:] = weights[:, :-1]  # the position from the previous close earns this date's return
+    turnover = np.abs(weights - held)
+    costs = turnover * u.spread * cost_factor
+    net = held * np.nan_to_num(u.returns) - costs
+    params = {'fast': fast, 'slow': slow, 'vol_target': vol_target, 'vol_window': vol_window,
+              'max_leverage': max_leverage, 'long_only': long_only, 'cost_factor': cost_factor}
+    return Result(u, params, weights, net, turnover, costs)
+
+
+def grid(fast, slow, **fixed):
+    # Every (fast, slow) pair with fast < slow, each with the fixed settings, e.g.
+    # grid(fast=range(5, 55, 5), slow=range(60, 260, 20), vol_target=0.1).
+    return [dict(fast=f, slow=s, **fixed) for f in fast for s in slow if f < s]
+
+
+def _evaluate_combo(params):
+    # Pool worker: one combination over the universe inherited from the parent.
+    result = evaluate(_shared, **params)
+    return result.stats, result.portfolio
+
+
+@metrics.timed('backtest.sweep')
+def sweep(universe, combos, workers=None):
+    # Evaluates every combination (grid()) over the process pool, whose forked workers share the
+    # universe's arrays with the parent. Returns (per-asset stats with the combination's settings
+    # as columns, one summary row per combination with its equal-weight portfolio's stats).
+    global _shared
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        workers = 1  # spawned workers would not have the universe
+    for window in {c.get('vol_window', VOL_WINDOW) for c in combos if c.get('vol_target')}:
+        universe.volatility(window)  # once here rather than in every worker
+    tasks = {i: (params,) for i, params in enumerate(combos)}
+    _shared = universe
+    try:
+        results, failures = parallel.run_parallel(_evaluate_combo, tasks, workers)
+    finally:
+        _shared = None
+    if failures:
+        i, err = next(iter(failures.items()))
+        raise RuntimeError(f'combination {combos[i]} failed: {err.splitlines()[0]}')
+    stats, summary = [], []
+    for i, (per_asset, portfolio) in results.items():
+        stats.append(per_asset.reset_index().assign(combo=i, **combos[i]))
+        summary.append(dict(combo=i, **combos[i], **portfolio))
+    columns = ['combo'] + list(combos[0]) if combos else ['combo']
+    stats = pd.concat(stats, ignore_index=True) if stats else pd.DataFrame(columns=columns + ['asset'] + STATS)
+    stats = stats[columns + ['asset'] + STATS]
+    return stats, pd.DataFrame(summary, columns=columns + STATS)
@@ -0,0 +1,155 @@
+# Local load balancer in front of several dashboard server processes (notebooks/
+# serve_dashboard.py): an asyncio TCP proxy, so plain HTTP and the dashboard's websocket pass
+# through unchanged. A browser sticks to one worker through a cookie set on its first response,
+# so its page, websocket and reconnects all reach the process that holds its session; a browser
+# without one goes to the worker with the fewest open connections. A worker that refuses a
+# connection is skipped for RETRY_SECONDS.
+#
+# With a feed port it also fans the live feed out: every line sent to it (the MARKET_FEED_PORT
+# protocol of market_analytics/live.py) is copied to each worker's own feed port, so the live
+# tiles of every worker see every bar.
+import asyncio
+import re
+import time
+
+from market_analytics import metrics
+
+COOKIE = 'market_worker'
+RETRY_SECONDS = 5.0
+CHUNK = 64 * 1024
+_COOKIE_RE = re.compile(rb'(?im)^cookie:.*\b' + COOKIE.encode() + rb'=(\d+)')
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class Balancer:
+    def __init__(self, backends, host='127.0.0.1', port=8501, feed_port=None, feed_backends=()):
+        self.backends = list(backends)  # [(host, port)]
+        self.host, self.port = host, port
+        self.feed_port, self.feed_backends = feed_port, list(feed_backends)
+        self.open = [0] * len(self.backends)  # open connections per backend
+        self.down = [0.0] * len(self.backends)  # time.monotonic() until which a backend is skipped
+        self.stats = {'connections': 0, 'sticky': 0, 'refused': 0, 'feed_lines': 0}
+        metrics.register('balancer', lambda: {**self.stats, 'open': list(self.open)})
+
+    def pick(self, preferred=None, tried=()):
+        # The sticky backend if it is up, else the least loaded one that is up (any untried one
+        # when all are down); None when every backend was tried.
+        now = time.monotonic()
+        untried = [i for i in range(len(self.backends)) if i not in tried]
+        up = [i for i in untried if self.down[i] <= now] or untried
+        if not up:
+            return None
+        if preferred in up:
+            return preferred
+        return min(up, key=lambda i: self.open[i])
+
+    async def _connect(self, preferred):
+        tried = set()
+        while True:
+            i = self.pick(preferred, tried)
+            if i is None:
+                return None, None, None
+            try:
+                return (i,) + await asyncio.open_connection(*self.backends[i])
+            except OSError:
+                self.stats['refused'] += 1
+                self.down[i] = time.monotonic() + RETRY_SECONDS
+                tried.add(i)
+
+    async def _respond(self, reader, writer, worker):
+        # Copies the backend's responses to the client, adding the cookie to the first one.
+        if worker is not None:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                writer.close()
+                return
+            cookie = f'Set-Cookie: {COOKIE}={worker}; Path=/; SameSite=Lax\r\n'.encode()
+            writer.write(head[:-2] + cookie + b'\r\n')
+        await _pipe(reader, writer)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        match = _COOKIE_RE.search(head)
+        preferred = int(match.group(1)) if match else None
+        i, up_reader, up_writer = await self._connect(preferred)
+        if i is None:
+            writer.write(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+        self.stats['connections'] += 1
+        self.stats['sticky'] += i == preferred
+        self.open[i] += 1
+        try:
+            up_writer.write(head)
+            await asyncio.gather(_pipe(reader, up_writer),
+                                 self._respond(up_reader, writer, None if i == preferred else i))
+        finally:
+            self.open[i] -= 1
+
+    async def fanout(self, reader, writer):
+        # One feed connection: its lines are copied to every worker's feed port. A worker whose
+        # live service is not running yet is connected to again RETRY_SECONDS later.
+        targets = {address: None for address in self.feed_backends}  # address -> writer
+        retry = {address: 0.0 for address in self.feed_backends}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats['feed_lines'] += 1
+                now = time.monotonic()
+                for address, target in targets.items():
+                    if target is None and retry[address] <= now:
+                        try:
+                            targets[address] = (await asyncio.open_connection(*address))[1]
+                        except OSError:
+                            self.stats['refused'] += 1
+                            retry[address] = now + RETRY_SECONDS
+                for address, target in targets.items():
+                    if target is None:
+                        continue
+                    try:
+                        target.write(line)
+                        await target.drain()
+                    except ConnectionError:
+                        targets[address] = None
+                        retry[address] = now + RETRY_SECONDS
+        finally:
+            for target in targets.values():
+                if target is not None:
+                    target.close()
+            writer.close()
+
+    async def serve(self, ready=None):
+        servers = [await asyncio.start_server(self.handle, self.host, self.port)]
+        self.port = servers[0].sockets[0].getsockname()[1]  # the actual port when 0 was asked for
+        if self.feed_port:
+            servers.append(await asyncio.start_server(self.fanout, self.host, self.feed_port))
+        if ready is not None:
+            ready()
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+
+    def run(self, ready=None):
+        # Serves until interrupted.
+        try:
+            asyncio.run(self.serve(ready))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,255 @@
+# In-process LRU cache for frames read from the store, keyed on (asset, columns) and
+# invalidated by the files' mtimes, with a memory budget (MARKET_CACHE_MB, default 512). It also
+# holds each charted column's downsampling tiers and the downsampled views drawn from them,
+# stored yield curves with their slope / butterfly history, the published risk results and the
+# results of store-wide queries (market_analytics/query.py).
+#
+# Once the data plane is published (market_analytics/plane.py), assets whose store files are
+# unchanged since are read from it: their frames and chart tiers are views of the shared mapped
+# arrays, which count against no process's budget.
+#
+# Cached frames are shared between callers (and, in the dashboard, between sessions), so treat
+# them as read-only: copy before adding or modifying columns. With metrics enabled, loads on a
+# miss are timed as cache.load.<kind> spans; register stats() with metrics for hit rates.
+#
+# Concurrent misses on one key load it once: the other callers wait for that load and share its
+# result, so warm() can prefetch in a background thread what a session is about to ask for.
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from market_analytics import curves, downsample, metrics, plane, query, returns, risk, snapshot, store
+
+DEFAULT_BUDGET_MB = int(os.environ.get('MARKET_CACHE_MB', 512))
+_MISS = object()
+
+
+def _mapped(a):
+    # True for a view of a memory-mapped file
+    while a is not None:
+        if isinstance(a, np.memmap):
+            return True
+        a = getattr(a, 'base', None)
+    return False
+
+
+def sizeof(obj):
+    if isinstance(obj, pd.DataFrame):
+        usage = obj.memory_usage(deep=True)
+        return int(sum(n for c, n in usage.items() if c == 'Index' or not _mapped(obj[c].values)))
+    if isinstance(obj, downsample.Tiers):
+        return int(sum(x.nbytes + y.nbytes for x, y in obj.levels if not _mapped(y)))
+    values = getattr(obj, 'values', None)
+    # memory-mapped arrays live in the page cache, not in this process's budget
+    if values is not None and not hasattr(values, 'filename'):
+        return int(getattr(values, 'nbytes', 0))
+    return int(getattr(obj, 'nbytes', 0))
+
+
+class FrameCache:
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.entries = OrderedDict()  # key -> (signature, value, nbytes)
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # key -> lock held while that key is being loaded
+        self.warming = None
+
+    def get(self, key, signature, loader):
+        # Returns the cached value for key if it was loaded with the same signature, else
+        # calls loader() and caches its result (unless it alone exceeds the budget).
+        with self.lock:
+            value = self._hit(key, signature)
+            if value is not _MISS:
+                return value
+            loading = self.loading.setdefault(key, threading.Lock())
+        with loading:
+            try:
+                with self.lock:
+                    value = self._hit(key, signature)  # loaded while this caller waited
+                    if value is not _MISS:
+                        return value
+                    self.misses += 1
+                with metrics.span(f'cache.load.{key[0]}'):
+                    value = loader()
+                self._put(key, signature, value)
+            finally:
+                with self.lock:
+                    self.loading.pop(key, None)
+        return value
+
+    def _hit(self, key, signature):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != signature:
+            return _MISS
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def _put(self, key, signature, value):
+        size = sizeof(value)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            if size <= self.budget:
+                self.entries[key] = (signature, value, size)
+                self.nbytes += size
+                while self.nbytes > self.budget:
+                    _, (_, _, evicted) = self.entries.popitem(last=False)
+                    self.nbytes -= evicted
+                    self.evictions += 1
+
+    def assets(self, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # store.list_assets(), listed again only when an asset is added to or removed from the
+        # store or data/cleaned/ (which changes the directory's mtime).
+        signature = tuple(os.stat(d).st_mtime_ns if os.path.isdir(d) else None for d in (store_dir, clean_dir))
+        return self.get(('assets', store_dir, clean_dir), signature, lambda: store.list_assets(store_dir, clean_dir))
+
+    def plane(self, store_dir=store.STORE_DIR):
+        # The published data plane (market_analytics.plane), attached again whenever a new
+        # version is published; None before the first.
+        return self.get(('plane', store_dir), plane.signature(store_dir), lambda: plane.attach(store_dir))
+
+    def _source(self, asset, columns, store_dir, clean_dir):
+        # (signature, plane) for reading the columns of an asset: the plane if it holds them as
+        # they are in the store, else None (read the files).
+        signature = store.signature(asset, store_dir, clean_dir)
+        shared = self.plane(store_dir)
+        if (shared is not None and asset in shared and all(c in shared.arrays for c in columns)
+                and shared.signatures[asset] == [list(s) for s in signature]):
+            return ('plane', shared.version), shared
+        return signature, None
+
+    def read_asset(self, asset, columns=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        key = ('asset', store_dir, clean_dir, asset, tuple(columns) if columns else None)
+        if columns:
+            signature, shared = self._source(asset, columns, store_dir, clean_dir)
+        else:  # every stored column, in its own dtype
+            signature, shared = store.signature(asset, store_dir, clean_dir), None
+        if shared is not None:
+            return self.get(key, signature, lambda: shared.frame(asset, columns))
+        return self.get(key, signature, lambda: store.read_asset(asset, columns, store_dir, clean_dir))
+
+    def tiers(self, asset, column, method='lttb', store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # Downsampling tiers (market_analytics.downsample.Tiers) of one column of an asset.
+        signature, shared = self._source(asset, ['Date', column], store_dir, clean_dir)
+
+        def load():
+            if shared is not None:
+                return downsample.Tiers(shared.column(asset, 'Date'), shared.column(asset, column), method=method)
+            df = store.read_asset(asset, ['Date', column], store_dir, clean_dir)
+            return downsample.Tiers(df['Date'], df[column], method=method)
+        return self.get(('tiers', store_dir, clean_dir, asset, column, method), signature, load)
+
+    def chart(self, asset, column, start=None, end=None, points=downsample.MAX_POINTS, method='lttb',
+              store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # Date/column frame of at most `points` rows covering [start, end], for plotting.
+        key = ('chart', store_dir, clean_dir, asset, column, method, start, end, points)
+        tiers = lambda: self.tiers(asset, column, method, store_dir, clean_dir)
+        return self.get(key, self._source(asset, ['Date', column], store_dir, clean_dir)[0],
+                        lambda: tiers().frame(column, start, end, points))
+
+    def curve(self, name, store_dir=store.STORE_DIR):
+        return self.get(('curve', store_dir, name), curves.signature(name, store_dir),
+                        lambda: curves.load(name, store_dir))
+
+    def curve_chart(self, name, column, start=None, end=None, points=downsample.MAX_POINTS, store_dir=store.STORE_DIR):
+        # Downsampled history of one curve metric (a slope or butterfly, see curves.metrics).
+        signature = curves.signature(name, store_dir)
+
+        def tiers():
+            metrics = self.get(('curve_metrics', store_dir, name), signature,
+                               lambda: self.curve(name, store_dir).metrics())
+            return self.get(('curve_tiers', store_dir, name, column), signature,
+                            lambda: downsample.Tiers(metrics['Date'], metrics[column], method='lttb'))
+        return self.get(('curve_chart', store_dir, name, column, start, end, points), signature,
+                        lambda: tiers().frame(column, start, end, points))
+
+    def returns(self, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # The returns matrix; when it is built in memory from the store it is rebuilt whenever any
+        # asset changes, otherwise only when a new version is published.
+        signature = returns.signature(store_dir)
+        if signature is None:
+            signature = tuple(store.signature(a, store_dir, clean_dir) for a in store.list_assets(store_dir, clean_dir))
+        return self.get(('returns', store_dir, clean_dir), signature, lambda: returns.get(store_dir, clean_dir))
+
+    def snapshot(self, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # The latest-snapshot table, invalidated like returns(). Taken from the plane if it was
+        # published after the snapshot was last written.
+        signature = snapshot.signature(store_dir)
+        shared = self.plane(store_dir)
+        if signature is not None and shared is not None and shared.snapshot_signature == list(signature):
+            return self.get(('snapshot', store_dir, clean_dir), ('plane', shared.version), shared.snapshot)
+        if signature is None:
+            signature = tuple(store.signature(a, store_dir, clean_dir) for a in store.list_assets(store_dir, clean_dir))
+        return self.get(('snapshot', store_dir, clean_dir), signature, lambda: snapshot.get(store_dir, clean_dir))
+
+    def risk(self, store_dir=store.STORE_DIR):
+        # The published risk results (market_analytics.risk), or None before the first risk run.
+        return self.get(('risk', store_dir), risk.signature(store_dir), lambda: risk.load(store_dir))
+
+    def query(self, func, *args, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # Result of a market_analytics.query function, e.g. frames.query(query.screen, where, date),
+        # until any asset changes; args must be hashable (filters as tuples). The queries share one
+        # dataset per store version, which keeps the Parquet footers read by earlier queries.
+        signature = query.signature(store_dir, clean_dir)
+        data = lambda: self.get(('dataset', store_dir, clean_dir), signature,
+                                lambda: query.dataset(store_dir, clean_dir))
+        return self.get(('query', store_dir, clean_dir, func.__name__, args), signature,
+                        lambda: func(*args, data=data(), store_dir=store_dir, clean_dir=clean_dir))
+
+    def warm(self, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # Loads the store-wide data in a background (daemon) thread: the plane, the snapshot, the
+        # returns matrix, the risk results, every yield curve and the query dataset with its
+        # Parquet footers. A failed load is only counted (cache_warm_errors); it is raised again by the
+        # request that needs it. Returns the thread, the running one if a warm-up is under way.
+        if self.warming is not None and self.warming.is_alive():
+            return self.warming
+        loads = [lambda: self.plane(store_dir), lambda: self.snapshot(store_dir, clean_dir),
+                 lambda: self.returns(store_dir, clean_dir), lambda: self.risk(store_dir),
+                 lambda: [self.curve(name, store_dir) for name in curves.list_curves(store_dir)],
+                 lambda: self.query(query.latest_date, store_dir=store_dir, clean_dir=clean_dir)]
+
+        def run():
+            with metrics.span('cache.warm'):
+                for load in loads:
+                    try:
+                        load()
+                    except Exception:
+                        metrics.count('cache_warm_errors')
+        self.warming = threading.Thread(target=run, name='frame-cache-warm', daemon=True)
+        self.warming.start()
+        return self.warming
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'entries': len(self.entries), 'bytes': self.nbytes, 'budget': self.budget,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = FrameCache()
+            metrics.register('default_cache', _default.stats)
+    return _default
+
+
+def read_asset(asset, columns=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    return default_cache().read_asset(asset, columns, store_dir, clean_dir)
@@ -0,0 +1,119 @@
+# Trading calendars on the returns matrix's date axis (market_analytics/returns.py): one boolean
+# row per market saying which dates of the shared axis it had a session on. Per-asset arrays on
+# that axis are then aligned across markets by integer date positions (a forward-fill is a
+# gather through last_session(), a join of two markets a mask of their common sessions)
+# instead of merges on Date columns.
+#
+# A market's sessions are the dates on which any of its assets has a return. Assets map to
+# markets through MARKETS (the bundled universe, by exchange MIC) updated with
+# data/store/markets.json ({asset: market}); any other asset is in DEFAULT_MARKET. The calendar
+# of a published returns matrix is written into the same version directory:
+#
+#   data/store/returns/v<n>/sessions.npy     bool, markets x dates
+#   data/store/returns/v<n>/calendar.json    market order and asset -> market
+import json
+import os
+import numpy as np
+
+from market_analytics import store
+
+MARKETS_FILE = 'markets.json'
+DEFAULT_MARKET = 'XNYS'
+MARKETS = {
+    'aapl': 'XNYS', 'msft': 'XNYS',
+    'infy': 'XNSE', 'tcs': 'XNSE', 'nifty': 'XNSE',
+    'eurusd': 'FX', 'gbpusd': 'FX', 'usdjpy': 'FX', 'usdinr': 'FX',
+    'gold': 'CME', 'silver': 'CME', 'crude': 'CME', 'natgas': 'CME',
+}
+ROWS_PER_PASS = 1024  # matrix rows scanned at a time when deriving sessions
+
+
+def market_map(store_dir=store.STORE_DIR):
+    markets = dict(MARKETS)
+    path = os.path.join(store_dir, MARKETS_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            markets.update({a.lower(): m for a, m in json.load(f).items()})
+    return markets
+
+
+class Calendar:
+    def __init__(self, dates, markets, sessions, assets):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.markets = list(markets)
+        self.sessions = np.asarray(sessions, dtype=bool)
+        self.assets = dict(assets)  # asset -> market
+        self.index = {m: i for i, m in enumerate(self.markets)}
+        self._counts = None
+
+    def market(self, asset):
+        return self.assets.get(asset, DEFAULT_MARKET)
+
+    def position(self, dates):
+        # Integer positions of dates on the axis, -1 for dates that are not on it.
+        dates = np.atleast_1d(np.asarray(dates, dtype='datetime64[ns]'))
+        pos = np.searchsorted(self.dates, dates)
+        found = pos < len(self.dates)
+        found[found] = self.dates[pos[found]] == dates[found]
+        return np.where(found, pos, -1)
+
+    def open(self, markets, how='all'):
+        # Positions of the dates on which all (how='all') or any (how='any') of the markets traded.
+        rows = self.sessions[[self.index[m] for m in dict.fromkeys(markets) if m in self.index]]
+        if not len(rows):
+            return np.array([], dtype='int64')
+        return np.flatnonzero(rows.all(axis=0) if how == 'all' else rows.any(axis=0))
+
+    def counts(self):
+        # Running count of each market's sessions up to and including every position, so
+        # counts()[m, j] - counts()[m, i] is how many sessions market m had in (i, j].
+        if self._counts is None:
+            self._counts = np.cumsum(self.sessions, axis=1, dtype='int32')
+        return self._counts
+
+    def last_session(self, market):
+        # For every position, the market's last session at or before it (-1 before its first):
+        # the index that forward-fills a value of that market over the dates it was closed.
+        if market not in self.index:
+            return np.full(len(self.dates), -1)
+        row = self.sessions[self.index[market]]
+        return np.maximum.accumulate(np.where(row, np.arange(len(row)), -1))
+
+    def fill(self, values, market):
+        # values (..., dates) with each date the market was closed taking its last session's
+        # value; a missing value on a session stays missing.
+        last = self.last_session(market)
+        out = np.take(np.asarray(values, dtype='float64'), np.maximum(last, 0), axis=-1)
+        out[..., last < 0] = np.nan
+        return out
+
+
+def build(rm, markets=None):
+    # Calendar of a returns matrix; markets maps assets to markets (default: market_map()).
+    markets = market_map() if markets is None else markets
+    assets = {a: markets.get(a, DEFAULT_MARKET) for a in rm.assets}
+    names = sorted(set(assets.values()))
+    code = np.array([names.index(assets[a]) for a in rm.assets], dtype='int64')
+    sessions = np.zeros((len(names), len(rm.dates)), dtype=bool)
+    for lo in range(0, len(rm.assets), ROWS_PER_PASS):
+        traded = ~np.isnan(np.asarray(rm.values[lo:lo + ROWS_PER_PASS]))
+        rows = code[lo:lo + ROWS_PER_PASS]
+        for m in np.unique(rows):
+            sessions[m] |= traded[rows == m].any(axis=0)
+    return Calendar(rm.dates, names, sessions, assets)
+
+
+def save(cal, vdir):
+    np.save(os.path.join(vdir, 'sessions.npy'), cal.sessions)
+    with open(os.path.join(vdir, 'calendar.json'), 'w') as f:
+        json.dump({'markets': cal.markets, 'assets': cal.assets}, f)
+
+
+def load(vdir, dates):
+    # The calendar saved in a returns version directory, or None for versions written without one.
+    path = os.path.join(vdir, 'calendar.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        meta = json.load(f)
+    return Calendar(dates, meta['markets'], np.load(os.path.join(vdir, 'sessions.npy')), meta['assets'])
@@ -0,0 +1,76 @@
+# One command line for the notebooks/ scripts and the dashboard, run from the project root:
+#
+#   python -m market_analytics pipeline --collect all --synthetic
+#   python -m market_analytics clean --incremental
+#   python -m market_analytics backtest --fast 5:55:5 --slow 60:260:20 --vol-target 0.1
+#   python -m market_analytics dashboard --server.port 8502
+#   python -m market_analytics serve --workers 4
+#
+# Each command runs its script as __main__ with the remaining arguments, so options and --help
+# stay with the script. Only the standard library is imported here: listing the commands costs
+# the interpreter's start-up, and a command pays for just the libraries its script imports.
+import argparse
+import os
+import runpy
+import sys
+import threading
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTEBOOKS_DIR = os.path.join(PROJECT_DIR, 'notebooks')
+DASHBOARD = os.path.join(PROJECT_DIR, 'dashboard', 'streamlit_app.py')
+
+# command -> (script in notebooks/, summary)
+COMMANDS = {
+    'collect': ('01_data_collection', 'fetch prices and yield curves into data/<asset class>'),
+    'clean': ('02_data_cleaning', 'clean raw CSVs into the store, publish returns and the snapshot'),
+    'kpis': ('03_kpi_calculations', 'write the latest KPI tables to analytics/'),
+    'charts': ('04_visualizations', 'plot a price history and a return correlation heatmap'),
+    'summary': ('05_daily_market_summary', 'print the top movers of the latest day'),
+    'risk': ('06_risk_engine', 'update covariances, betas and portfolio VaR'),
+    'backtest': ('07_backtest', 'backtest moving-average crossovers over the whole store'),
+    'pipeline': ('run_pipeline', 'run the stages that changed as one DAG'),
+    'replay': ('replay_feed', 'replay synthetic intraday bars into the live feed'),
+    'dashboard': (None, 'start the Streamlit dashboard (arguments go to streamlit run)'),
+    'serve': ('serve_dashboard', 'serve the dashboard from several processes behind a load balancer'),
+}
+
+
+def run_script(command, args):
+    path = os.path.join(NOTEBOOKS_DIR, COMMANDS[command][0] + '.py')
+    sys.argv = [path] + list(args)
+    runpy.run_path(path, run_name='__main__')
+
+
+def preload():
+    # What the dashboard's first run would otherwise wait for: its imports and the store-wide
+    # data, loaded into the process-wide cache it uses (cache.default_cache()).
+    import plotly.graph_objects as go
+    from market_analytics import cache
+    cache.default_cache().warm()
+    go.Figure([go.Scatter(), go.Heatmap()])  # the first figure with a trace type builds its validators
+
+
+def run_dashboard(args):
+    # The server runs in this process, which meanwhile preloads in the background: a session
+    # opened once the server is up finds the libraries imported and the caches warm.
+    # streamlit (which imports plotly) is imported first: plotly would otherwise find pandas half
+    # imported by the other thread
+    from streamlit.web import cli as streamlit_cli
+    threading.Thread(target=preload, name='dashboard-preload', daemon=True).start()
+    sys.argv = ['streamlit', 'run', DASHBOARD] + list(args)
+    sys.exit(streamlit_cli.main())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(
+        prog='python -m market_analytics', formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='Market analytics pipeline and dashboard.',
+        epilog='commands:\n' + '\n'.join(f'  {c:<11} {help}' for c, (_, help) in COMMANDS.items())
+        + "\n\nRun 'python -m market_analytics <command> --help' for a command's options.")
+    parser.add_argument('command', choices=COMMANDS, metavar='command')
+    args = parser.parse_args(argv[:1])
+    if args.command == 'dashboard':
+        run_dashboard(argv[1:])
+    else:
+        run_script(args.command, argv[1:])
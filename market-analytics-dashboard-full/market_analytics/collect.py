@@ -0,0 +1,273 @@
+# Bulk price collection: concurrent fetches under a global rate limit, retries with backoff,
+# incremental fetches from each asset's last stored date, and a checkpoint so an interrupted
+# run resumes with the symbols it has not finished yet (on the same day; a run that gets through
+# every symbol leaves only its failures in it, and the next run fetches every symbol again).
+#
+# Sources only need a fetch(symbol, start, end, interval) method returning a DataFrame with a
+# Date column plus OHLCV columns (or, for yield curves, one column per tenor); LocalFileSource
+# and the synthetic sources let tests and offline runs skip the network.
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from market_analytics import curves, metrics
+
+RAW_DIR = 'data/equities'
+CHECKPOINT = '_checkpoint.json'
+
+
+class YFinanceSource:
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        import yfinance as yf  # imported lazily: slow to import and not needed by other sources
+        df = yf.download(symbol, start=start, end=end, interval=interval, progress=False, auto_adjust=False)
+        if isinstance(df.columns, pd.MultiIndex):
+            df.columns = df.columns.get_level_values(0)
+        df = df.reset_index()
+        return df.rename(columns={'Datetime': 'Date'})
+
+
+class FredCurveSource:
+    # Yield curves from FRED: fetch(curve) joins the series of each tenor of curves[curve]
+    # ({tenor: series id}) into one frame with a Date column and one column per tenor.
+    def __init__(self, curves, api_key=None):
+        self.curves = curves
+        self.api_key = api_key or os.environ.get('FRED_API_KEY')
+
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        from fredapi import Fred  # imported lazily like yfinance
+        fred = Fred(api_key=self.api_key)
+        cols = {tenor: fred.get_series(series, observation_start=start, observation_end=end)
+                for tenor, series in self.curves[symbol].items()}
+        df = pd.DataFrame(cols)
+        df.index.name = 'Date'
+        return df.reset_index()
+
+
+class LocalFileSource:
+    # Serves <directory>/<symbol>.csv (symbol lower-cased, '^', '.' and '=' replaced by '_').
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, symbol):
+        name = symbol.lower().replace('^', '_').replace('.', '_').replace('=', '_')
+        return os.path.join(self.directory, f'{name}.csv')
+
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        df = pd.read_csv(self.path(symbol), parse_dates=['Date'])
+        if start is not None:
+            df = df[df['Date'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['Date'] < pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+
+class SyntheticSource:
+    # Deterministic daily OHLCV random walks for any symbol (seeded by the symbol's name), from
+    # `origin` up to `end` (exclusive), so repeated and incremental fetches agree.
+    def __init__(self, seed=0, origin='2015-01-01'):
+        self.seed, self.origin = seed, origin
+
+    def dates(self, end=None):
+        last = pd.Timestamp(end) - pd.Timedelta(days=1) if end is not None else pd.Timestamp.today().normalize()
+        return pd.bdate_range(self.origin, last)
+
+    def rng(self, symbol):
+        return np.random.default_rng([self.seed, zlib.crc32(symbol.encode())])
+
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        if interval != '1d':
+            raise ValueError('synthetic sources only generate daily bars')
+        dates = self.dates(end)
+        rng = self.rng(symbol)
+        n = len(dates)
+        close = rng.uniform(1, 1000) * np.cumprod(1 + rng.normal(0, 0.01, n))
+        df = pd.DataFrame({
+            'Date': dates,
+            'Open': close * (1 + rng.normal(0, 0.002, n)),
+            'High': close * (1 + np.abs(rng.normal(0, 0.006, n))),
+            'Low': close * (1 - np.abs(rng.normal(0, 0.006, n))),
+            'Close': close,
+            'Adj Close': close,
+            'Volume': rng.integers(1_000_000, 5_000_000, n),
+        })
+        return df[df['Date'] >= pd.Timestamp(start)].reset_index(drop=True) if start is not None else df
+
+
+class SyntheticCurveSource(SyntheticSource):
+    # Yield curves for the tenors of curves[curve] from Nelson-Siegel level / slope / curvature
+    # factors that follow random walks (yields in percent).
+    def __init__(self, curves, seed=0, origin='2015-01-01'):
+        super().__init__(seed, origin)
+        self.curves = curves
+
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        if interval != '1d':
+            raise ValueError('synthetic sources only generate daily bars')
+        dates = self.dates(end)
+        rng = self.rng(symbol)
+        n = len(dates)
+        level = 3 + np.cumsum(rng.normal(0, 0.03, n))
+        slope = -1 + np.cumsum(rng.normal(0, 0.03, n))
+        curvature = np.cumsum(rng.normal(0, 0.05, n))
+        labels = list(self.curves[symbol])
+        x = np.array([curves.tenor_years(t) for t in labels]) / 2.0  # decay parameter lambda = 2 years
+        load = (1 - np.exp(-x)) / x
+        yields = level[:, None] + slope[:, None] * load + curvature[:, None] * (load - np.exp(-x))
+        df = pd.DataFrame(np.round(yields, 4), columns=labels)
+        df.insert(0, 'Date', dates)
+        return df[df['Date'] >= pd.Timestamp(start)].reset_index(drop=True) if start is not None else df
+
+
+class RateLimiter:
+    # Token bucket shared by all fetch threads: at most `rate` calls per second, bursts of `burst`.
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def with_retry(call, retries=3, backoff=1.0, limiter=None):
+    # Exponential backoff with jitter: backoff, 2*backoff, 4*backoff, ... seconds between tries.
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return call()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (0.5 + random.random() / 2))
+
+
+def last_stored_date(path):
+    # Reads only the end of the CSV to find the last Date (first column of the last row).
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = [l for l in f.read().splitlines() if l.strip()]
+    if not lines:
+        return None
+    try:
+        return pd.Timestamp(lines[-1].split(b',', 1)[0].decode())
+    except ValueError:
+        return None  # header only
+
+
+def append_bars(df, path):
+    # Appends to an existing raw CSV using its header's column order, or creates it.
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path) as f:
+            header = f.readline().strip().split(',')
+        df.reindex(columns=header).to_csv(path, mode='a', header=False, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+class Checkpoint:
+    # Remembers which names an unfinished run has fetched. Once a run gets through every name it
+    # keeps only the ones that failed, for the record: the next run starts over.
+    def __init__(self, path, run_key):
+        self.path = path
+        self.lock = threading.Lock()
+        state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+        same = state.get('run') == run_key
+        self.done = set(state.get('done', [])) if same else set()
+        self.failed = set(state.get('failed', [])) if same else set()
+        self.run_key = run_key
+
+    def _write(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'run': self.run_key, 'done': sorted(self.done), 'failed': sorted(self.failed)}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def mark(self, name):
+        with self.lock:
+            self.done.add(name)
+            self._write()
+
+    def finish(self, failures):
+        # The run went through every name: forget the finished ones and keep the failed.
+        with self.lock:
+            self.done, self.failed = set(), set(failures)
+            if self.failed:
+                self._write()
+            else:
+                self.clear()
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@metrics.timed('fetch_one')
+def fetch_one(source, name, symbol, start, end, interval, out_dir, limiter, retries, backoff):
+    path = os.path.join(out_dir, f'{name.lower()}.csv')
+    last = last_stored_date(path)
+    # Refetch from the last stored bar (inclusive) so nothing is missed, then drop what we have.
+    df = with_retry(lambda: source.fetch(symbol, start=last if last is not None else start,
+                                         end=end, interval=interval),
+                    retries=retries, backoff=backoff, limiter=limiter)
+    if df is None or df.empty:
+        return 0
+    df['Date'] = pd.to_datetime(df['Date'])
+    if last is not None:
+        df = df[df['Date'] > last]
+    if not df.empty:
+        append_bars(df, path)
+    metrics.count('rows_fetched', len(df))
+    return len(df)
+
+
+def collect(equities, start='2020-01-01', end=None, interval='1d', source=None, out_dir=RAW_DIR,
+            workers=8, rate=2.0, burst=4, retries=3, backoff=1.0, resume=True):
+    # Fetches every name -> symbol in equities. Returns (rows_appended, failures) keyed by name.
+    source = source or YFinanceSource()
+    os.makedirs(out_dir, exist_ok=True)
+    limiter = RateLimiter(rate, burst) if rate else None
+    # an open-ended run fetches up to today: one left unfinished yesterday is not resumed
+    run_key = f'{start}|{end or pd.Timestamp.today().date()}|{interval}'
+    checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT), run_key)
+    if not resume:
+        checkpoint.done.clear()
+    pending = {n: s for n, s in equities.items() if n not in checkpoint.done}
+    rows, failures = {}, {}
+
+    def run(item):
+        name, symbol = item
+        try:
+            rows[name] = fetch_one(source, name, symbol, start, end, interval, out_dir, limiter, retries, backoff)
+            checkpoint.mark(name)
+            print(f'Fetched {name} ({symbol}): {rows[name]} new rows')
+        except Exception as e:
+            failures[name] = f'{type(e).__name__}: {e}'
+            print(f'Warning: failed to fetch {name} ({symbol}): {failures[name]}')
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(run, pending.items()))
+    checkpoint.finish(failures)
+    return dict(sorted(rows.items())), dict(sorted(failures.items()))
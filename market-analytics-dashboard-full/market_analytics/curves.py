@@ -0,0 +1,214 @@
+# Yield curves: one wide table per curve (Date plus one column of yields in percent per tenor,
+# e.g. 3M, 2Y, 10Y), kept in data/store/curves/<name>.parquet by the cleaning stage. Analytics
+# work on the whole dates x tenors array at once: interpolated curve points, slopes and
+# butterflies for every date come out of one vectorized interpolation, however many tenors or
+# dates a curve has.
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from market_analytics import store
+
+RAW_DIR = 'data/bonds'
+CURVES_DIR = 'curves'
+FILL_LIMIT = 5  # days a missing quote (e.g. a market holiday) is carried forward
+TENOR_TOL = 1e-9  # years: '360M' and '30Y' are the same maturity
+
+SLOPES = {'Slope_3m10y': ('3M', '10Y'), 'Slope_2s10s': ('2Y', '10Y'), 'Slope_5s30s': ('5Y', '30Y')}
+BUTTERFLIES = {'Fly_2s5s10s': ('2Y', '5Y', '10Y'), 'Fly_5s10s30s': ('5Y', '10Y', '30Y')}
+
+_TENOR = re.compile(r'^(\d+(?:\.\d+)?)([DWMY])$')
+_YEARS = {'D': 1 / 365, 'W': 7 / 365, 'M': 1 / 12, 'Y': 1.0}
+
+
+def tenor_years(label):
+    # '3M' -> 0.25, '10Y' -> 10.0; numbers are taken as years already.
+    if isinstance(label, (int, float, np.number)):
+        return float(label)
+    m = _TENOR.match(str(label).strip().upper())
+    if m is None:
+        raise ValueError(f'Bad tenor {label!r} (expected e.g. 1M, 2Y)')
+    return float(m.group(1)) * _YEARS[m.group(2)]
+
+
+def _dense(tenors, values, targets):
+    # Every tenor quoted: the brackets and weights are shared by all rows.
+    k = len(tenors)
+    if k == 1:
+        return np.repeat(values, len(targets), axis=1)
+    j = np.clip(np.searchsorted(tenors, targets, side='right') - 1, 0, k - 2)
+    w = np.clip((targets - tenors[j]) / (tenors[j + 1] - tenors[j]), 0.0, 1.0)  # clip: flat ends
+    lo = np.take(values, j, axis=1)
+    return lo + w * (np.take(values, j + 1, axis=1) - lo)
+
+
+def _gaps(tenors, values, targets, valid):
+    # Rows with unquoted tenors: bracket each target with the row's nearest quoted tenors.
+    n, k = values.shape
+    cols = np.arange(k)
+    # per row: last quoted column at or before each column, first quoted at or after it
+    left = np.maximum.accumulate(np.where(valid, cols, -1), axis=1)
+    right = np.minimum.accumulate(np.where(valid, cols, k)[:, ::-1], axis=1)[:, ::-1]
+    j = np.searchsorted(tenors, targets, side='right') - 1  # last tenor <= target
+    lo = np.where(j >= 0, left[:, np.clip(j, 0, k - 1)], -1)
+    hi = np.where(j + 1 < k, right[:, np.clip(j + 1, 0, k - 1)], k)
+    has_lo, has_hi = lo >= 0, hi < k
+    lo, hi = np.clip(lo, 0, k - 1), np.clip(hi, 0, k - 1)
+    rows = np.arange(n)[:, None]
+    y_lo, y_hi = values[rows, lo], values[rows, hi]
+    t_lo, t_hi = tenors[lo], tenors[hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.where(t_hi > t_lo, (targets - t_lo) / (t_hi - t_lo), 0.0)
+        inside = y_lo + w * (y_hi - y_lo)
+    return np.where(has_lo & has_hi, inside, np.where(has_lo, y_lo, y_hi))
+
+
+def interpolate(tenors, values, targets):
+    # Linear interpolation of every row of values (dates x tenors, NaN = not quoted) at the target
+    # maturities (years), flat beyond the first / last quoted tenor. Returns dates x targets.
+    values = np.asarray(values, dtype='float64')
+    tenors = np.asarray(tenors, dtype='float64')
+    targets = np.atleast_1d(np.asarray(targets, dtype='float64'))
+    valid = ~np.isnan(values)
+    full = valid.all(axis=1)
+    if full.all():
+        return _dense(tenors, values, targets)
+    out = np.empty((len(values), len(targets)))
+    if full.any():
+        out[full] = _dense(tenors, values[full], targets)
+    out[~full] = _gaps(tenors, values[~full], targets, valid[~full])
+    return out
+
+
+class Curve:
+    def __init__(self, name, dates, labels, values):
+        # labels: tenor column names; columns are kept sorted by maturity.
+        years = np.array([tenor_years(t) for t in labels])
+        order = np.argsort(years, kind='stable')
+        self.name = name
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.labels = [str(labels[i]) for i in order]
+        self.tenors = years[order]
+        self.values = np.asarray(values, dtype='float64')[:, order]
+
+    @classmethod
+    def from_frame(cls, name, df):
+        labels = [c for c in df.columns if c != 'Date']
+        return cls(name, pd.to_datetime(df['Date']).to_numpy(), labels, df[labels].to_numpy('float64'))
+
+    def frame(self):
+        df = pd.DataFrame(self.values, columns=self.labels)
+        df.insert(0, 'Date', self.dates)
+        return df
+
+    def last(self, n=1):
+        return Curve(self.name, self.dates[-n:], self.labels, self.values[-n:])
+
+    def at(self, targets):
+        # Yields at the target tenors (labels or years) for every date: dates x targets.
+        return interpolate(self.tenors, self.values, [tenor_years(t) for t in targets])
+
+    def legs(self, targets):
+        # Like at(), but NaN where a target is outside the tenors quoted on that date: a slope or
+        # butterfly leg is never a flat extrapolation (a curve without a 30Y has no 5s30s).
+        years = np.array([tenor_years(t) for t in targets])
+        y = self.at(targets)
+        valid = ~np.isnan(self.values)
+        quoted = valid.any(axis=1)
+        first = np.where(quoted, self.tenors[valid.argmax(axis=1)], np.nan)
+        last = np.where(quoted, self.tenors[len(self.tenors) - 1 - valid[:, ::-1].argmax(axis=1)], np.nan)
+        with np.errstate(invalid='ignore'):
+            inside = (years >= first[:, None] - TENOR_TOL) & (years <= last[:, None] + TENOR_TOL)
+        y[~inside] = np.nan
+        return y
+
+    def slope(self, short='2Y', long='10Y'):
+        y = self.legs([short, long])
+        return y[:, 1] - y[:, 0]
+
+    def butterfly(self, short='2Y', belly='5Y', long='10Y'):
+        y = self.legs([short, belly, long])
+        return 2 * y[:, 1] - y[:, 0] - y[:, 2]
+
+    def metrics(self, slopes=SLOPES, butterflies=BUTTERFLIES):
+        # Slopes and butterflies (percentage points) for every date, from one interpolation at the
+        # union of the tenors they use; NaN on dates a leg is not within the quoted tenors.
+        legs = sorted({t for spec in list(slopes.values()) + list(butterflies.values()) for t in spec},
+                      key=tenor_years)
+        y = self.legs(legs)
+        col = {t: i for i, t in enumerate(legs)}
+        out = {'Date': self.dates}
+        for name, (short, long) in slopes.items():
+            out[name] = y[:, col[long]] - y[:, col[short]]
+        for name, (short, belly, long) in butterflies.items():
+            out[name] = 2 * y[:, col[belly]] - y[:, col[short]] - y[:, col[long]]
+        return pd.DataFrame(out)
+
+
+def clean(df):
+    # Sorted unique dates, rows without any quote dropped, short gaps carried forward.
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'])
+    df = df.sort_values('Date').drop_duplicates('Date', keep='last')
+    labels = [c for c in df.columns if c != 'Date']
+    df[labels] = df[labels].apply(pd.to_numeric, errors='coerce')
+    df = df.dropna(subset=labels, how='all')
+    df[labels] = df[labels].ffill(limit=FILL_LIMIT)
+    return df.reset_index(drop=True)
+
+
+def curves_dir(store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, CURVES_DIR)
+
+
+def curve_path(name, store_dir=store.STORE_DIR):
+    return os.path.join(curves_dir(store_dir), f'{name}.parquet')
+
+
+def write(curve, store_dir=store.STORE_DIR):
+    os.makedirs(curves_dir(store_dir), exist_ok=True)
+    path = curve_path(curve.name, store_dir)
+    tmp = os.path.join(curves_dir(store_dir), f'.{curve.name}.parquet.tmp')
+    curve.frame().to_parquet(tmp, index=False, compression=store.COMPRESSION)
+    os.replace(tmp, path)
+    return path
+
+
+def load(name, store_dir=store.STORE_DIR):
+    return Curve.from_frame(name, pd.read_parquet(curve_path(name, store_dir)))
+
+
+def signature(name, store_dir=store.STORE_DIR):
+    try:
+        st = os.stat(curve_path(name, store_dir))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def list_curves(store_dir=store.STORE_DIR):
+    d = curves_dir(store_dir)
+    if not os.path.isdir(d):
+        return []
+    return sorted(f[:-len('.parquet')] for f in os.listdir(d) if f.endswith('.parquet') and not f.startswith('.'))
+
+
+def clean_curve(path_in, name=None, store_dir=store.STORE_DIR):
+    # Cleans a raw wide curve CSV (data/bonds/<name>.csv) into the store. Returns the Curve.
+    name = name or os.path.basename(path_in).replace('.csv', '')
+    curve = Curve.from_frame(name, clean(pd.read_csv(path_in)))
+    write(curve, store_dir)
+    return curve
+
+
+def latest_metrics(names=None, store_dir=store.STORE_DIR):
+    # Slopes and butterflies on the last date of every stored curve, indexed by curve.
+    rows = {}
+    for name in list_curves(store_dir) if names is None else names:
+        curve = load(name, store_dir)
+        if len(curve.dates):
+            rows[name] = curve.last().metrics().iloc[0].to_dict()
+    out = pd.DataFrame.from_dict(rows, orient='index')
+    out.index.name = 'curve'
+    return out
@@ -0,0 +1,100 @@
+# Shape-preserving downsampling for charts, so a series of any length is drawn with a bounded
+# number of points. lttb (Largest-Triangle-Three-Buckets) keeps the visual shape of prices;
+# minmax keeps every bucket's extremes, so return spikes survive. Tiers holds a pyramid of
+# downsampled copies of one series and answers date-range queries from the coarsest copy that
+# still has enough points in the range, reaching full resolution when zoomed in far enough.
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 5000
+TIER_FACTOR = 8  # each tier is ~8x smaller than the one below it
+
+
+def _edges(size, buckets, first=0):
+    return np.linspace(first, size, buckets + 1).astype('int64')
+
+
+def lttb(x, y, n):
+    # Indices of the n points LTTB keeps (always the first and the last). x must be increasing.
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = _edges(size - 1, n - 2, first=1)  # n - 2 buckets between the first and last point
+    counts = np.diff(edges)
+    # average point of every bucket, plus the last point as the "next bucket" of the final one
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+    idx = np.empty(n, dtype='int64')
+    idx[0], idx[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax(x, y, n):
+    # Indices of each bucket's minimum and maximum (n // 2 buckets), in order.
+    size = len(y)
+    if n >= size or n < 2:
+        return np.arange(size)
+    y = np.asarray(y, dtype='float64')
+    edges = _edges(size, n // 2)
+    counts = np.diff(edges)
+    bucket = np.repeat(np.arange(len(counts)), counts)
+    keep = []
+    for reduce in (np.minimum, np.maximum):
+        hits = np.flatnonzero(y == np.repeat(reduce.reduceat(y, edges[:-1]), counts))
+        keep.append(hits[np.unique(bucket[hits], return_index=True)[1]])  # first hit per bucket
+    return np.unique(np.concatenate(keep))
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, n, method='lttb'):
+    return METHODS[method](x, y, n)
+
+
+class Tiers:
+    # Level 0 is the series itself (NaNs dropped); each further level is downsampled from the one
+    # below by TIER_FACTOR until a level has at most points * TIER_FACTOR rows. The levels use
+    # minmax (vectorized, and it keeps every extreme the final pass could pick); `method` is
+    # applied when a query is cut down to its point budget.
+    def __init__(self, dates, values, points=MAX_POINTS, method='lttb'):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        values = np.asarray(values, dtype='float64')
+        nan = np.isnan(values)
+        first = int(nan.argmin()) if len(values) else 0
+        self.points, self.method = points, method
+        if nan[first:].any():
+            self.levels = [(dates[~nan], values[~nan])]
+        else:  # only the warm-up is missing: a view, so a memory-mapped series is not copied
+            self.levels = [(dates[first:], values[first:])]
+        while len(self.levels[-1][0]) > points * TIER_FACTOR:
+            x, y = self.levels[-1]
+            idx = minmax(x, y, len(x) // TIER_FACTOR)
+            self.levels.append((x[idx], y[idx]))
+        self.nbytes = sum(x.nbytes + y.nbytes for x, y in self.levels)
+
+    def query(self, start=None, end=None, points=None):
+        # (dates, values) for start <= date <= end with at most `points` rows.
+        points = min(points or self.points, self.points)
+        for level, (x, y) in reversed(list(enumerate(self.levels))):
+            lo = 0 if start is None else np.searchsorted(x, np.datetime64(pd.Timestamp(start), 'ns'))
+            hi = len(x) if end is None else np.searchsorted(x, np.datetime64(pd.Timestamp(end), 'ns'), 'right')
+            if hi - lo >= points or level == 0:
+                break
+        x, y = x[lo:hi], y[lo:hi]
+        if len(x) > points:
+            idx = downsample(x.view('int64'), y, points, self.method)
+            x, y = x[idx], y[idx]
+        return x, y
+
+    def frame(self, column, start=None, end=None, points=None):
+        x, y = self.query(start, end, points)
+        return pd.DataFrame({'Date': x, column: y})
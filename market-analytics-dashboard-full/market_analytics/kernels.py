@@ -0,0 +1,191 @@
+# Fused KPI kernel: a single pass over contiguous float64 arrays computes the daily return,
+# cumulative return, spread and every rolling mean / standard deviation with O(1) updates per
+# bar (Kahan-compensated running sums for the means, Welford add/remove updates for the
+# variances, following the same update rules as pandas' rolling kernels). It is compiled with
+# numba when that is installed (imported on first use, so importing this module stays cheap);
+# otherwise an equivalent vectorized NumPy version runs. The
+# 'pandas' engine is the original rolling() implementation, kept as the parity reference
+# (checked by tests/test_kernels.py), and 'python' runs the numba kernel's body in the
+# interpreter, so that kernel can be checked where numba is not installed (slow).
+import importlib.util
+import math
+import os
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+MA_WINDOWS = (('MA_20', 20), ('MA_50', 50))
+VOL_WINDOWS = (('Volatility_7', 7), ('Volatility_30', 30))
+ENGINES = ('numba', 'numpy', 'pandas')
+# MARKET_KPI_ENGINE forces an engine, e.g. numpy to skip numba's first-call compilation.
+ENGINE = os.environ.get('MARKET_KPI_ENGINE') or ('numba' if HAVE_NUMBA else 'numpy')
+
+
+def _fused(close, high, low, start, factor, ma_w, vol_w, out):
+    # close holds `start` carried-over closes followed by the new bars (high/low: new bars only).
+    # out rows: return, cumulative return, spread, one per MA window, one per vol window.
+    # Returns the cumulative growth factor after the last bar.
+    n_ma, n_vol = len(ma_w), len(vol_w)
+    # per-window state: MA -> [nobs, sum, comp_add, comp_remove, same_run, prev];
+    # vol -> [nobs, mean, ssqdm, comp_add, comp_remove, same_run, prev]
+    ma = np.zeros((n_ma, 6))
+    vol = np.zeros((n_vol, 7))
+    ma[:, 5] = np.nan
+    vol[:, 6] = np.nan
+    rets = np.empty(len(close))
+    for i in range(len(close)):
+        x = close[i]
+        r = x / close[i - 1] - 1.0 if i > 0 else np.nan
+        rets[i] = r
+        j = i - start
+        if j >= 0:
+            if r == r:
+                factor = factor * (1.0 + r)
+            out[0, j] = r
+            out[1, j] = factor - 1.0 if r == r else np.nan
+            out[2, j] = (high[j] - low[j]) / x
+        for k in range(n_ma):
+            w = ma_w[k]
+            s = ma[k]
+            if i >= w:
+                old = close[i - w]
+                if old == old:
+                    s[0] -= 1
+                    y = -old - s[3]
+                    t = s[1] + y
+                    s[3] = t - s[1] - y
+                    s[1] = t
+            if x == x:
+                s[0] += 1
+                y = x - s[2]
+                t = s[1] + y
+                s[2] = t - s[1] - y
+                s[1] = t
+                s[4] = s[4] + 1 if x == s[5] else 1
+                s[5] = x
+            if j >= 0:
+                if s[0] >= w:
+                    out[3 + k, j] = s[5] if s[4] >= s[0] else s[1] / s[0]
+                else:
+                    out[3 + k, j] = np.nan
+        for k in range(n_vol):
+            w = vol_w[k]
+            s = vol[k]
+            if i >= w:
+                old = rets[i - w]
+                if old == old:
+                    s[0] -= 1
+                    if s[0]:
+                        prev_mean = s[1] - s[4]
+                        y = old - s[4]
+                        t = y - s[1]
+                        s[4] = t + s[1] - y
+                        s[1] = s[1] - t / s[0]
+                        s[2] = s[2] - (old - prev_mean) * (old - s[1])
+                    else:
+                        s[1] = 0.0
+                        s[2] = 0.0
+            if r == r:
+                s[0] += 1
+                s[5] = s[5] + 1 if r == s[6] else 1
+                s[6] = r
+                prev_mean = s[1] - s[3]
+                y = r - s[3]
+                t = y - s[1]
+                s[3] = t + s[1] - y
+                s[1] = s[1] + t / s[0]
+                s[2] = s[2] + (r - prev_mean) * (r - s[1])
+            if j >= 0:
+                if s[0] >= w and s[0] > 1:
+                    var = 0.0 if s[5] >= s[0] else s[2] / (s[0] - 1)
+                    out[3 + n_ma + k, j] = math.sqrt(var) if var > 0 else 0.0
+                else:
+                    out[3 + n_ma + k, j] = np.nan
+    return factor
+
+
+_compiled = None
+
+
+def _numba(*args):
+    global _compiled
+    if _compiled is None:
+        import numba
+        _compiled = numba.njit(cache=True, error_model='numpy')(_fused)
+    return _compiled(*args)
+
+
+def _numpy(close, high, low, start, factor, ma_w, vol_w, out):
+    # Vectorized fallback: windows as strided views of the same buffer (no copies).
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = np.empty(len(close))
+        rets[0] = np.nan
+        np.divide(close[1:], close[:-1], out=rets[1:])
+        rets[1:] -= 1.0
+        new = rets[start:]
+        out[0] = new
+        growth = np.where(np.isnan(new), 1.0, 1.0 + new)
+        growth[0] *= factor
+        growth = np.cumprod(growth)
+        out[1] = np.where(np.isnan(new), np.nan, growth - 1.0)
+        out[2] = (high - low) / close[start:]
+        for k, w in enumerate(ma_w):
+            out[3 + k] = _window(close, w, start, lambda v: v.mean(axis=1))
+        for k, w in enumerate(vol_w):
+            out[3 + len(ma_w) + k] = _window(rets, w, start, lambda v: v.std(axis=1, ddof=1))
+    valid = np.flatnonzero(~np.isnan(new))
+    return float(growth[valid[-1]]) if len(valid) else factor
+
+
+def _window(values, w, start, reduce):
+    # reduce() over the length-w window ending at each of values[start:] (NaN before the first
+    # full window or when the window holds a NaN, like rolling(w) with min_periods=w).
+    res = np.full(len(values) - start, np.nan)
+    if len(values) >= w:
+        first = max(start, w - 1)
+        res[first - start:] = reduce(sliding_window_view(values[first - w + 1:], w))
+    return res
+
+
+def _pandas(close, high, low, start, factor, ma_w, vol_w, out):
+    close = pd.Series(close)
+    ret = close.pct_change(fill_method=None)
+    new = slice(start, None)
+    out[0] = ret.iloc[new].to_numpy()
+    growth = pd.concat([pd.Series([factor]), 1 + ret.iloc[new]], ignore_index=True).cumprod()
+    out[1] = growth.iloc[1:].to_numpy() - 1
+    out[2] = (high - low) / close.iloc[new].to_numpy()
+    for k, w in enumerate(ma_w):
+        out[3 + k] = close.rolling(w).mean().iloc[new].to_numpy()
+    for k, w in enumerate(vol_w):
+        out[3 + len(ma_w) + k] = ret.rolling(w).std().iloc[new].to_numpy()
+    valid = growth.dropna()
+    return float(valid.iloc[-1]) if len(valid) else factor
+
+
+_ENGINES = {'numba': _numba, 'numpy': _numpy, 'pandas': _pandas, 'python': _fused}
+
+
+def fused_kpis(close, high, low, start=0, factor=1.0, ma_windows=MA_WINDOWS, vol_windows=VOL_WINDOWS,
+               engine=None):
+    # close: `start` carried-over closes followed by the new bars; high/low: the new bars.
+    # Returns ({column: float64 array over the new bars}, cumulative growth factor to carry).
+    # Columns come out as Daily_Return, Cumulative_Return, the MAs, the volatilities, Spread.
+    engine = engine or ENGINE
+    if engine == 'numba' and not HAVE_NUMBA:
+        raise ValueError('the numba KPI engine needs numba installed')
+    close = np.ascontiguousarray(close, dtype='float64')
+    high = np.ascontiguousarray(high, dtype='float64')
+    low = np.ascontiguousarray(low, dtype='float64')
+    ma_w = np.array([w for _, w in ma_windows], dtype='int64')
+    vol_w = np.array([w for _, w in vol_windows], dtype='int64')
+    out = np.empty((3 + len(ma_w) + len(vol_w), len(close) - start))
+    if len(close) > start:
+        factor = _ENGINES[engine](close, high, low, start, float(factor), ma_w, vol_w, out)
+    names = [n for n, _ in ma_windows] + [n for n, _ in vol_windows]
+    cols = {'Daily_Return': out[0], 'Cumulative_Return': out[1]}
+    cols.update(zip(names, out[3:]))
+    cols['Spread'] = out[2]
+    return cols, factor
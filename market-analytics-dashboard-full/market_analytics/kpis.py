@@ -0,0 +1,142 @@
+# KPI registry. Every metric declares its inputs (raw OHLCV columns or other KPIs), its rolling
+# window and the dtype it is stored as in compact mode; compute() evaluates only the KPIs asked
+# for plus what they depend on, each once and dependencies first. Metrics with a `stat` are
+# produced by one fused kernel pass (market_analytics.kernels) limited to the windows actually
+# needed: 'mean' is a rolling mean of Close and 'std' a rolling volatility of Daily_Return.
+# The others are functions of the columns computed before them, added with @kpi.
+import numpy as np
+import pandas as pd
+
+from market_analytics import kernels, metrics
+
+RAW_COLUMNS = ('Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume')
+# kernel outputs for the non-windowed stats
+_STAT_COLUMNS = {'return': 'Daily_Return', 'cumulative': 'Cumulative_Return', 'spread': 'Spread'}
+
+
+class KPI:
+    def __init__(self, name, inputs, window=None, dtype='float32', stat=None, func=None):
+        self.name, self.inputs, self.window, self.dtype = name, tuple(inputs), window, dtype
+        self.stat, self.func = stat, func
+
+    def __repr__(self):
+        return f'KPI({self.name!r}, inputs={list(self.inputs)}, window={self.window})'
+
+
+REGISTRY = {}
+
+
+def register(name, inputs, window=None, dtype='float32', stat=None, func=None):
+    REGISTRY[name] = KPI(name, inputs, window, dtype, stat, func)
+    return REGISTRY[name]
+
+
+def kpi(name, inputs, window=None, dtype='float32'):
+    # Decorator for function-backed KPIs: func({input: array}) -> array over the same rows.
+    def decorate(func):
+        register(name, inputs, window, dtype, func=func)
+        return func
+    return decorate
+
+
+register('Daily_Return', ['Close'], stat='return')
+register('Cumulative_Return', ['Daily_Return'], stat='cumulative')
+register('MA_20', ['Close'], 20, stat='mean')
+register('MA_50', ['Close'], 50, stat='mean')
+register('Volatility_7', ['Daily_Return'], 7, stat='std')
+register('Volatility_30', ['Daily_Return'], 30, stat='std')
+register('Spread', ['High', 'Low', 'Close'], stat='spread')
+
+
+@kpi('Amihud', ['Daily_Return', 'Volume'])
+def amihud(cols):
+    # Amihud illiquidity proxy |return| / volume (NaN on bars without volume).
+    volume = np.asarray(cols['Volume'], dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(volume > 0, np.abs(cols['Daily_Return']) / volume, np.nan)
+
+
+def names():
+    return list(REGISTRY)
+
+
+def dtypes():
+    return {k.name: k.dtype for k in REGISTRY.values()}
+
+
+def plan(requested):
+    # The requested KPIs and everything they depend on, dependencies first.
+    order, done = [], set()
+
+    def visit(name, path):
+        if name in done or name in RAW_COLUMNS:
+            return
+        if name not in REGISTRY:
+            raise KeyError(f'Unknown KPI {name!r}')
+        if name in path:
+            raise ValueError(f"KPI dependency cycle: {' -> '.join(path + (name,))}")
+        for dep in REGISTRY[name].inputs:
+            visit(dep, path + (name,))
+        done.add(name)
+        order.append(name)
+
+    for name in requested:
+        visit(name, ())
+    return order
+
+
+def raw_inputs(requested):
+    # Raw columns a set of KPIs is computed from.
+    cols = {c for name in plan(requested) for c in REGISTRY[name].inputs if c in RAW_COLUMNS}
+    return [c for c in RAW_COLUMNS if c in cols]
+
+
+def tail_length(requested=None):
+    # Earlier closes needed to continue these KPIs incrementally: a w-bar mean needs w - 1 of
+    # them, a w-bar volatility w (its first return needs the close before the window).
+    need = 1
+    for name in plan(names() if requested is None else requested):
+        k = REGISTRY[name]
+        if k.stat == 'mean':
+            need = max(need, k.window - 1)
+        elif k.stat == 'std':
+            need = max(need, k.window)
+    return need
+
+
+@metrics.timed('kpis.compute')
+def compute(df, requested=None, state=None, engine=None):
+    # Adds the requested KPI columns (default: every registered KPI) to df, a DataFrame or a dict
+    # of equal-length arrays (cheaper for a few bars at a time). With a state from a previous
+    # run, df holds only new bars and the rolling windows / cumulative return continue from the
+    # carried-over closes. Returns (df, state for the next run).
+    requested = names() if requested is None else list(requested)
+    order = [REGISTRY[n] for n in plan(requested)]
+    tail = np.asarray(state['tail_closes'] if state else [], dtype='float64')
+    factor = state['cum_factor'] if state else 1.0
+    close = np.concatenate([tail, np.asarray(df['Close'], dtype='float64')])
+    new = close[len(tail):]
+    cols = {}
+    if any(k.stat for k in order):
+        spread = any(k.stat == 'spread' for k in order)
+        out, factor = kernels.fused_kpis(
+            close,
+            np.asarray(df['High'], dtype='float64') if spread else new,
+            np.asarray(df['Low'], dtype='float64') if spread else new,
+            start=len(tail), factor=factor,
+            ma_windows=[(k.name, k.window) for k in order if k.stat == 'mean'],
+            vol_windows=[(k.name, k.window) for k in order if k.stat == 'std'],
+            engine=engine)
+        for k in order:
+            if k.stat:
+                cols[k.name] = out[_STAT_COLUMNS.get(k.stat, k.name)]
+    for k in order:
+        if k.func is not None:
+            cols[k.name] = k.func({c: cols[c] if c in cols else np.asarray(df[c]) for c in k.inputs})
+    for name in requested:
+        df[name] = cols[name]
+    metrics.count('kpi_rows', len(new))
+    last_date = (state or {}).get('last_date')
+    if len(new) and 'Date' in df:
+        last_date = pd.Timestamp(np.asarray(df['Date'])[-1]).isoformat()
+    return df, {'last_date': last_date, 'tail_closes': close[-tail_length():].tolist(), 'cum_factor': factor}
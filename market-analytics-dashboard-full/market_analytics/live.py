@@ -0,0 +1,315 @@
+# Live update service: an asyncio loop, run in a background thread of the dashboard server and
+# shared by every session, that keeps the latest snapshot and the returns matrix in memory and
+# updates them incrementally from two sources:
+#
+#   - the store: each asset's files are stat()ed every `poll` seconds and, when they change,
+#     only the rows after the last date already seen are read (row groups before it are skipped);
+#   - a local feed: newline-delimited JSON bars on a TCP socket, e.g.
+#       {"asset": "aapl", "Date": "2024-06-03T14:30", "Open": 1, "High": 2, "Low": 1, "Close": 2, "Volume": 100}
+#     applied a batch of lines per asset at a time. Feed bars are not written to the store; the
+#     cleaning stage stays the system of record, and rows it later stores up to the last fed date
+#     are skipped. A fed bar sets its session day's return: its close against the last close of
+#     the asset's previous session, replaced by each later bar that day. That return is the
+#     snapshot row's Daily_Return and the returns matrix's value for the day; the daily KPIs
+#     (moving averages, volatilities, Spread, Amihud) stay those of the last stored session until
+#     the cleaning stage stores the fed one.
+#
+# Changes are coalesced and published at most every `throttle` seconds as a new version holding
+# only the changed snapshot rows. Sessions keep the last version they drew and ask for the
+# changes since then (in memory, no file access), e.g. from an st.fragment with run_every.
+import asyncio
+import json
+import socket
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from market_analytics import calendars, returns, snapshot, store
+
+POLL_SECONDS = 1.0
+THROTTLE_SECONDS = 0.25
+MAX_DELTAS = 256  # versions kept for changes(); older sessions get the full snapshot
+
+
+class ReturnsBuffer:
+    # Returns matrix with spare rows and columns, so new assets and bars at new dates are written
+    # in place instead of copying the whole matrix. matrix() is a view: it may already show bars
+    # applied after it was taken.
+    def __init__(self, rm=None):
+        assets = rm.assets if rm is not None else []
+        dates = rm.dates if rm is not None else np.array([], dtype='datetime64[ns]')
+        self.n, self.t = len(assets), len(dates)
+        self.values = np.full(self._capacity(self.n, self.t), np.nan)
+        self.dates = np.empty(self.values.shape[1], dtype='datetime64[ns]')
+        if rm is not None:
+            self.values[:self.n, :self.t] = rm.values
+        self.dates[:self.t] = dates
+        self.assets = list(assets)
+        self.index = {a: i for i, a in enumerate(self.assets)}
+
+    @staticmethod
+    def _capacity(n, t):
+        return n + max(16, n // 8), t + max(256, t // 8)
+
+    def _grow(self, n, t):
+        if n <= self.values.shape[0] and t <= self.values.shape[1]:
+            return
+        values = np.full(self._capacity(max(n, self.n), max(t, self.t)), np.nan)
+        values[:self.n, :self.t] = self.values[:self.n, :self.t]
+        dates = np.empty(values.shape[1], dtype='datetime64[ns]')
+        dates[:self.t] = self.dates[:self.t]
+        self.values, self.dates = values, dates
+
+    def add(self, asset, dates, rets):
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        if asset not in self.index:
+            self._grow(self.n + 1, self.t)
+            self.index[asset] = self.n
+            self.assets.append(asset)
+            self.n += 1
+        known = self.dates[:self.t]
+        new = np.setdiff1d(dates, known)
+        if len(new) and self.t and new[0] <= known[-1]:
+            # a date inside the axis: rebuild (rare; bars normally arrive in date order)
+            rm = returns.merge(self.matrix(), {asset: (dates, rets)}, replace=False)
+            self.__init__(returns.ReturnsMatrix(rm.assets, rm.dates, rm.values))
+            return
+        self._grow(self.n, self.t + len(new))
+        self.dates[self.t:self.t + len(new)] = new
+        self.t += len(new)
+        self.values[self.index[asset], np.searchsorted(self.dates[:self.t], dates)] = rets
+
+    def matrix(self):
+        return returns.ReturnsMatrix(self.assets, self.dates[:self.t], self.values[:self.n, :self.t])
+
+
+class LiveService:
+    def __init__(self, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR, port=None, host='127.0.0.1',
+                 poll=POLL_SECONDS, throttle=THROTTLE_SECONDS):
+        self.store_dir, self.clean_dir = store_dir, clean_dir
+        self.host, self.port, self.poll, self.throttle = host, port, poll, throttle
+        self.lock = threading.Lock()
+        self.version = 0
+        self.deltas = deque(maxlen=MAX_DELTAS)  # (version, {asset: snapshot row})
+        self.pending = {}
+        self.daily = {}  # asset -> snapshot row of its last stored session
+        self.sessions = {}  # asset -> [session day, previous session's close, latest close]
+        self._matrix = None  # returns(), built again after a change
+        self.stats = {'store_reads': 0, 'feed_bars': 0, 'dropped_bars': 0, 'bad_lines': 0, 'publishes': 0}
+        self.loop = self.thread = self.error = None
+        self.ready = threading.Event()
+
+    def snapshot(self):
+        # The current snapshot (do not modify: it is shared and replaced on every publish).
+        with self.lock:
+            return self._snapshot
+
+    def returns(self):
+        # The returns matrix with the live session returns, with the calendar of the store's
+        # markets (do not modify: it is shared).
+        with self.lock:
+            if self._matrix is None:
+                rm = self._returns.matrix()
+                self._matrix = returns.ReturnsMatrix(rm.assets, rm.dates, rm.values,
+                                                     calendars.build(rm, self.markets))
+            return self._matrix
+
+    def changes(self, since):
+        # (version, {asset: row}) changed after version `since`; rows is None when `since` is too
+        # old to be answered from the kept deltas (redraw from snapshot()).
+        with self.lock:
+            version = self.version
+            if since >= version:
+                return version, {}
+            if not self.deltas or self.deltas[0][0] > since + 1:
+                return version, None
+            rows = {}
+            for v, delta in self.deltas:
+                if v > since:
+                    rows.update(delta)
+            return version, rows
+
+    def start(self):
+        # Loads the stored snapshot and returns matrix, then runs the loop in a daemon thread.
+        snap = snapshot.get(self.store_dir, self.clean_dir)
+        rm = returns.get(self.store_dir, self.clean_dir)
+        self._snapshot = snap
+        self._returns = ReturnsBuffer(rm)
+        self.markets = calendars.market_map(self.store_dir)
+        for a, row in snap.iterrows():
+            self._session(a, row.to_dict())
+        self.last_dates = {a: pd.Timestamp(d) for a, d in snap['Date'].items() if not pd.isna(d)}
+        self.signatures = {a: store.signature(a, self.store_dir, self.clean_dir) for a in snap.index}
+        self.thread = threading.Thread(target=self._run, name='market-live', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self._watch_store())
+        self.loop.create_task(self._publisher())
+        if self.port is not None:
+            try:
+                server = self.loop.run_until_complete(asyncio.start_server(self._feed, self.host, self.port))
+            except OSError as e:  # e.g. the port is taken
+                self.error = e
+                self.ready.set()
+                return
+            self.port = server.sockets[0].getsockname()[1]  # the actual port when 0 was asked for
+        self.ready.set()
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def _session(self, asset, row):
+        # Starts the session state of an asset from its stored snapshot row.
+        if not pd.isna(row['Date']):
+            self.daily[asset] = row
+            close = row['Close']
+            self.sessions[asset] = [np.datetime64(pd.Timestamp(row['Date']).normalize(), 'ns'),
+                                    close / (1 + row['Daily_Return']), close]
+
+    def _session_returns(self, asset, dates, closes):
+        # (session days, returns) of fed bars: each day's last close against the previous
+        # session's last close.
+        days = dates.astype('datetime64[D]').astype('datetime64[ns]')
+        last = np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+        state = self.sessions.setdefault(asset, [None, np.nan, np.nan])
+        rets = np.empty(len(last))
+        for k, i in enumerate(last):
+            if state[0] is None or days[i] > state[0]:
+                state[0], state[1] = days[i], state[2]
+            state[2] = closes[i]
+            rets[k] = state[2] / state[1] - 1
+        return days[last], rets
+
+    def _apply(self, asset, row, dates, rets):
+        with self.lock:
+            self._returns.add(asset, dates, rets)
+            self._matrix = None
+        self.pending[asset] = row
+        self.last_dates[asset] = pd.Timestamp(row['Date'])
+
+    async def _publisher(self):
+        while True:
+            await asyncio.sleep(self.throttle)
+            if not self.pending:
+                continue
+            delta, self.pending = self.pending, {}
+            new = pd.DataFrame.from_dict(delta, orient='index', columns=snapshot.COLUMNS)
+            snap = pd.concat([self._snapshot.drop(index=new.index, errors='ignore'), new]).sort_index()
+            snap.index.name = 'asset'
+            with self.lock:
+                self._snapshot = snap
+                self.version += 1
+                self.deltas.append((self.version, delta))
+                self.stats['publishes'] += 1
+
+    async def _watch_store(self):
+        while True:
+            changed = await self.loop.run_in_executor(None, self._changed_assets)
+            for asset in changed:
+                try:
+                    update = await self.loop.run_in_executor(None, self._read_new_rows, asset)
+                except (OSError, ValueError, KeyError) as e:  # e.g. caught mid-compaction
+                    print(f'live: cannot read {asset}: {type(e).__name__}: {e}')
+                    self.signatures[asset] = None  # retry on the next poll
+                    continue
+                if update is not None:
+                    self._session(asset, update[0])
+                    self._apply(asset, *update)
+            await asyncio.sleep(self.poll)
+
+    def _changed_assets(self):
+        changed = []
+        for asset in store.list_assets(self.store_dir, self.clean_dir):
+            sig = store.signature(asset, self.store_dir, self.clean_dir)
+            if sig != self.signatures.get(asset):
+                self.signatures[asset] = sig
+                changed.append(asset)
+        return changed
+
+    def _read_new_rows(self, asset):
+        df = store.read_after(asset, self.last_dates.get(asset), ['Date', 'Daily_Return'],
+                              self.store_dir, self.clean_dir)
+        self.stats['store_reads'] += 1
+        if df.empty:
+            return None
+        return (snapshot.asset_row(asset, self.store_dir, self.clean_dir),
+                df['Date'].to_numpy('datetime64[ns]'), df['Daily_Return'].to_numpy('float64'))
+
+    async def _feed(self, reader, writer):
+        # Whatever has arrived is applied as one batch; malformed lines are counted and skipped.
+        buf = b''
+        try:
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                buf += data
+                *lines, buf = buf.split(b'\n')
+                bars = []
+                for line in lines:
+                    try:
+                        bar = json.loads(line)
+                    except ValueError:
+                        bar = None
+                    if isinstance(bar, dict) and {'asset', 'Date', 'Close'} <= set(bar):
+                        bars.append(bar)
+                    elif line.strip():
+                        self.stats['bad_lines'] += 1
+                try:
+                    self.feed_bars(bars)
+                except (KeyError, ValueError, TypeError) as e:
+                    self.stats['bad_lines'] += len(bars)
+                    print(f'live: bad feed batch: {type(e).__name__}: {e}')
+        except ConnectionError as e:
+            print(f'live: feed connection dropped: {type(e).__name__}: {e}')
+        finally:
+            writer.close()
+
+    def feed_bars(self, bars):
+        # Applies bars (dicts with asset, Date and Close; other fields are ignored) grouped per
+        # asset; bars not after the asset's last known date are dropped. Works on plain arrays
+        # (no DataFrame per asset). Call from the loop thread.
+        if not bars:
+            return
+        names = np.array([str(b['asset']).lower() for b in bars])
+        dates = pd.to_datetime([b['Date'] for b in bars]).to_numpy('datetime64[ns]')
+        closes = np.array([b['Close'] for b in bars], dtype='float64')
+        order = np.lexsort((dates, names))
+        names, dates, closes = names[order], dates[order], closes[order]
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        for lo, hi in zip(starts, np.r_[starts[1:], len(names)]):
+            asset = str(names[lo])
+            d, close = dates[lo:hi], closes[lo:hi]
+            last = self.last_dates.get(asset)
+            keep = d > np.datetime64(last, 'ns') if last is not None else np.ones(len(d), dtype=bool)
+            self.stats['dropped_bars'] += int(len(d) - keep.sum())
+            if not keep.any():
+                continue
+            d, close = d[keep], close[keep]
+            self.stats['feed_bars'] += len(d)
+            days, rets = self._session_returns(asset, d, close)
+            row = dict(self.daily.get(asset) or dict.fromkeys(snapshot.COLUMNS, np.nan))
+            row.update(Date=d[-1], Close=close[-1], Daily_Return=rets[-1])
+            self._apply(asset, row, days, rets)
+
+def send_bars(bars, port, host='127.0.0.1'):
+    # Feed client: sends bars (dicts) as JSON lines on one connection.
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(''.join(json.dumps(b, default=str) + '\n' for b in bars).encode())
+
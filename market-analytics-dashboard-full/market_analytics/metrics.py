@@ -0,0 +1,329 @@
+# Lightweight instrumentation: named spans (calls, total and max seconds), counters (rows,
+# bytes, ...), gauges pulled from registered sources at export time (e.g. cache hit rates) and
+# peak RSS. Everything is off until enabled (MARKET_METRICS=1, or enable()): span() then hands
+# back a shared no-op context and count() returns at once, so an instrumented hot path costs a
+# function call and a flag check.
+#
+# Spans and counters recorded in forked pool workers (market_analytics.parallel, pipeline
+# process tasks) are shipped back with each result and merged into the parent's registry.
+#
+# Exports:
+#   - write(run): appends one JSON line per run to data/metrics/metrics.jsonl (MARKET_METRICS_FILE);
+#   - prometheus(): Prometheus text exposition, served on /metrics by serve(port);
+#   - start_run(name): for scripts, writes the run's line at exit, serves MARKET_METRICS_PORT
+#     meanwhile and, with MARKET_PROFILE=<path>, profiles the whole run: cProfile stats for a
+#     .prof path (snakeviz, pstats), sampled collapsed stacks for a .folded path (flamegraph.pl,
+#     speedscope). '{run}' in the path is replaced by the run name.
+import atexit
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_FILE = os.environ.get('MARKET_METRICS_FILE', 'data/metrics/metrics.jsonl')
+PREFIX = 'market_'
+SAMPLE_SECONDS = 0.005
+
+enabled = os.environ.get('MARKET_METRICS', '') not in ('', '0')
+
+_lock = threading.Lock()
+_spans = {}  # name -> [calls, total seconds, max seconds]
+_counters = Counter()
+_sources = {}  # name -> callable returning {gauge: number}
+_children_peak = 0  # peak RSS reported by pool workers
+_worker = False  # set in forked children: their records are shipped back by take()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    global _children_peak
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _children_peak = 0
+
+
+def _forked():
+    global _lock, _worker
+    _lock = threading.Lock()  # the parent's lock may have been held by another thread
+    _worker = True
+    _spans.clear()
+    _counters.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forked)
+
+
+def record(name, seconds, calls=1):
+    with _lock:
+        s = _spans.get(name)
+        if s is None:
+            _spans[name] = [calls, seconds, seconds]
+        else:
+            s[0] += calls
+            s[1] += seconds
+            if seconds > s[2]:
+                s[2] = seconds
+
+
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.t0)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    # with metrics.span('stage'): ... times the block (exceptions included).
+    return _Span(name) if enabled else _NO_SPAN
+
+
+def timed(name=None):
+    # Decorator: times every call of the function as a span (default: its qualified name).
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def call(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - t0)
+        return call
+    return decorate
+
+
+def count(name, n=1):
+    if enabled:
+        with _lock:
+            _counters[name] += n
+
+
+def register(name, source):
+    # source() -> {gauge: number}, read at export time only (gauges are named <name>_<gauge>).
+    _sources[name] = source
+
+
+def peak_rss():
+    # (this process, its reaped children) high-water RSS in bytes.
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in KiB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def take():
+    # In a forked worker: what it recorded since the last take(), which is then cleared; None in
+    # the main process or when disabled. Pass the result to merge() in the parent.
+    if not (enabled and _worker):
+        return None
+    with _lock:
+        delta = {'spans': {k: list(v) for k, v in _spans.items()}, 'counters': dict(_counters),
+                 'peak_rss': peak_rss()[0]}
+        _spans.clear()
+        _counters.clear()
+    return delta
+
+
+def merge(delta):
+    global _children_peak
+    if not delta:
+        return
+    with _lock:
+        for name, (calls, seconds, longest) in delta['spans'].items():
+            s = _spans.setdefault(name, [0, 0.0, 0.0])
+            s[0] += calls
+            s[1] += seconds
+            s[2] = max(s[2], longest)
+        _counters.update(delta['counters'])
+        _children_peak = max(_children_peak, delta['peak_rss'])
+
+
+def snapshot():
+    # {'spans': {name: {calls, seconds, max_seconds}}, 'counters': {...}, 'gauges': {...}}
+    with _lock:
+        spans = {k: {'calls': c, 'seconds': round(t, 6), 'max_seconds': round(m, 6)}
+                 for k, (c, t, m) in sorted(_spans.items())}
+        counters = dict(sorted(_counters.items()))
+        children = _children_peak
+    gauges = {}
+    for name, source in sorted(_sources.items()):
+        try:
+            values = source()
+        except Exception as e:  # a source must never break an export
+            values = {'error': 1}
+            print(f'metrics: source {name} failed: {type(e).__name__}: {e}')
+        gauges.update({f'{name}_{k}': v for k, v in values.items() if isinstance(v, (int, float))})
+    own, reaped = peak_rss()
+    gauges['peak_rss_bytes'] = own
+    gauges['children_peak_rss_bytes'] = max(reaped, children)
+    return {'spans': spans, 'counters': counters, 'gauges': gauges}
+
+
+def write(run, path=None, **fields):
+    # Appends {'run', 'time', 'pid', **fields, spans, counters, gauges} as one JSON line.
+    path = path or METRICS_FILE
+    line = {'run': run, 'time': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'pid': os.getpid(),
+            **fields, **snapshot()}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(line) + '\n')
+    return path
+
+
+def _name(s):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', s)
+
+
+def _label(s):
+    return s.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def prometheus():
+    snap = snapshot()
+    lines = []
+    for metric, key, kind in (('span_calls_total', 'calls', 'counter'), ('span_seconds_total', 'seconds', 'counter'),
+                              ('span_seconds_max', 'max_seconds', 'gauge')):
+        lines.append(f'# TYPE {PREFIX}{metric} {kind}')
+        lines += [f'{PREFIX}{metric}{{span="{_label(name)}"}} {s[key]}' for name, s in snap['spans'].items()]
+    for name, value in snap['counters'].items():
+        lines += [f'# TYPE {PREFIX}{_name(name)}_total counter', f'{PREFIX}{_name(name)}_total {value}']
+    for name, value in snap['gauges'].items():
+        lines += [f'# TYPE {PREFIX}{_name(name)} gauge', f'{PREFIX}{_name(name)} {float(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    # Serves prometheus() on http://host:port/metrics from a daemon thread. Returns the server
+    # (server.server_address has the actual port when 0 was asked for).
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='market-metrics', daemon=True).start()
+    return server
+
+
+class StackSampler:
+    # Samples one thread's Python stack every `interval` seconds; write() saves the counts as
+    # collapsed stacks ("outer;inner count" per line), the input of flamegraph.pl and speedscope.
+    def __init__(self, interval=SAMPLE_SECONDS, thread_id=None):
+        self.interval, self.target = interval, thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, name='market-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def _sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            f.writelines(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+        return path
+
+
+@contextmanager
+def profile(path):
+    # Profiles the block into path: sampled collapsed stacks for *.folded, cProfile stats otherwise.
+    if path.endswith('.folded'):
+        sampler = StackSampler().start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            sampler.write(path)
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield prof
+        finally:
+            prof.disable()
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            prof.dump_stats(path)
+
+
+def start_run(name):
+    # Call at the start of a script's main block; see the header for what it does at exit.
+    t0 = time.perf_counter()
+    path = os.environ.get('MARKET_PROFILE')
+    profiler = profile(path.replace('{run}', name)) if path else None
+    if profiler is not None:
+        profiler.__enter__()
+    port = os.environ.get('MARKET_METRICS_PORT')
+    if enabled and port:
+        serve(int(port))
+
+    def finish():
+        if profiler is not None:
+            profiler.__exit__(None, None, None)
+        if enabled:
+            write(name, wall_seconds=round(time.perf_counter() - t0, 6))
+    atexit.register(finish)
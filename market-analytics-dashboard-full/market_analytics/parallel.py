@@ -0,0 +1,49 @@
+# Fans a per-asset function out over a process pool. Failures are collected per asset instead
+# of aborting the batch, and results come back keyed and ordered by asset so outputs built from
+# them are deterministic regardless of which worker finished first. With metrics enabled, what
+# each call recorded in a worker is merged into the parent's registry.
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from market_analytics import metrics
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _call(job):
+    func, key, args, kwargs = job
+    try:
+        return key, True, func(*args, **kwargs), metrics.take()
+    except Exception as e:
+        return key, False, f'{type(e).__name__}: {e}\n{traceback.format_exc()}', metrics.take()
+
+
+def run_parallel(func, tasks, workers=None, chunksize=1, **kwargs):
+    # tasks maps key -> tuple of positional args for func; kwargs are passed to every call.
+    # Returns (results, failures), both dicts sorted by key; failures hold the error text.
+    jobs = [(func, key, tuple(args), kwargs) for key, args in tasks.items()]
+    workers = workers or default_workers()
+    if workers <= 1 or len(jobs) <= 1:
+        outcomes = map(_call, jobs)
+    else:
+        # Forked workers inherit the parent's modules, so func may also live in a script loaded
+        # with market_analytics.scripts; elsewhere it must be an importable module-level function.
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as pool:
+            outcomes = list(pool.map(_call, jobs, chunksize=max(1, chunksize)))
+    results, failures = {}, {}
+    for key, ok, value, recorded in outcomes:
+        metrics.merge(recorded)
+        (results if ok else failures)[key] = value
+    return dict(sorted(results.items())), dict(sorted(failures.items()))
+
+
+def report_failures(failures):
+    for key, err in failures.items():
+        print(f'FAILED {key}: {err.splitlines()[0]}')
+    if failures:
+        print(f'{len(failures)} asset(s) failed')
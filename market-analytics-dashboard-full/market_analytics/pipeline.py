@@ -0,0 +1,249 @@
+# DAG runner with content-hash caching. Each task is fingerprinted from its input files, the
+# source files of its code, its arguments and the fingerprints of the tasks it depends on; a task
+# whose fingerprint matches its last successful run (and whose outputs still exist) is skipped.
+# Input files are hashed by content, but a file whose size and mtime are unchanged reuses its
+# stored hash, so an unchanged tree costs one stat() per file. Ready tasks run concurrently:
+# CPU-bound ones (process=True) on a process pool, the others on threads. Fingerprints, hashes
+# and the timings of the last run are kept in data/store/_pipeline.json. With metrics enabled,
+# each task's run time is also recorded as a span named after its stage (task.<stage>).
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from market_analytics import metrics, parallel, store
+
+STATE_FILE = '_pipeline.json'
+OK = ('ran', 'cached')
+
+
+def _timed(func, args, kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0, metrics.take()
+
+
+class Task:
+    # func(*args, **kwargs); a gather task is called as func({dep: result}, *args, **kwargs) with
+    # the results of the dependencies that ran in this run, and still runs when some of them
+    # failed. inputs and outputs are files or directories; code defaults to func's source file.
+    # always=True tasks (e.g. network fetches) run every time.
+    def __init__(self, name, func, args=(), kwargs=None, deps=(), inputs=(), outputs=(), code=None,
+                 process=False, gather=False, always=False):
+        self.name, self.func, self.args, self.kwargs = name, func, tuple(args), dict(kwargs or {})
+        self.deps, self.inputs, self.outputs = tuple(deps), tuple(inputs), tuple(outputs)
+        self.code = tuple(code) if code is not None else (inspect.getsourcefile(inspect.unwrap(func)),)
+        self.process, self.gather, self.always = process, gather, always
+
+    def __repr__(self):
+        return f'Task({self.name!r}, deps={list(self.deps)})'
+
+
+def state_path(store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, STATE_FILE)
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {'tasks': {}, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+class Hasher:
+    # Content hashes of files and directories, reusing a file's previous hash while its size and
+    # mtime are unchanged. files: {path: [mtime_ns, size, digest]}, persisted with the state.
+    def __init__(self, files):
+        self.files = files
+
+    def file(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 'missing'
+        known = self.files.get(path)
+        if known is not None and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+            metrics.count('pipeline_hash_reused')
+            return known[2]
+        metrics.count('pipeline_hash_computed')
+        metrics.count('pipeline_hash_bytes', st.st_size)
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        self.files[path] = [st.st_mtime_ns, st.st_size, h.hexdigest()]
+        return h.hexdigest()
+
+    def path(self, path):
+        if not os.path.isdir(path):
+            return self.file(path)
+        h = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(f for f in files if not f.startswith('.')):
+                p = os.path.join(root, name)
+                h.update(f'{os.path.relpath(p, path)}={self.file(p)};'.encode())
+        return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, tasks, state_file=None, workers=None):
+        self.tasks = {}
+        for t in tasks:
+            if t.name in self.tasks:
+                raise ValueError(f'Duplicate task {t.name!r}')
+            self.tasks[t.name] = t
+        for t in tasks:
+            for d in t.deps:
+                if d not in self.tasks:
+                    raise KeyError(f'Task {t.name!r} depends on unknown task {d!r}')
+        self.order = self._toposort()
+        self.state_file = state_file or state_path()
+        self.workers = workers or parallel.default_workers()
+
+    def _toposort(self):
+        order, done = [], set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in path:
+                raise ValueError(f"Task dependency cycle: {' -> '.join(path + (name,))}")
+            for d in self.tasks[name].deps:
+                visit(d, path + (name,))
+            done.add(name)
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name, ())
+        return order
+
+    def fingerprint(self, task, hasher, fingerprints, status):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((task.name, task.args, sorted(task.kwargs.items()))).encode())
+        for p in task.code:
+            h.update(f'code:{hasher.file(p)};'.encode())
+        for p in task.inputs:
+            h.update(f'in:{p}={hasher.path(p)};'.encode())
+        for d in task.deps:
+            h.update(f"dep:{d}={fingerprints[d] if status[d] in OK else 'failed'};".encode())
+        return h.hexdigest()
+
+    def run(self, force=False, dry_run=False, log=print):
+        # Runs every task that is out of date. Returns [{task, status, seconds}] in completion
+        # order, seconds being the task's own run time (not its wait for a worker); status is
+        # ran, cached, failed (with error) or blocked (a dependency failed).
+        state = load_state(self.state_file)
+        hasher = Hasher(state.setdefault('files', {}))
+        previous = state.setdefault('tasks', {})
+        fingerprints, status, results, report = {}, {}, {}, []
+        # unfinished dependencies per task; a task is ready once its count drops to zero
+        blocking = {name: len(set(self.tasks[name].deps)) for name in self.order}
+        dependents = {}
+        for name in self.order:
+            for d in set(self.tasks[name].deps):
+                dependents.setdefault(d, []).append(name)
+        ready = deque(name for name in self.order if not blocking[name])
+        running = {}
+
+        def finish(name, outcome, seconds=0.0, error=None):
+            status[name] = outcome
+            row = {'task': name, 'status': outcome, 'seconds': round(seconds, 6)}
+            if error:
+                row['error'] = error
+            report.append(row)
+            metrics.count(f'pipeline_tasks_{outcome}')
+            if outcome == 'ran' and metrics.enabled:
+                metrics.record(f"task.{name.split(':', 1)[0]}", seconds)
+            if log and outcome != 'cached':
+                log(f"  {outcome:<8} {name:<40} {seconds:9.3f}s" + (f'  {error.splitlines()[0]}' if error else ''))
+            for child in dependents.get(name, ()):
+                blocking[child] -= 1
+                if not blocking[child]:
+                    ready.append(child)
+
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        procs = ProcessPoolExecutor(self.workers, mp_context=context) if any(
+            t.process for t in self.tasks.values()) and not dry_run else None
+        if procs is not None:
+            procs.submit(int).result()  # fork the workers before any thread is started
+        threads = ThreadPoolExecutor(self.workers)
+        try:
+            while ready or running:
+                while ready:
+                    name = ready.popleft()
+                    task = self.tasks[name]
+                    if not task.gather and any(status[d] not in OK for d in task.deps):
+                        finish(name, 'blocked')
+                        continue
+                    fingerprints[name] = fp = self.fingerprint(task, hasher, fingerprints, status)
+                    # a gather task always consumes fresh results; in a dry run, anything
+                    # downstream of a task that would run is assumed to run too
+                    upstream_ran = any(status[d] == 'ran' for d in task.deps)
+                    if (not force and not task.always and previous.get(name, {}).get('fingerprint') == fp
+                            and not ((task.gather or dry_run) and upstream_ran)
+                            and all(os.path.exists(p) for p in task.outputs)):
+                        finish(name, 'cached')
+                    elif dry_run:
+                        finish(name, 'ran')
+                    else:
+                        args = task.args
+                        if task.gather:
+                            args = ({d: results[d] for d in task.deps if d in results},) + args
+                        pool = procs if task.process else threads
+                        running[pool.submit(_timed, task.func, args, task.kwargs)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], seconds, recorded = future.result()
+                        metrics.merge(recorded)
+                        finish(name, 'ran', seconds)
+                    except Exception as e:
+                        finish(name, 'failed', error=f'{type(e).__name__}: {e}')
+        finally:
+            threads.shutdown()
+            if procs is not None:
+                procs.shutdown()
+            if not dry_run:
+                self._commit(state, fingerprints, status, report)
+        return report
+
+    def _commit(self, state, fingerprints, status, report):
+        # Records the tasks that ran, except those whose results a gather task has not consumed
+        # yet (it failed or never ran): they must run again to hand their results over.
+        seconds = {r['task']: r['seconds'] for r in report}
+        consumers = {}
+        for t in self.tasks.values():
+            if t.gather:
+                for d in t.deps:
+                    consumers.setdefault(d, []).append(t.name)
+        for name, outcome in status.items():
+            if outcome == 'ran' and all(status.get(c) == 'ran' for c in consumers.get(name, ())):
+                state['tasks'][name] = {'fingerprint': fingerprints[name], 'seconds': seconds[name]}
+            elif outcome == 'failed':
+                state['tasks'].pop(name, None)
+        save_state(state, self.state_file)
+
+
+def summarize(report):
+    # {stage: {status: count, 'seconds': total}}, the stage being the task name up to the first ':'.
+    out = {}
+    for r in report:
+        s = out.setdefault(r['task'].split(':', 1)[0], {'seconds': 0.0})
+        s[r['status']] = s.get(r['status'], 0) + 1
+        s['seconds'] += r['seconds']
+    return out
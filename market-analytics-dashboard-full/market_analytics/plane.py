@@ -0,0 +1,200 @@
+# Shared data plane: every asset's cleaned columns (prices, Volume and the KPIs) as flat
+# memory-mapped arrays, one file per column with the assets' rows back to back. Any number of
+# dashboard processes read them from one copy in the OS page cache instead of each holding its
+# own pandas frames: an asset is a slice of every array, Plane.frame() wraps the slices in a
+# DataFrame without copying (read-only: writing to it raises), and the latest snapshot is the
+# last row of each asset.
+#
+#   data/store/plane/CURRENT            name of the live version directory
+#   data/store/plane/v<n>/plane.json    assets, columns, each asset's store signature and the
+#                                       snapshot's, as of the publish
+#   data/store/plane/v<n>/offsets.npy   int64: asset i's rows are offsets[i]:offsets[i + 1]
+#   data/store/plane/v<n>/Date.npy      datetime64[ns]
+#   data/store/plane/v<n>/<column>.npy  float64 (Volume too, so a missing volume stays NaN)
+#
+# publish() writes a new version and swaps CURRENT atomically, like the returns matrix. Only the
+# assets whose store files changed since the previous version are read again; the others are
+# copied from it. Readers compare the recorded signatures with the store's, so an asset cleaned
+# after the last publish is read from its files until the plane is published again.
+# MARKET_PLANE_DIR moves the plane, e.g. to /dev/shm to keep it in RAM.
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from market_analytics import kpis, metrics, parallel, snapshot, store
+
+PLANE_DIR = os.environ.get('MARKET_PLANE_DIR')
+COLUMNS = list(store.DTYPES) + [k for k in kpis.names() if k not in store.DTYPES]
+_writing = {}  # version directory -> its column files mapped for writing, in this process
+
+
+def plane_dir(store_dir=store.STORE_DIR):
+    return PLANE_DIR or os.path.join(store_dir, 'plane')
+
+
+def _signature(asset, store_dir, clean_dir):
+    # store.signature in the form it takes after a JSON round trip
+    return [list(s) for s in store.signature(asset, store_dir, clean_dir)]
+
+
+def _snapshot_signature(store_dir):
+    sig = snapshot.signature(store_dir)
+    return None if sig is None else list(sig)
+
+
+def _empty(path, dtype):
+    # np.memmap cannot map an empty file
+    np.save(path, np.empty(0, dtype=dtype))
+    return np.load(path)
+
+
+def _current(pdir):
+    try:
+        with open(os.path.join(pdir, 'CURRENT')) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class Plane:
+    def __init__(self, vdir):
+        with open(os.path.join(vdir, 'plane.json')) as f:
+            meta = json.load(f)
+        self.version = os.path.basename(vdir)
+        self.assets, self.columns = meta['assets'], meta['columns']
+        self.signatures, self.snapshot_signature = meta['signatures'], meta['snapshot']
+        self.index = {a: i for i, a in enumerate(self.assets)}
+        self.offsets = np.load(os.path.join(vdir, 'offsets.npy'))
+        # every column is mapped now, so the version stays readable after a publish removes it
+        mode = 'r' if self.offsets[-1] else None
+        self.arrays = {c: np.load(os.path.join(vdir, c + '.npy'), mmap_mode=mode) for c in ['Date'] + self.columns}
+
+    def __contains__(self, asset):
+        return asset in self.index
+
+    def rows(self, asset):
+        i = self.index[asset]
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def current(self, asset, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+        # True if the asset is in the plane and its store files have not changed since.
+        return asset in self.index and self.signatures[asset] == _signature(asset, store_dir, clean_dir)
+
+    def column(self, asset, column):
+        return self.arrays[column][self.rows(asset)]
+
+    def frame(self, asset, columns=None):
+        # The asset's rows as a DataFrame over the mapped arrays (no copy).
+        columns = ['Date'] + self.columns if columns is None else list(columns)
+        rows = self.rows(asset)
+        return pd.DataFrame({c: self.arrays[c][rows] for c in columns}, copy=False)
+
+    def snapshot(self):
+        # Latest-snapshot table (snapshot.COLUMNS, indexed by asset) from each asset's last row.
+        filled = self.offsets[1:] > self.offsets[:-1]
+        last = self.offsets[1:][filled] - 1
+        index = pd.Index([a for a, f in zip(self.assets, filled) if f], name='asset')
+        return pd.DataFrame({c: self.arrays[c][last] for c in snapshot.COLUMNS}, index=index)
+
+
+def signature(store_dir=store.STORE_DIR):
+    # Changes whenever a new version is published; None if nothing has been published.
+    try:
+        st = os.stat(os.path.join(plane_dir(store_dir), 'CURRENT'))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+
+def attach(store_dir=store.STORE_DIR):
+    # The published plane, or None.
+    pdir = plane_dir(store_dir)
+    version = _current(pdir)
+    return None if version is None else Plane(os.path.join(pdir, version))
+
+
+def _open_for_writing(vdir):
+    if vdir not in _writing:
+        _writing.clear()
+        _writing[vdir] = {c: np.load(os.path.join(vdir, c + '.npy'), mmap_mode='r+') for c in ['Date'] + COLUMNS}
+    return _writing[vdir]
+
+
+def write_asset(asset, lo, hi, vdir, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Pool worker: reads an asset into rows lo:hi of a version's column files.
+    arrays = store.read_columns(asset, ['Date'] + COLUMNS, store_dir)
+    if arrays is None or any(c not in arrays for c in kpis.REGISTRY):
+        # a CSV, or stored without some KPIs: read_asset computes them
+        stored = set(store.stored_columns(asset, store_dir, clean_dir))
+        df = store.read_asset(asset, ['Date'] + [c for c in COLUMNS if c in stored or c in kpis.REGISTRY],
+                              store_dir, clean_dir)
+        arrays = {c: df[c].to_numpy('float64', na_value=np.nan) for c in df if c != 'Date'}
+        arrays['Date'] = df['Date'].to_numpy('datetime64[ns]')
+    if len(arrays['Date']) != hi - lo:
+        raise RuntimeError(f'{asset} changed while the plane was being published; publish again')
+    out = _open_for_writing(vdir)
+    for c in out:
+        out[c][lo:hi] = arrays[c] if c in arrays else np.nan
+    return hi - lo
+
+
+@metrics.timed('plane.publish')
+def publish(assets=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR, full=False, workers=None):
+    # Publishes the assets (default: every stored one) as a new version. Unless full=True, assets
+    # whose store signature is unchanged are copied from the previous version; the others are
+    # read over the process pool, each worker writing its rows straight into the column files.
+    # Returns (version directory, assets read).
+    assets = store.list_assets(store_dir, clean_dir) if assets is None else sorted(assets)
+    prev = None if full else attach(store_dir)
+    if prev is not None and prev.columns != COLUMNS:
+        prev = None
+    sigs = {a: _signature(a, store_dir, clean_dir) for a in assets}
+    reuse = {a for a in assets if prev is not None and a in prev and prev.signatures[a] == sigs[a]}
+    snap_sig = _snapshot_signature(store_dir)
+    lengths = [prev.rows(a).stop - prev.rows(a).start if a in reuse else store.row_count(a, store_dir, clean_dir)
+               for a in assets]
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype='int64')]).astype('int64')
+
+    pdir = plane_dir(store_dir)
+    os.makedirs(pdir, exist_ok=True)
+    versions = sorted((d for d in os.listdir(pdir) if d.startswith('v') and d[1:].isdigit()), key=lambda d: int(d[1:]))
+    version = f'v{int(versions[-1][1:]) + 1 if versions else 1}'
+    vdir = os.path.join(pdir, version)
+    os.makedirs(vdir)
+    np.save(os.path.join(vdir, 'offsets.npy'), offsets)
+    total = int(offsets[-1])
+    out = {}
+    for c, dtype in [('Date', 'datetime64[ns]')] + [(c, 'float64') for c in COLUMNS]:
+        path = os.path.join(vdir, c + '.npy')
+        out[c] = np.lib.format.open_memmap(path, 'w+', dtype, (total,)) if total else _empty(path, dtype)
+    kept = [i for i, a in enumerate(assets) if a in reuse]
+    if kept:  # one gather per column
+        dst = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in kept])
+        src = np.concatenate([np.arange(prev.rows(assets[i]).start, prev.rows(assets[i]).stop) for i in kept])
+        for c in out:
+            out[c][dst] = prev.arrays[c][src]
+    del out
+    tasks = {a: (a, int(offsets[i]), int(offsets[i + 1]), vdir) for i, a in enumerate(assets) if a not in reuse}
+    workers = workers or parallel.default_workers()
+    _, failures = parallel.run_parallel(write_asset, tasks, workers, chunksize=max(1, len(tasks) // (workers * 4)),
+                                        store_dir=store_dir, clean_dir=clean_dir)
+    _writing.clear()
+    if failures:
+        shutil.rmtree(vdir, ignore_errors=True)
+        asset, err = next(iter(failures.items()))
+        raise RuntimeError(f'plane not published: {asset}: {err.splitlines()[0]}')
+    with open(os.path.join(vdir, 'plane.json'), 'w') as f:
+        json.dump({'assets': assets, 'columns': COLUMNS, 'signatures': sigs, 'snapshot': snap_sig}, f)
+
+    current = _current(pdir)
+    with open(os.path.join(pdir, 'CURRENT.tmp'), 'w') as f:
+        f.write(version)
+    os.replace(os.path.join(pdir, 'CURRENT.tmp'), os.path.join(pdir, 'CURRENT'))
+    # keep the version that was current for readers that resolved CURRENT before the swap
+    for d in versions:
+        if d != current:
+            shutil.rmtree(os.path.join(pdir, d), ignore_errors=True)
+    metrics.count('plane_assets_read', len(tasks))
+    return vdir, list(tasks)
@@ -0,0 +1,226 @@
+# Out-of-core queries over the whole cleaned store: every asset's Parquet parts (and the legacy
+# data/cleaned/<name>_clean.csv files of assets not in the store) scanned as one pyarrow dataset
+# with an `asset` partition column. Scans decode only the columns asked for, and predicates are
+# pushed down: a filter on `asset` prunes whole partitions, and a filter on Date or a KPI skips
+# row groups using their min/max statistics. Rows are streamed in batches, so the history may be
+# larger than memory; only the result is materialized.
+#
+#   query.scan(['Close'], where=[('Volatility_30', '>', 0.02)], start='2024-01-01')
+#   query.screen([('Volatility_30', '>', 0.02), ('Spread', '<', 0.01)], date='2024-06-28')
+#   query.aggregate({'vol': ('Volatility_30', 'mean')}, start='2024-01-01')
+#   query.drawdowns(20, start='2024-01-01')
+#
+# Every function takes `data`, a dataset() to reuse between queries (the dashboard keeps one per
+# store version in its FrameCache). Parquet footers are then read once and kept, and later scans
+# skip the row groups whose statistics rule the predicate out without opening their files.
+#
+# `where` is a pyarrow expression (pyarrow.dataset.field('Spread') < 0.01) or filters in the
+# pandas / pyarrow.parquet form: [(column, op, value), ...] ANDed, or a list of such lists ORed.
+# Columns an asset was stored without (e.g. a KPI registered after it was cleaned) read as null.
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.acero as acero
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from market_analytics import metrics, store
+
+# Volume is read as float64: assets with missing volumes store it as float
+SCHEMA = pa.schema([('asset', pa.string()), ('Date', pa.timestamp('ns'))]
+                   + [(c, pa.float64()) for c in store.DTYPES])
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max', 'stddev', 'variance')
+
+
+def signature(store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Changes whenever any file the dataset reads is added, replaced or removed.
+    return tuple(store.signature(a, store_dir, clean_dir) for a in store.list_assets(store_dir, clean_dir))
+
+
+def dataset(store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Every asset as one dataset; the file list comes from the store layout, so no file is
+    # opened until a scan needs it.
+    files = {'parquet': ([], []), 'csv': ([], [])}
+    for asset in store.list_assets(store_dir, clean_dir):
+        for path, _, _ in store.signature(asset, store_dir, clean_dir):
+            paths, partitions = files['csv' if path.endswith('.csv') else 'parquet']
+            paths.append(path)
+            partitions.append(ds.field('asset') == asset)
+    formats = {'parquet': ds.ParquetFileFormat(), 'csv': ds.CsvFileFormat()}
+    children = [ds.FileSystemDataset.from_paths(paths, schema=SCHEMA, format=formats[kind],
+                                                filesystem=pa.fs.LocalFileSystem(), partitions=partitions)
+                for kind, (paths, partitions) in files.items() if paths]
+    if not children:
+        return ds.dataset(pa.table({f.name: pa.array([], f.type) for f in SCHEMA}))
+    return children[0] if len(children) == 1 else ds.dataset(children)
+
+
+def _pruned(data, expr):
+    # data narrowed to the row groups whose min/max statistics may match expr.
+    if expr is None:
+        return data
+    if isinstance(data, ds.UnionDataset):
+        return ds.dataset([_pruned(child, expr) for child in data.children])
+    if not isinstance(data, ds.FileSystemDataset) or not isinstance(data.format, ds.ParquetFileFormat):
+        return data
+    fragments = [rg for f in data.get_fragments(filter=expr) for rg in f.split_by_row_group(expr, schema=data.schema)]
+    return ds.FileSystemDataset(fragments, data.schema, data.format, data.filesystem)
+
+
+def _source(data, expr, store_dir, clean_dir):
+    # A fresh dataset is scanned as it is (pruning would read every footer first anyway).
+    return dataset(store_dir, clean_dir) if data is None else _pruned(data, expr)
+
+
+def expression(where):
+    if where is None or isinstance(where, ds.Expression):
+        return where
+    return pq.filters_to_expression(where) if len(where) else None
+
+
+def _filter(where=None, start=None, end=None, assets=None):
+    # One expression for the predicate, the [start, end] Date range and the asset list.
+    parts = [expression(where)]
+    if start is not None:
+        parts.append(ds.field('Date') >= pd.Timestamp(start))
+    if end is not None:
+        parts.append(ds.field('Date') <= pd.Timestamp(end))
+    if assets is not None:
+        parts.append(ds.field('asset').isin(list(assets)))
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    expr = parts[0]
+    for p in parts[1:]:
+        expr = expr & p
+    return expr
+
+
+def _columns(columns):
+    # asset and Date first, then the requested columns in order.
+    if columns is None:
+        return SCHEMA.names
+    return list(dict.fromkeys(['asset', 'Date'] + list(columns)))
+
+
+def _frame(table):
+    metrics.count('query_rows', table.num_rows)
+    return table.to_pandas()
+
+
+@metrics.timed('query.scan')
+def scan(columns=None, where=None, start=None, end=None, assets=None, data=None,
+         store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Rows matching `where` between start and end (inclusive), as a DataFrame with asset and
+    # Date followed by `columns` (default: every column).
+    expr = _filter(where, start, end, assets)
+    return _frame(_source(data, expr, store_dir, clean_dir).to_table(columns=_columns(columns), filter=expr))
+
+
+@metrics.timed('query.aggregate')
+def aggregate(aggs, by=('asset',), where=None, start=None, end=None, assets=None, data=None,
+              store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Grouped aggregates over the matching rows: aggs maps an output name to (column, function),
+    # function one of AGGREGATES, and `by` lists the group columns (() for one row over
+    # everything). Rows are folded in as they are scanned, so memory grows with the number of
+    # groups, not of rows.
+    by = list(by)
+    for column, func in aggs.values():
+        if func not in AGGREGATES:
+            raise ValueError(f'Unknown aggregate {func!r} for {column}; expected one of {AGGREGATES}')
+    prefix = 'hash_' if by else ''
+    expr = _filter(where, start, end, assets)
+    read = list(dict.fromkeys(by + [column for column, _ in aggs.values()]))
+    options = acero.ScanNodeOptions(_source(data, expr, store_dir, clean_dir), columns=read, filter=expr)
+    plan = [acero.Declaration('scan', options)]
+    if expr is not None:  # the scan only prunes with the filter; rows still have to be dropped
+        plan.append(acero.Declaration('filter', acero.FilterNodeOptions(expr)))
+    plan.append(acero.Declaration('project', acero.ProjectNodeOptions([pc.field(c) for c in read], read)))
+    plan.append(acero.Declaration('aggregate', acero.AggregateNodeOptions(
+        [(column, prefix + func, None, name) for name, (column, func) in aggs.items()], keys=by)))
+    df = _frame(acero.Declaration.from_sequence(plan).to_table(use_threads=True))
+    return df.set_index(by).sort_index() if by else df
+
+
+def latest_date(assets=None, data=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    df = aggregate({'Date': ('Date', 'max')}, by=(), assets=assets, data=data, store_dir=store_dir, clean_dir=clean_dir)
+    return None if df.empty or pd.isna(df['Date'].iloc[0]) else pd.Timestamp(df['Date'].iloc[0])
+
+
+@metrics.timed('query.screen')
+def screen(where=None, date=None, columns=None, assets=None, data=None,
+           store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Assets whose row on `date` (default: the latest date in the store; with intraday bars,
+    # the day's last bar) matches `where`, one row per asset. Only that day's row groups are
+    # decoded; the predicate is then applied to each asset's row of the day.
+    if date is None:
+        date = latest_date(assets, data, store_dir, clean_dir)
+        if date is None:
+            return pd.DataFrame(columns=_columns(columns)).set_index('asset')
+    date = pd.Timestamp(date).normalize()
+    expr = expression(where)
+    read = SCHEMA.names if columns is None else _columns(columns)
+    if expr is not None and columns is not None:
+        if isinstance(where, ds.Expression):  # the columns it refers to are not listed: read them all
+            read = SCHEMA.names
+        else:
+            terms = [t for group in where for t in (group if isinstance(group[0], (list, tuple)) else [group])]
+            read = list(dict.fromkeys(read + [t[0] for t in terms]))
+    day = _filter(None, date, date + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns'), assets)
+    table = _source(data, day, store_dir, clean_dir).to_table(columns=read, filter=day)
+    if table.num_rows:
+        # each asset's last row of the day
+        order = pc.sort_indices(table, [('asset', 'ascending'), ('Date', 'ascending')])
+        table = table.take(order)
+        asset = table['asset']
+        last = pc.not_equal(asset.slice(0, len(asset) - 1), asset.slice(1))
+        table = table.filter(pa.concat_arrays([last.combine_chunks(), pa.array([True])]))
+        if expr is not None:
+            table = table.filter(expr)
+    df = _frame(table.select(_columns(columns) if columns is not None else SCHEMA.names))
+    return df.set_index('asset')
+
+
+class _Drawdown:
+    # Running maximum drawdown of one price series fed in Date order, batch by batch.
+    def __init__(self):
+        self.peak, self.peak_date = np.nan, None
+        self.worst, self.worst_peak, self.trough, self.current = 0.0, None, None, np.nan
+
+    def add(self, dates, close):
+        ok = ~np.isnan(close)
+        if not ok.any():
+            return
+        dates, close = dates[ok], close[ok]
+        if self.peak_date is not None:  # carry the peak so far in as a first row
+            dates = np.concatenate([[self.peak_date], dates])
+            close = np.concatenate([[self.peak], close])
+        peaks = np.maximum.accumulate(close)
+        dd = close / peaks - 1
+        trough = int(np.argmin(dd))
+        if dd[trough] < self.worst:
+            self.worst, self.trough = float(dd[trough]), dates[trough]
+            self.worst_peak = dates[int(np.argmax(close[:trough + 1]))]
+        top = int(np.argmax(close))
+        self.peak, self.peak_date, self.current = close[top], dates[top], float(dd[-1])
+
+
+@metrics.timed('query.drawdowns')
+def drawdowns(n=20, start=None, end=None, assets=None, column='Close', data=None,
+              store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # The n assets with the deepest peak-to-trough fall of `column` between start and end (peak
+    # and trough both inside the range), worst first. One ordered pass over the range: each
+    # batch holds one asset's consecutive rows and only a running state per asset is kept.
+    expr = _filter(None, start, end, assets)
+    running = {}
+    for batch in _source(data, expr, store_dir, clean_dir).to_batches(columns=['asset', 'Date', column], filter=expr):
+        if batch.num_rows:
+            name = batch.column(0)[0].as_py()
+            running.setdefault(name, _Drawdown()).add(batch.column(1).to_numpy(),
+                                                      batch.column(2).to_numpy(zero_copy_only=False))
+    rows = [(name, d.worst * 100, d.worst_peak, d.trough, d.current * 100)
+            for name, d in running.items() if d.trough is not None]
+    df = pd.DataFrame(rows, columns=['asset', 'drawdown_pct', 'peak', 'trough', 'current_pct'])
+    df['peak'], df['trough'] = pd.to_datetime(df['peak']), pd.to_datetime(df['trough'])
+    return df.sort_values('drawdown_pct', kind='stable').head(n).reset_index(drop=True)
@@ -0,0 +1,240 @@
+# Date-aligned daily returns matrix (assets x dates, float64, NaN where an asset has no bar)
+# kept next to the store by the cleaning stage, plus vectorized correlations over any subset.
+#
+#   data/store/returns/CURRENT          name of the live version directory
+#   data/store/returns/v<n>/values.npy  float64 matrix, memory-mapped by readers
+#   data/store/returns/v<n>/dates.npy   datetime64[ns] axis
+#   data/store/returns/v<n>/assets.json row order
+#
+# New versions are written to a fresh directory and published by atomically replacing CURRENT,
+# so readers never see a half-written matrix. Each version also holds the trading calendar of its
+# axis (market_analytics/calendars.py), which aligns assets of different markets.
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from market_analytics import calendars, metrics, store
+
+RETURNS_DIR = 'returns'
+
+
+def returns_dir(store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, RETURNS_DIR)
+
+
+class ReturnsMatrix:
+    def __init__(self, assets, dates, values, calendar=None):
+        self.assets = list(assets)
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.values = values
+        self.index = {a: i for i, a in enumerate(self.assets)}
+        self._calendar = calendar
+
+    def __contains__(self, asset):
+        return asset in self.index
+
+    @property
+    def calendar(self):
+        # Sessions of every asset's market on this axis: loaded with a published matrix, else
+        # derived from the values on first use.
+        if self._calendar is None:
+            self._calendar = calendars.build(self)
+        return self._calendar
+
+    def position(self, dates):
+        # Integer positions of dates on the axis (-1 where a date is not on it).
+        return self.calendar.position(dates)
+
+    def _span(self, start, end):
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), 'ns'))
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), 'ns'), 'right')
+        return lo, hi
+
+    def frame(self, assets=None):
+        # Dates x assets DataFrame (a copy) for the requested rows.
+        assets = self.assets if assets is None else list(assets)
+        rows = [self.index[a] for a in assets]
+        return pd.DataFrame(np.asarray(self.values[rows]).T, index=pd.DatetimeIndex(self.dates, name='Date'),
+                            columns=assets)
+
+    def aligned(self, assets=None, on='common', fill=False, start=None, end=None):
+        # Returns of the selected assets on one set of sessions, each compounded over the dates
+        # since the previous one, so a holiday in one market carries its other markets' return
+        # to the next shared session instead of dropping it.
+        #   on='common':  dates on which every selected asset's market traded
+        #   on='union':   every date of the axis
+        #   on=<market>:  that market's sessions
+        #   fill=True:    0 (price carried forward) instead of NaN where an asset's market had no
+        #                 session since the previous date; missing bars stay NaN either way
+        assets = self.assets if assets is None else list(assets)
+        cal = self.calendar
+        markets = [cal.market(a) for a in assets]
+        if on == 'common':
+            targets = cal.open(markets, 'all')
+        elif on == 'union':
+            targets = np.arange(len(self.dates))
+        else:
+            targets = cal.open([on])
+        lo, hi = self._span(start, end)
+        keep = (targets >= lo) & (targets < hi)
+        prev = np.concatenate([[-1], targets[:-1]])[keep]
+        pos = targets[keep]
+        end_at = pos[-1] + 1 if len(pos) else 0
+        x = np.asarray(self.values[[self.index[a] for a in assets], :end_at], dtype='float64')
+        seen = ~np.isnan(x)
+        growth = np.cumsum(np.log1p(np.where(seen, x, 0.0)), axis=1)
+        count = np.cumsum(seen, axis=1)
+        # cumulative value at each position (0 before the axis): differences give (prev, pos]
+        at = lambda c, p: np.where(p >= 0, c[:, np.maximum(p, 0)], 0)
+        with np.errstate(invalid='ignore'):
+            out = np.expm1(at(growth, pos) - at(growth, prev))
+        unseen = at(count, pos) - at(count, prev) == 0
+        out[unseen] = np.nan
+        if fill:
+            sessions = cal.counts()[[cal.index[m] for m in markets]]
+            out[unseen & (at(sessions, pos) - at(sessions, prev) == 0)] = 0.0
+        return pd.DataFrame(out.T, index=pd.DatetimeIndex(self.dates[pos], name='Date'), columns=assets)
+
+    def correlation(self, assets=None, method='pairwise', window=None, halflife=None, start=None, end=None):
+        # Pearson correlation of the selected assets in one vectorized pass.
+        #   method='pairwise': each pair uses the dates where both assets have a return
+        #   method='inner':    only dates where every selected asset has a return (like an inner join)
+        #   method='sessions': returns compounded onto the sessions all the assets' markets share
+        #                      (aligned()), correct across markets with different holidays
+        #   window=N:          only the last N dates (sessions) of the (start/end-filtered) axis
+        #   halflife=H:        exponentially weighted, weights halving every H dates back from the end
+        assets = self.assets if assets is None else list(assets)
+        if method == 'sessions':
+            x = self.aligned(assets, start=start, end=end).to_numpy().T
+            if window is not None:
+                x = x[:, -window:]
+            return pd.DataFrame(corr_matrix(x, 'pairwise', halflife), index=assets, columns=assets)
+        lo, hi = self._span(start, end)
+        if window is not None:
+            lo = max(lo, hi - window)
+        x = np.asarray(self.values[[self.index[a] for a in assets], lo:hi], dtype='float64')
+        return pd.DataFrame(corr_matrix(x, method, halflife), index=assets, columns=assets)
+
+
+def corr_matrix(x, method='pairwise', halflife=None):
+    # x: k x T array with NaNs for missing observations. Returns a k x k array.
+    mask = ~np.isnan(x)
+    if method == 'inner':
+        keep = mask.all(axis=0)
+        x, mask = x[:, keep], mask[:, keep]
+    elif method != 'pairwise':
+        raise ValueError(f"method must be 'pairwise' or 'inner', not {method!r}")
+    t = x.shape[1]
+    w = np.ones(t) if halflife is None else 0.5 ** ((t - 1 - np.arange(t)) / halflife)
+    # Centering by each row's mean does not change correlations but keeps the moment sums small.
+    x0 = np.where(mask, x, 0.0)
+    x0 = np.where(mask, x0 - x0.sum(axis=1, keepdims=True) / np.maximum(mask.sum(axis=1, keepdims=True), 1), 0.0)
+    m = mask.astype('float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mw, xw = m * w, x0 * w
+        n = mw @ m.T                   # weight of the dates both assets share
+        sx = xw @ m.T                  # sum of x_i over those dates
+        sxx = (xw * x0) @ m.T          # sum of x_i^2 over those dates
+        sxy = xw @ x0.T                # sum of x_i * x_j
+        cov = sxy / n - (sx / n) * (sx.T / n)
+        var_i = sxx / n - (sx / n) ** 2
+        var_j = sxx.T / n - (sx.T / n) ** 2
+        corr = cov / np.sqrt(var_i * var_j)
+    # at least two shared observations are needed for a correlation
+    obs = m @ m.T
+    corr[obs < 2] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    diag = np.diag(obs) >= 2
+    corr[np.diag_indices_from(corr)] = np.where(diag, 1.0, np.nan)
+    return corr
+
+
+def signature(store_dir=store.STORE_DIR):
+    # Changes whenever a new version is published; None if nothing has been published.
+    try:
+        st = os.stat(os.path.join(returns_dir(store_dir), 'CURRENT'))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+
+def load(store_dir=store.STORE_DIR, mmap=True):
+    # Returns the published matrix (memory-mapped) or None if it has not been built.
+    rdir = returns_dir(store_dir)
+    current = os.path.join(rdir, 'CURRENT')
+    if not os.path.exists(current):
+        return None
+    with open(current) as f:
+        vdir = os.path.join(rdir, f.read().strip())
+    with open(os.path.join(vdir, 'assets.json')) as f:
+        assets = json.load(f)
+    values = np.load(os.path.join(vdir, 'values.npy'), mmap_mode='r' if mmap else None)
+    dates = np.load(os.path.join(vdir, 'dates.npy'))
+    return ReturnsMatrix(assets, dates, values, calendars.load(vdir, dates))
+
+
+def build(assets=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # Builds the matrix in memory from the store, reading only Date and Daily_Return per asset.
+    assets = store.list_assets(store_dir, clean_dir) if assets is None else list(assets)
+    series = {}
+    for a in assets:
+        d = store.read_asset(a, columns=['Date', 'Daily_Return'], store_dir=store_dir, clean_dir=clean_dir)
+        series[a] = (d['Date'].to_numpy('datetime64[ns]'), d['Daily_Return'].to_numpy('float64'))
+    return merge(None, series)
+
+
+def merge(rm, series, replace=True):
+    # Returns a new matrix with series ({asset: (dates, returns)}) merged into rm (may be None).
+    # replace=True drops an asset's previous row first (full re-clean); otherwise the new values
+    # only overwrite the dates they cover (incremental append).
+    old_dates = rm.dates if rm is not None else np.array([], dtype='datetime64[ns]')
+    dates = np.unique(np.concatenate([old_dates] + [d for d, _ in series.values()]))
+    assets = (rm.assets if rm is not None else []) + sorted(a for a in series if rm is None or a not in rm)
+    values = np.full((len(assets), len(dates)), np.nan)
+    if rm is not None and len(rm.assets):
+        values[:len(rm.assets), np.searchsorted(dates, old_dates)] = rm.values
+    index = {a: i for i, a in enumerate(assets)}
+    for a, (d, r) in series.items():
+        if replace:
+            values[index[a]] = np.nan
+        values[index[a], np.searchsorted(dates, d)] = r
+    return ReturnsMatrix(assets, dates, values)
+
+
+def publish(rm, store_dir=store.STORE_DIR):
+    rdir = returns_dir(store_dir)
+    os.makedirs(rdir, exist_ok=True)
+    versions = sorted((d for d in os.listdir(rdir) if d.startswith('v') and d[1:].isdigit()), key=lambda d: int(d[1:]))
+    version = f'v{int(versions[-1][1:]) + 1 if versions else 1}'
+    vdir = os.path.join(rdir, version)
+    os.makedirs(vdir)
+    np.save(os.path.join(vdir, 'values.npy'), np.ascontiguousarray(rm.values, dtype='float64'))
+    np.save(os.path.join(vdir, 'dates.npy'), rm.dates)
+    with open(os.path.join(vdir, 'assets.json'), 'w') as f:
+        json.dump(rm.assets, f)
+    calendars.save(calendars.build(rm, calendars.market_map(store_dir)), vdir)
+    with open(os.path.join(rdir, 'CURRENT.tmp'), 'w') as f:
+        f.write(version)
+    os.replace(os.path.join(rdir, 'CURRENT.tmp'), os.path.join(rdir, 'CURRENT'))
+    # Keep the previous version for readers that resolved CURRENT just before the swap; older
+    # ones are unreachable (processes that still map them keep their pages until they close).
+    for d in versions[:-1]:
+        shutil.rmtree(os.path.join(rdir, d), ignore_errors=True)
+    return vdir
+
+
+@metrics.timed('returns.update')
+def update(series, store_dir=store.STORE_DIR, replace=True):
+    # Merges freshly cleaned returns into the published matrix and publishes the result.
+    rm = merge(load(store_dir, mmap=False), series, replace)
+    publish(rm, store_dir)
+    return rm
+
+
+def get(store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # The published matrix, or one built in memory when the cleaning stage has not published any
+    # (e.g. only the bundled demo CSVs are present).
+    rm = load(store_dir)
+    return rm if rm is not None else build(store_dir=store_dir, clean_dir=clean_dir)
@@ -0,0 +1,326 @@
+# Cross-asset risk engine over the date-aligned returns matrix (market_analytics.returns):
+# trailing-window and EWMA covariance matrices, every asset's beta to a benchmark (default nifty)
+# and the 1-day historical / parametric VaR of a portfolio (equal-weighted by default).
+#
+# Covariances are pairwise-complete like returns.corr_matrix: each pair uses the dates on which
+# both assets have a return. The engine keeps the moment sums they are built from (shared
+# observations, sum of x_i over the dates shared with j, sum of x_i * x_j) for the trailing
+# window and exponentially weighted, so new days are added, and the days leaving the window
+# dropped, as one rank-k matrix product per sum: O(N^2) per new day instead of recomputing the
+# whole history. A run starts over when the assets, the settings or any return it already
+# processed changed.
+#
+#   data/store/risk/CURRENT               name of the live version directory
+#   data/store/risk/v<n>/meta.json        assets, settings and a hash of the processed returns
+#   data/store/risk/v<n>/dates.npy        datetime64[ns] axis
+#   data/store/risk/v<n>/<sum>.npy        moment sums, N x N (memory-mapped by readers)
+#   data/store/risk/v<n>/beta_rolling.npy, beta_ewma.npy   betas, assets x dates
+#   data/store/risk/v<n>/var.parquet      portfolio return and VaR per date
+#
+# Versions are published like the returns matrix: written to a fresh directory, then CURRENT is
+# replaced atomically.
+import hashlib
+import json
+import os
+import shutil
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from market_analytics import metrics, returns, store
+
+RISK_DIR = 'risk'
+WINDOW = 252  # trailing dates for the rolling covariances, betas and historical VaR
+HALFLIFE = 11.2  # EWMA half-life in dates (RiskMetrics' daily lambda of 0.94)
+BENCHMARK = 'nifty'
+LEVELS = (0.95, 0.99)
+# window sums, then EWMA sums; ew_obs counts shared observations over the whole history
+SUMS = ('n', 'sx', 'sxy', 'ew_n', 'ew_sx', 'ew_sxy', 'ew_obs')
+COUNTS = ('n', 'ew_obs')  # stored as int32
+VAR_COLUMNS = ['portfolio_return'] + [f'{kind}_var_{int(level * 100)}' for kind in ('hist', 'param', 'ewma')
+                                      for level in LEVELS]
+
+
+def risk_dir(store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, RISK_DIR)
+
+
+def _masked(values):
+    x = np.asarray(values, dtype='float64')
+    m = ~np.isnan(x)
+    return np.where(m, x, 0.0), m.astype('float64')
+
+
+def _cov(n, sx, sxy, ddof, obs=None):
+    # Pairwise covariance from moment sums (sx[i, j]: sum of x_i over the dates shared with j);
+    # NaN for pairs with fewer than two shared observations.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sx * sx.T
+        cov /= n
+        np.subtract(sxy, cov, out=cov)
+        cov /= n - ddof
+    cov[(n if obs is None else obs) < 2] = np.nan
+    return cov
+
+
+def _beta(n, si, sb, sib, sbb, obs=None):
+    # Beta of each asset to the benchmark from the sums over their shared dates: n, sum x_i,
+    # sum x_b, sum x_i * x_b, sum x_b^2 (the ddof cancels).
+    with np.errstate(invalid='ignore', divide='ignore'):
+        beta = (sib - si * sb / n) / (sbb - sb * sb / n)
+    beta[((n if obs is None else obs) < 2) | ~np.isfinite(beta)] = np.nan
+    return beta
+
+
+def portfolio_weights(assets, weights=None):
+    # Weight per asset (fractions of portfolio value): equal by default, else {asset: weight}
+    # with 0 for assets not listed.
+    if weights is None:
+        return np.full(len(assets), 1.0 / len(assets)) if assets else np.zeros(0)
+    return np.array([float(weights.get(a, 0.0)) for a in assets])
+
+
+def history_hash(rm, t):
+    # Hash of the first t dates of a returns matrix, to tell whether processed history changed.
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(rm.assets).encode())
+    h.update(np.ascontiguousarray(rm.dates[:t]).tobytes())
+    h.update(np.ascontiguousarray(rm.values[:, :t], dtype='float64').tobytes())
+    return h.hexdigest()
+
+
+class RiskEngine:
+    def __init__(self, assets, window=WINDOW, halflife=HALFLIFE, benchmark=BENCHMARK, weights=None):
+        self.assets = list(assets)
+        self.index = {a: i for i, a in enumerate(self.assets)}
+        self.window, self.halflife, self.benchmark = int(window), float(halflife), benchmark
+        self.decay = 0.5 ** (1 / self.halflife)
+        self.weights = portfolio_weights(self.assets, weights)
+        k = len(self.assets)
+        self.sums = {s: np.zeros((k, k)) for s in SUMS}
+        # EWMA sums of each asset against the benchmark (n, x_i, x_b, x_i x_b, x_b^2), then the
+        # undecayed count of shared observations
+        self.ew_beta = np.zeros((6, k))
+        self.dates = np.array([], dtype='datetime64[ns]')
+        self.beta_rolling = np.empty((k, 0))
+        self.beta_ewma = np.empty((k, 0))
+        self.var = pd.DataFrame({c: pd.Series(dtype='float64') for c in VAR_COLUMNS},
+                                index=pd.DatetimeIndex([], name='Date'))
+        self.hash = None
+
+    def config(self):
+        return {'window': self.window, 'halflife': self.halflife, 'benchmark': self.benchmark,
+                'weights': self.weights.tolist()}
+
+    def advance(self, rm):
+        # Processes the dates of rm after the ones already seen; rm must hold the same assets
+        # and, for those dates, the same returns (see update()). Returns the number of new dates.
+        t0, t1, w = len(self.dates), len(rm.dates), self.window
+        if t1 <= t0:
+            return 0
+        base = max(0, t0 - w)  # columns from here on: the days that may leave the window + new ones
+        x, m = _masked(rm.values[:, base:t1])
+        new = slice(t0 - base, t1 - base)
+        s = self.sums
+        # window sums: one rank-k update per sum, [added, -dropped] @ [added, dropped]^T
+        if t1 - t0 >= w:
+            for name in ('n', 'sx', 'sxy'):
+                s[name][:] = 0.0
+            add, drop = slice(t1 - w - base, t1 - base), slice(0, 0)
+        else:
+            add, drop = new, slice(0, max(0, t1 - w) - base)
+        xs, ms = np.hstack([x[:, add], x[:, drop]]), np.hstack([m[:, add], m[:, drop]])
+        xsign, msign = np.hstack([x[:, add], -x[:, drop]]), np.hstack([m[:, add], -m[:, drop]])
+        s['n'] += msign @ ms.T
+        s['sx'] += xsign @ ms.T
+        s['sxy'] += xsign @ xs.T
+        # EWMA sums: decay by lambda^k, then add the new days weighted lambda^(age)
+        xn, mn = x[:, new], m[:, new]
+        k = xn.shape[1]
+        wts = self.decay ** np.arange(k - 1, -1, -1)
+        for name in ('ew_n', 'ew_sx', 'ew_sxy'):
+            s[name] *= self.decay ** k
+        s['ew_n'] += (mn * wts) @ mn.T
+        s['ew_sx'] += (xn * wts) @ mn.T
+        s['ew_sxy'] += (xn * wts) @ xn.T
+        s['ew_obs'] += mn @ mn.T
+
+        self.beta_rolling = np.hstack([self.beta_rolling, self._rolling_betas(x, m, new)])
+        self.beta_ewma = np.hstack([self.beta_ewma, self._ewma_betas(x, m, new)])
+        var = self._var(x, new, rm.dates[t0:t1])
+        self.var = pd.concat([self.var, var]) if len(self.var) else var
+        self.dates = np.asarray(rm.dates[:t1], dtype='datetime64[ns]')
+        metrics.count('risk_dates', k)
+        return k
+
+    def _benchmark_terms(self, x, m):
+        b = self.index[self.benchmark]
+        xb, mb = x[b], m[b]
+        return np.stack([m * mb, x * mb, m * xb, x * xb, m * xb * xb])
+
+    def _rolling_betas(self, x, m, new):
+        if self.benchmark not in self.index:
+            return np.full((len(self.assets), new.stop - new.start), np.nan)
+        c = np.cumsum(self._benchmark_terms(x, m), axis=2)
+        cols = np.arange(new.start, new.stop)
+        prev = cols - self.window
+        win = c[:, :, cols] - np.where(prev >= 0, c[:, :, np.maximum(prev, 0)], 0.0)
+        return _beta(*win)
+
+    def _ewma_betas(self, x, m, new):
+        out = np.full((len(self.assets), new.stop - new.start), np.nan)
+        if self.benchmark not in self.index:
+            return out
+        terms = self._benchmark_terms(x[:, new], m[:, new])
+        e = self.ew_beta
+        for j in range(terms.shape[2]):
+            e[:5] *= self.decay
+            e[:5] += terms[:, :, j]
+            e[5] += terms[0, :, j]
+            out[:, j] = _beta(*e[:5], obs=e[5])
+        return out
+
+    def _var(self, x, new, dates):
+        # Historical VaR for every new date (needs a full window), parametric VaR for the last one.
+        rp = self.weights @ x
+        out = pd.DataFrame(np.nan, index=pd.DatetimeIndex(dates, name='Date'), columns=VAR_COLUMNS)
+        out['portfolio_return'] = rp[new]
+        cols = np.arange(new.start, new.stop)
+        full = cols >= self.window - 1
+        if full.any():
+            windows = sliding_window_view(rp, self.window)[cols[full] - self.window + 1]
+            q = -np.quantile(windows, [1 - level for level in LEVELS], axis=1)
+            for level, values in zip(LEVELS, q):
+                out.loc[out.index[full], f'hist_var_{int(level * 100)}'] = values
+        for kind, (mean, cov) in (('param', self._moments('rolling')), ('ewma', self._moments('ewma'))):
+            mu, sigma = self.weights @ mean, np.sqrt(max(float(self.weights @ cov @ self.weights), 0.0))
+            for level in LEVELS:
+                out.iloc[-1, out.columns.get_loc(f'{kind}_var_{int(level * 100)}')] = \
+                    NormalDist().inv_cdf(level) * sigma - mu
+        return out
+
+    def _moments(self, kind):
+        # Mean returns and covariance with NaN (too few shared dates) counted as 0, for VaR.
+        s = self.sums
+        n, sx = (s['n'], s['sx']) if kind == 'rolling' else (s['ew_n'], s['ew_sx'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.diag(sx) / np.diag(n)
+        cov = self._cov_matrix(kind)
+        cov[np.isnan(cov)] = 0.0
+        return np.nan_to_num(mean), cov
+
+    def _cov_matrix(self, kind, rows=None):
+        if rows is None:
+            get = lambda name: np.asarray(self.sums[name], dtype='float64')
+        else:
+            sub = np.ix_(rows, rows)
+            get = lambda name: np.asarray(self.sums[name][sub], dtype='float64')
+        if kind == 'rolling':
+            return _cov(get('n'), get('sx'), get('sxy'), ddof=1)
+        if kind == 'ewma':
+            return _cov(get('ew_n'), get('ew_sx'), get('ew_sxy'), ddof=0, obs=get('ew_obs'))
+        raise ValueError(f"kind must be 'rolling' or 'ewma', not {kind!r}")
+
+    def covariance(self, assets=None, kind='rolling'):
+        # Latest covariance matrix of the selected assets: the sample covariance over the window
+        # (kind='rolling') or the exponentially weighted one (kind='ewma').
+        assets = self.assets if assets is None else list(assets)
+        cov = self._cov_matrix(kind, [self.index[a] for a in assets])
+        return pd.DataFrame(cov, index=assets, columns=assets)
+
+    def betas(self, date=None):
+        # Rolling and EWMA beta of every asset to the benchmark on a date (default: the latest).
+        t = len(self.dates) - 1 if date is None else \
+            int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date), 'ns'), 'right')) - 1
+        if t < 0:
+            return pd.DataFrame(columns=['beta_rolling', 'beta_ewma'], index=pd.Index([], name='asset'))
+        return pd.DataFrame({'beta_rolling': self.beta_rolling[:, t], 'beta_ewma': self.beta_ewma[:, t]},
+                            index=pd.Index(self.assets, name='asset'))
+
+    def beta_history(self, asset):
+        i = self.index[asset]
+        return pd.DataFrame({'Date': self.dates, 'beta_rolling': self.beta_rolling[i],
+                             'beta_ewma': self.beta_ewma[i]})
+
+
+def signature(store_dir=store.STORE_DIR):
+    # Changes whenever a new version is published; None if nothing has been published.
+    try:
+        st = os.stat(os.path.join(risk_dir(store_dir), 'CURRENT'))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+
+def load(store_dir=store.STORE_DIR, mmap=True):
+    # The published results (arrays memory-mapped, read-only) or None.
+    rdir = risk_dir(store_dir)
+    current = os.path.join(rdir, 'CURRENT')
+    if not os.path.exists(current):
+        return None
+    with open(current) as f:
+        vdir = os.path.join(rdir, f.read().strip())
+    with open(os.path.join(vdir, 'meta.json')) as f:
+        meta = json.load(f)
+    engine = RiskEngine(meta['assets'], meta['window'], meta['halflife'], meta['benchmark'])
+    engine.weights = np.asarray(meta['weights'], dtype='float64')
+    mode = 'r' if mmap else None
+    engine.sums = {s: np.load(os.path.join(vdir, f'{s}.npy'), mmap_mode=mode) for s in SUMS}
+    engine.ew_beta = np.load(os.path.join(vdir, 'ew_beta.npy'))
+    engine.dates = np.load(os.path.join(vdir, 'dates.npy'))
+    engine.beta_rolling = np.load(os.path.join(vdir, 'beta_rolling.npy'), mmap_mode=mode)
+    engine.beta_ewma = np.load(os.path.join(vdir, 'beta_ewma.npy'), mmap_mode=mode)
+    engine.var = pd.read_parquet(os.path.join(vdir, 'var.parquet'))
+    engine.hash = meta['hash']
+    return engine
+
+
+def publish(engine, store_dir=store.STORE_DIR):
+    rdir = risk_dir(store_dir)
+    os.makedirs(rdir, exist_ok=True)
+    versions = sorted((d for d in os.listdir(rdir) if d.startswith('v') and d[1:].isdigit()), key=lambda d: int(d[1:]))
+    version = f'v{int(versions[-1][1:]) + 1 if versions else 1}'
+    vdir = os.path.join(rdir, version)
+    os.makedirs(vdir)
+    for s in SUMS:
+        np.save(os.path.join(vdir, f'{s}.npy'), engine.sums[s].astype('int32' if s in COUNTS else 'float64'))
+    np.save(os.path.join(vdir, 'ew_beta.npy'), engine.ew_beta)
+    np.save(os.path.join(vdir, 'dates.npy'), engine.dates)
+    np.save(os.path.join(vdir, 'beta_rolling.npy'), engine.beta_rolling)
+    np.save(os.path.join(vdir, 'beta_ewma.npy'), engine.beta_ewma)
+    engine.var.to_parquet(os.path.join(vdir, 'var.parquet'))
+    with open(os.path.join(vdir, 'meta.json'), 'w') as f:
+        json.dump({'assets': engine.assets, 'hash': engine.hash, **engine.config()}, f)
+    with open(os.path.join(rdir, 'CURRENT.tmp'), 'w') as f:
+        f.write(version)
+    os.replace(os.path.join(rdir, 'CURRENT.tmp'), os.path.join(rdir, 'CURRENT'))
+    for d in versions[:-1]:  # keep the previous version for readers that resolved CURRENT before the swap
+        shutil.rmtree(os.path.join(rdir, d), ignore_errors=True)
+    return vdir
+
+
+@metrics.timed('risk.update')
+def update(rm=None, window=WINDOW, halflife=HALFLIFE, benchmark=BENCHMARK, weights=None, full=False,
+           store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR, write_out=True):
+    # Brings the stored results up to date with the returns matrix (default: the published one)
+    # and publishes them. Only the dates after the stored ones are processed, unless full=True or
+    # the assets, the settings or the already-processed returns changed.
+    # Returns (engine, dates processed, rebuilt from scratch).
+    rm = rm if rm is not None else returns.get(store_dir, clean_dir)
+    if not len(rm.assets):
+        raise ValueError('No returns to compute risk from: run the cleaning stage first')
+    engine = RiskEngine(rm.assets, window, halflife, benchmark, weights)
+    prev = None if full else load(store_dir, mmap=False)
+    t = len(prev.dates) if prev is not None else 0
+    rebuilt = not (prev is not None and prev.assets == engine.assets and prev.config() == engine.config()
+                   and t <= len(rm.dates) and prev.hash == history_hash(rm, t))
+    if not rebuilt:
+        engine = prev
+        engine.sums = {s: np.asarray(v, dtype='float64') for s, v in engine.sums.items()}
+        engine.beta_rolling, engine.beta_ewma = np.asarray(engine.beta_rolling), np.asarray(engine.beta_ewma)
+    days = engine.advance(rm)
+    engine.hash = history_hash(rm, len(rm.dates))
+    if write_out and (days or rebuilt):
+        publish(engine, store_dir)
+    return engine, days, rebuilt
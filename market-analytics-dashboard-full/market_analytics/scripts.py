@@ -0,0 +1,23 @@
+# Loads the numbered notebooks/ scripts as modules (their names are not valid identifiers), so
+# their functions (clean_equity, compute_latest_kpis, top_movers, ...) can be reused.
+import importlib.util
+import os
+import sys
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'notebooks')
+
+
+def load(name):
+    # load('02_data_cleaning') -> module; loaded once per process.
+    modname = 'notebook_' + name
+    if modname in sys.modules:
+        return sys.modules[modname]
+    spec = importlib.util.spec_from_file_location(modname, os.path.join(NOTEBOOKS_DIR, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[modname] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[modname]
+        raise
+    return module
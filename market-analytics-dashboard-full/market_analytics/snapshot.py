@@ -0,0 +1,107 @@
+# Latest-snapshot table: one row per asset with its last Date, close, return, MAs, volatilities,
+# spread and Amihud illiquidity, kept in data/store/snapshot.parquet by the cleaning stage. Top
+# movers, the KPI tiles and latest_kpis.csv read this instead of every asset's full history.
+import os
+import numpy as np
+import pandas as pd
+
+from market_analytics import metrics, parallel, store
+
+SNAPSHOT_FILE = 'snapshot.parquet'
+COLUMNS = ['Date', 'Close', 'Daily_Return', 'MA_20', 'MA_50', 'Volatility_7', 'Volatility_30', 'Spread', 'Amihud']
+
+
+def snapshot_path(store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, SNAPSHOT_FILE)
+
+
+def _row(last):
+    # KPI columns the asset lacks are left as NaN.
+    return {c: last[c] if c in last else np.nan for c in COLUMNS}
+
+
+def latest_row(df):
+    # Snapshot row (dict) for a cleaned frame, or a dict of column arrays.
+    if isinstance(df, dict):
+        return _row({c: v[-1] for c, v in df.items()})
+    return _row(df.iloc[-1])
+
+
+def load(store_dir=store.STORE_DIR):
+    # Snapshot indexed by asset, or None if the cleaning stage has not written one.
+    path = snapshot_path(store_dir)
+    if not os.path.exists(path):
+        return None
+    # reindex: snapshots written before a column was added get it as NaN
+    return pd.read_parquet(path).set_index('asset').reindex(columns=COLUMNS)
+
+
+def signature(store_dir=store.STORE_DIR):
+    try:
+        st = os.stat(snapshot_path(store_dir))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+
+def write(snap, store_dir=store.STORE_DIR):
+    path = snapshot_path(store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    tmp = os.path.join(store_dir, '.' + SNAPSHOT_FILE + '.tmp')
+    snap.sort_index().reset_index().to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+@metrics.timed('snapshot.update')
+def update(rows, store_dir=store.STORE_DIR):
+    # Upserts {asset: row} into the snapshot and writes it back.
+    snap = load(store_dir)
+    new = pd.DataFrame.from_dict(rows, orient='index', columns=COLUMNS)
+    new.index.name = 'asset'
+    if snap is not None:
+        new = pd.concat([snap.drop(index=new.index, errors='ignore'), new])
+    new['Date'] = pd.to_datetime(new['Date'])
+    write(new, store_dir)
+    return new
+
+
+def asset_row(asset, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    try:
+        last = store.read_last_row(asset, COLUMNS, store_dir, clean_dir)
+    except (KeyError, ValueError):  # some KPI columns missing: read whatever the asset has
+        last = store.read_asset(asset, store_dir=store_dir, clean_dir=clean_dir).iloc[-1]
+    return _row(last)
+
+
+def build(assets=None, store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR, workers=1, write_out=False):
+    # Rebuilds the snapshot from the store's last rows (in parallel if workers > 1).
+    assets = store.list_assets(store_dir, clean_dir) if assets is None else list(assets)
+    tasks = {a: (a, store_dir, clean_dir) for a in assets}
+    rows, failures = parallel.run_parallel(asset_row, tasks, workers, chunksize=64)
+    parallel.report_failures(failures)
+    snap = pd.DataFrame.from_dict(rows, orient='index', columns=COLUMNS)
+    snap.index.name = 'asset'
+    snap['Date'] = pd.to_datetime(snap['Date'])
+    if write_out:
+        write(snap, store_dir)
+    return snap
+
+
+def get(store_dir=store.STORE_DIR, clean_dir=store.CLEAN_DIR):
+    # The stored snapshot, or one built in memory (e.g. when only the demo CSVs are present).
+    snap = load(store_dir)
+    return snap if snap is not None else build(store_dir=store_dir, clean_dir=clean_dir)
+
+
+def top_movers(snap, n=5, ascending=False):
+    # Top n assets by latest daily return (bottom n with ascending=True), using a partial sort
+    # (argpartition) instead of sorting the whole universe. Assets without a return sort last.
+    ret = snap['Daily_Return'].to_numpy('float64')
+    keys = np.where(np.isnan(ret), np.inf, ret if ascending else -ret)
+    n = min(n, len(keys))
+    if n <= 0:
+        return pd.DataFrame({'asset': pd.Series(dtype=object), 'return_pct': pd.Series(dtype='float64')})
+    idx = np.argpartition(keys, n - 1)[:n]
+    idx = idx[np.argsort(keys[idx], kind='stable')]
+    return pd.DataFrame({'asset': snap.index[idx], 'return_pct': ret[idx] * 100})
@@ -0,0 +1,293 @@
+# Columnar store for cleaned assets: typed, zstd-compressed Parquet, one partition per asset.
+#
+#   data/store/asset=<name>/part-00000.parquet
+#   data/store/asset=<name>/part-00001.parquet   (rows appended by incremental cleaning)
+#   data/store/asset=<name>/_state.json          (rolling-window state, ignored by Parquet readers)
+#
+# Readers ask for the columns they need (column projection), so e.g. a correlation only
+# decodes Date and Daily_Return; registered KPIs an asset does not store are computed on read.
+# The legacy data/cleaned/<name>_clean.csv files (including the bundled demo data) are still
+# readable as a fallback and can be written as an opt-in export.
+# With metrics enabled, reads count rows and decoded (in-memory) bytes, writes rows and file bytes.
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from market_analytics import kpis, metrics
+
+STORE_DIR = 'data/store'
+CLEAN_DIR = 'data/cleaned'
+COMPRESSION = 'zstd'
+MAX_PARTS = 64  # appended parts per asset before they are compacted back into one file
+
+# Column dtypes in the store; columns not listed here keep the dtype pandas inferred. KPI
+# columns are float64, or the dtype the KPI registry declares in compact mode.
+DTYPES = {
+    'Open': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Close': 'float64',
+    'Adj Close': 'float64',
+    'Volume': 'int64',
+    **{name: 'float64' for name in kpis.names()},
+}
+
+# Compact variant (streaming/intraday cleaning): derived KPIs as float32, which keeps ~7
+# significant digits; prices, Date and Volume keep full precision.
+COMPACT_DTYPES = dict(DTYPES, **kpis.dtypes())
+
+
+def partition_dir(asset, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f'asset={asset}')
+
+
+def csv_path(asset, clean_dir=CLEAN_DIR):
+    return os.path.join(clean_dir, f'{asset}_clean.csv')
+
+
+def typed(df, compact=False):
+    out = df.copy()
+    out['Date'] = pd.to_datetime(out['Date'])
+    for col, dtype in (COMPACT_DTYPES if compact else DTYPES).items():
+        if col not in out.columns:
+            continue
+        if dtype.startswith('int') and out[col].isna().any():
+            continue  # keep float so missing volumes stay NaN instead of failing the cast
+        out[col] = out[col].astype(dtype)
+    return out
+
+
+def _parts(pdir):
+    return sorted(f for f in os.listdir(pdir) if f.startswith('part-') and f.endswith('.parquet'))
+
+
+class PartWriter:
+    # Streams frames into one new part of an asset, one row group per write(). The part only
+    # becomes visible on close(): with append=False it then replaces all of the asset's parts,
+    # otherwise it is added after them (parts are read back in name order, so rows stay sorted
+    # by Date). All parts of an asset must use the same compact setting, which the cleaning
+    # stage records in the asset's state.
+    def __init__(self, asset, store_dir=STORE_DIR, compact=False, append=False):
+        self.asset, self.store_dir, self.compact, self.append = asset, store_dir, compact, append
+        self.pdir = partition_dir(asset, store_dir)
+        os.makedirs(self.pdir, exist_ok=True)
+        # dot-prefixed temp name so Parquet readers never pick up a half-written part
+        self.tmp = os.path.join(self.pdir, f'.part-{os.getpid()}.parquet.tmp')
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        table = pa.Table.from_pandas(typed(df, self.compact), preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp, table.schema, compression=COMPRESSION)
+        elif table.schema != self.writer.schema:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+        self.rows += len(df)
+        metrics.count('store_rows_written', len(df))
+
+    def close(self):
+        if self.writer is None:
+            return self.pdir
+        self.writer.close()
+        if metrics.enabled:
+            metrics.count('store_bytes_written', os.path.getsize(self.tmp))
+        parts = _parts(self.pdir)
+        if self.append:
+            n = int(parts[-1][5:10]) + 1 if parts else 0
+            os.replace(self.tmp, os.path.join(self.pdir, f'part-{n:05d}.parquet'))
+            if len(parts) + 1 >= MAX_PARTS:
+                compact_asset(self.asset, self.store_dir)
+        else:
+            for f in parts:
+                os.remove(os.path.join(self.pdir, f))
+            os.replace(self.tmp, os.path.join(self.pdir, 'part-00000.parquet'))
+        return self.pdir
+
+
+def write_asset(df, asset, store_dir=STORE_DIR, compact=False):
+    # Replaces the asset's data with df.
+    writer = PartWriter(asset, store_dir, compact)
+    writer.write(df)
+    return writer.close()
+
+
+def append_asset(df, asset, store_dir=STORE_DIR, compact=False):
+    # Adds df after the asset's existing rows.
+    writer = PartWriter(asset, store_dir, compact, append=True)
+    writer.write(df)
+    return writer.close()
+
+
+def compact_asset(asset, store_dir=STORE_DIR):
+    # Rewrites all parts of an asset as a single part-00000.parquet, one part in memory at a
+    # time (row groups and dtypes are kept as they are).
+    pdir = partition_dir(asset, store_dir)
+    parts = _parts(pdir)
+    if len(parts) <= 1:
+        return pdir
+    tmp = os.path.join(pdir, '.compacted.parquet')
+    writer = None
+    for f in parts:
+        table = pq.read_table(os.path.join(pdir, f))
+        if writer is None:
+            writer = pq.ParquetWriter(tmp, table.schema, compression=COMPRESSION)
+        writer.write_table(table.cast(writer.schema))
+    writer.close()
+    for f in parts:
+        os.remove(os.path.join(pdir, f))
+    os.replace(tmp, os.path.join(pdir, 'part-00000.parquet'))
+    return pdir
+
+
+def read_state(asset, store_dir=STORE_DIR):
+    path = os.path.join(partition_dir(asset, store_dir), '_state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(asset, state, store_dir=STORE_DIR):
+    path = os.path.join(partition_dir(asset, store_dir), '_state.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def has_asset(asset, store_dir=STORE_DIR):
+    return os.path.isdir(partition_dir(asset, store_dir))
+
+
+def stored_columns(asset, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    pdir = partition_dir(asset, store_dir)
+    parts = _parts(pdir) if os.path.isdir(pdir) else []
+    if parts:
+        return pq.read_schema(os.path.join(pdir, parts[0])).names
+    path = csv_path(asset, clean_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No cleaned data for {asset} in {store_dir} or {clean_dir}')
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _counted(df):
+    if metrics.enabled:
+        metrics.count('store_reads')
+        metrics.count('store_rows_read', len(df))
+        metrics.count('store_bytes_read', int(df.memory_usage(index=False).sum()))
+    return df
+
+
+def _read(asset, columns, store_dir, clean_dir):
+    pdir = partition_dir(asset, store_dir)
+    if os.path.isdir(pdir):
+        return _counted(pd.read_parquet(pdir, columns=columns))
+    path = csv_path(asset, clean_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No cleaned data for {asset} in {store_dir} or {clean_dir}')
+    parse = ['Date'] if columns is None or 'Date' in columns else False
+    return _counted(pd.read_csv(path, usecols=columns, parse_dates=parse))
+
+
+def read_asset(asset, columns=None, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    # Requested KPIs the asset does not store (e.g. cleaned before the KPI was registered) are
+    # computed over its full history from the raw columns they need.
+    if columns is None:
+        return _read(asset, None, store_dir, clean_dir)
+    stored = set(stored_columns(asset, store_dir, clean_dir))
+    missing = [c for c in columns if c not in stored and c in kpis.REGISTRY]
+    if not missing:
+        return _read(asset, columns, store_dir, clean_dir)
+    read = [c for c in columns if c not in missing]
+    read += [c for c in kpis.raw_inputs(missing) if c not in read]
+    df, _ = kpis.compute(_read(asset, read, store_dir, clean_dir), missing)
+    return df[columns]
+
+
+def read_columns(asset, columns, store_dir=STORE_DIR):
+    # {column: array} of the requested columns the asset's Parquet parts hold, decoded without
+    # pandas (nulls become NaN); None if the asset has no parts.
+    pdir = partition_dir(asset, store_dir)
+    parts = _parts(pdir) if os.path.isdir(pdir) else []
+    if not parts:
+        return None
+    files = [pq.ParquetFile(os.path.join(pdir, p)) for p in parts]
+    names = set(files[0].schema_arrow.names)
+    present = [c for c in columns if c in names]
+    table = pa.concat_tables([f.read(present) for f in files])
+    if metrics.enabled:
+        metrics.count('store_reads')
+        metrics.count('store_rows_read', table.num_rows)
+        metrics.count('store_bytes_read', table.nbytes)
+    return {c: table.column(c).to_numpy() for c in present}
+
+
+def row_count(asset, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    # Rows read_asset returns, from the Parquet footers (an asset only stored as a CSV is read).
+    pdir = partition_dir(asset, store_dir)
+    parts = _parts(pdir) if os.path.isdir(pdir) else []
+    if parts:
+        return sum(pq.ParquetFile(os.path.join(pdir, p)).metadata.num_rows for p in parts)
+    return len(_read(asset, ['Date'], store_dir, clean_dir))
+
+
+def signature(asset, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    # Cheap change detector for an asset's data: (name, mtime, size) of the files read_asset uses.
+    pdir = partition_dir(asset, store_dir)
+    if os.path.isdir(pdir):
+        paths = [os.path.join(pdir, f) for f in _parts(pdir)]
+    else:
+        paths = [csv_path(asset, clean_dir)]
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        sig.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def read_last_row(asset, columns=None, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    # Latest row of an asset as a Series, decoding only the last row group of the last part.
+    pdir = partition_dir(asset, store_dir)
+    parts = _parts(pdir) if os.path.isdir(pdir) else []
+    if parts:
+        f = pq.ParquetFile(os.path.join(pdir, parts[-1]))
+        if f.metadata.num_rows and (columns is None or set(columns) <= set(f.schema_arrow.names)):
+            df = f.read_row_group(f.num_row_groups - 1, columns=columns).to_pandas()
+            return df.iloc[-1]
+    return read_asset(asset, columns, store_dir, clean_dir).iloc[-1]
+
+
+def read_after(asset, after, columns=None, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    # Rows with Date > after (all rows if after is None); row groups wholly before it are skipped.
+    if after is None:
+        return read_asset(asset, columns, store_dir, clean_dir)
+    pdir = partition_dir(asset, store_dir)
+    after = pd.Timestamp(after)
+    if os.path.isdir(pdir) and (columns is None or set(columns) <= set(stored_columns(asset, store_dir))):
+        return _counted(pd.read_parquet(pdir, columns=columns, filters=[('Date', '>', after)]))
+    df = read_asset(asset, None if columns is None else list(dict.fromkeys(['Date'] + list(columns))),
+                    store_dir, clean_dir)
+    df = df[df['Date'] > after]
+    return df if columns is None else df[columns]
+
+
+def list_assets(store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    names = set()
+    if os.path.isdir(store_dir):
+        names.update(d.split('=', 1)[1] for d in os.listdir(store_dir) if d.startswith('asset='))
+    if os.path.isdir(clean_dir):
+        names.update(f.replace('_clean.csv', '') for f in os.listdir(clean_dir) if f.endswith('_clean.csv'))
+    return sorted(names)
+
+
+def export_csv(asset, path_out=None, store_dir=STORE_DIR, clean_dir=CLEAN_DIR):
+    df = read_asset(asset, store_dir=store_dir, clean_dir=clean_dir)
+    path_out = path_out or csv_path(asset, clean_dir)
+    os.makedirs(os.path.dirname(path_out) or '.', exist_ok=True)
+    df.to_csv(path_out, index=False)
+    return path_out
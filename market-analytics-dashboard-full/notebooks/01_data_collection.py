@@ -1,8 +1,14 @@
-# Data collection script (yfinance for equities; placeholders for FX/commodities/bonds)
-import yfinance as yf
+# Data collection script: equities, FX and commodities from yfinance, government yield curves
+# from FRED (needs FRED_API_KEY), or everything offline from local CSVs (--source-dir) or
+# deterministic synthetic data (--synthetic).
+# Symbols are fetched concurrently under a global rate limit, incrementally from each asset's
+# last stored date; an interrupted run picks up where it stopped (data/<class>/_checkpoint.json).
+import argparse
 import os
+import sys
 
-os.makedirs('data/equities', exist_ok=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import collect, curves, metrics
 
 EQUITIES = {
     'AAPL': 'AAPL',
@@ -12,17 +18,102 @@ EQUITIES = {
     'NIFTY': '^NSEI'
 }
 
-def fetch_equities(equities, start='2020-01-01', end=None, interval='1d'):
-    for name, symbol in equities.items():
-        print(f"Fetching {name} ({symbol})...")
-        df = yf.download(symbol, start=start, end=end, interval=interval, progress=False)
-        if df.empty:
-            print(f"Warning: no data for {symbol}")
-            continue
-        df.reset_index(inplace=True)
-        df.to_csv(f"data/equities/{name.lower()}.csv", index=False)
-        print(f"Saved data/equities/{name.lower()}.csv")
+FOREX = {
+    'EURUSD': 'EURUSD=X',
+    'GBPUSD': 'GBPUSD=X',
+    'USDJPY': 'JPY=X',
+    'USDINR': 'INR=X'
+}
+
+COMMODITIES = {
+    'GOLD': 'GC=F',
+    'SILVER': 'SI=F',
+    'CRUDE': 'CL=F',
+    'NATGAS': 'NG=F'
+}
+
+# Yield curves: curve -> {tenor: FRED series}. UST is the constant-maturity Treasury curve.
+CURVES = {
+    'UST': {'1M': 'DGS1MO', '3M': 'DGS3MO', '6M': 'DGS6MO', '1Y': 'DGS1', '2Y': 'DGS2', '3Y': 'DGS3',
+            '5Y': 'DGS5', '7Y': 'DGS7', '10Y': 'DGS10', '20Y': 'DGS20', '30Y': 'DGS30'},
+}
+
+# asset class -> (output directory, name -> symbol)
+ASSET_CLASSES = {
+    'equities': ('data/equities', EQUITIES),
+    'forex': ('data/forex', FOREX),
+    'commodities': ('data/commodities', COMMODITIES),
+    'bonds': (curves.RAW_DIR, CURVES),
+}
+
+@metrics.timed('fetch_equities')
+def fetch_equities(equities, start='2020-01-01', end=None, interval='1d', source=None,
+                   workers=8, rate=2.0, retries=3, resume=True, out_dir='data/equities'):
+    print(f"Fetching {len(equities)} symbols with {workers} workers (max {rate}/s)...")
+    rows, failures = collect.collect(equities, start=start, end=end, interval=interval, source=source,
+                                     out_dir=out_dir, workers=workers, rate=rate,
+                                     retries=retries, resume=resume)
+    for name, n in rows.items():
+        if n == 0:
+            print(f"Warning: no new data for {name} ({equities[name]})")
+    return rows, failures
+
+def class_dir(asset_class, source_dir):
+    # Local files for an asset class: <source_dir>/<class>/; equities may also sit in <source_dir>
+    # itself, as before. None when there are none.
+    sub = os.path.join(source_dir, asset_class)
+    if os.path.isdir(sub):
+        return sub
+    return source_dir if asset_class == 'equities' else None
+
+def class_source(asset_class, synthetic=False):
+    # Live APIs (yfinance; FRED for the curves) or deterministic synthetic data.
+    if asset_class == 'bonds':
+        return collect.SyntheticCurveSource(CURVES) if synthetic else collect.FredCurveSource(CURVES)
+    return collect.SyntheticSource() if synthetic else None
+
+def collect_class(asset_class, start='2020-01-01', end=None, interval='1d', source_dir=None, synthetic=False,
+                  workers=8, rate=2.0, resume=True):
+    # Fetches one asset class into its data/ directory. Returns {name: error} for the symbols
+    # that failed, or None when the class is skipped (no local files / no FRED key).
+    out_dir, symbols = ASSET_CLASSES[asset_class]
+    if source_dir:
+        local = class_dir(asset_class, source_dir)
+        if local is None:
+            print(f'Skipping {asset_class}: no {os.path.join(source_dir, asset_class)}')
+            return None
+        source = collect.LocalFileSource(local)
+    elif asset_class == 'bonds' and not synthetic and not os.environ.get('FRED_API_KEY'):
+        print('Skipping bonds: set FRED_API_KEY, or use --source-dir / --synthetic')
+        return None
+    else:
+        source = class_source(asset_class, synthetic)
+    if asset_class == 'bonds':
+        symbols = {name: name for name in symbols}  # curves are fetched by curve name
+    print(f'[{asset_class}]')
+    _, failures = fetch_equities(symbols, start=start, end=end, interval=interval, source=source,
+                                 workers=workers, rate=rate, resume=resume, out_dir=out_dir)
+    return failures
 
 if __name__ == '__main__':
-    fetch_equities(EQUITIES)
-    print('Done. Add FX/commodities/bonds collection as needed.')
+    parser = argparse.ArgumentParser(description='Fetch prices and yield curves into data/<asset class>.')
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--interval', default='1d')
+    parser.add_argument('--classes', default=','.join(ASSET_CLASSES),
+                        help='comma-separated asset classes (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent fetches')
+    parser.add_argument('--rate', type=float, default=2.0, help='max requests per second across all workers')
+    parser.add_argument('--source-dir', default=None,
+                        help='read <symbol>.csv files from <dir>/<class>/ instead of the APIs (curves: <curve>.csv)')
+    parser.add_argument('--synthetic', action='store_true', help='generate deterministic offline data instead')
+    parser.add_argument('--no-resume', action='store_true', help='ignore the checkpoint of an interrupted run')
+    args = parser.parse_args()
+    metrics.start_run('01_data_collection')
+    failures = {}
+    for asset_class in [c for c in args.classes.split(',') if c]:
+        failed = collect_class(asset_class, args.start, args.end, args.interval, args.source_dir, args.synthetic,
+                               args.workers, args.rate, resume=not args.no_resume)
+        failures.update({f'{asset_class}/{name}': err for name, err in (failed or {}).items()})
+    print('Done.')
+    sys.exit(1 if failures else 0)
@@ -1,29 +1,227 @@
-# Cleans raw CSVs and produces cleaned CSVs in data/cleaned with KPI columns.
+# Cleans raw CSVs and writes the cleaned assets (with KPI columns) to the columnar store in data/store.
+# Pass --csv to also export data/cleaned/<asset>_clean.csv files, and --incremental to only
+# process bars newer than the last cleaned Date of each asset (an asset whose raw file changed
+# other than by appending, e.g. restated bars, is cleaned in full). Assets are cleaned in parallel
+# over a process pool (--workers / --chunksize). Long intraday histories can be streamed in
+# bounded chunks with compact float32 KPI columns (--max-memory-mb / --stream-rows). Afterwards
+# the date-aligned returns matrix in data/store/returns and the latest-snapshot table
+# (data/store/snapshot.parquet) are updated with the freshly cleaned rows, and the shared data
+# plane the dashboard workers map (data/store/plane) is published again. Equities, FX and
+# commodities share this cleaning; yield curves (data/bonds/<curve>.csv, one column per tenor)
+# are cleaned into data/store/curves.
 import pandas as pd
+import argparse
+import hashlib
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import curves, kpis, metrics, parallel, plane, returns, snapshot, store
 
 RAW_DIR = 'data/equities'
-CLEAN_DIR = 'data/cleaned'
-os.makedirs(CLEAN_DIR, exist_ok=True)
+# price-series asset classes cleaned by default (missing directories are skipped)
+RAW_DIRS = ['data/equities', 'data/forex', 'data/commodities']
+CLEAN_DIR = store.CLEAN_DIR
+STORE_DIR = store.STORE_DIR
+
+# Streaming mode: raw column dtypes (volumes parsed as float so gaps survive; the store casts
+# them to int64) and a conservative per-row working-set estimate used to size chunks.
+RAW_DTYPES = {'Open': 'float64', 'High': 'float64', 'Low': 'float64', 'Close': 'float64',
+              'Adj Close': 'float64', 'Volume': 'float64'}
+STREAM_ROW_BYTES = 1024
+
+def add_kpis(df, state=None):
+    # Adds every registered KPI column (market_analytics.kpis) to df. With a state from a previous
+    # run, df holds only the new bars and the rolling windows / cumulative return continue from
+    # the carried-over closes.
+    return kpis.compute(df, state=state)
+
+def raw_digest(path_in, prefix=None):
+    # (size, hash) of a raw file, plus the hash of its first `prefix` bytes (None if it is
+    # shorter): an incremental run may only append if the bytes it cleaned last time are intact.
+    h = hashlib.blake2b(digest_size=16)
+    head = None
+    with open(path_in, 'rb') as f:
+        if prefix is not None:
+            data = f.read(prefix)
+            h.update(data)
+            head = h.hexdigest() if len(data) == prefix else None
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+        return f.tell(), h.hexdigest(), head
 
-def clean_equity(path_in, path_out):
+def _export_csv(df, path_out, append):
+    os.makedirs(os.path.dirname(path_out) or '.', exist_ok=True)
+    append = append and os.path.exists(path_out)
+    df.to_csv(path_out, index=False, mode='a' if append else 'w', header=not append)
+
+@metrics.timed('clean_equity')
+def clean_equity(path_in, path_out=None, asset=None, store_dir=STORE_DIR, incremental=False,
+                 stream_rows=None, max_memory_mb=None, compact=None):
+    # Full mode returns the cleaned frame (only the new rows when incremental). Passing
+    # stream_rows or max_memory_mb switches to streaming mode, see clean_equity_stream.
+    if asset is None:
+        asset = os.path.basename(path_in).replace('.csv', '')
+    state = store.read_state(asset, store_dir) if incremental else None
+    if state is not None and set(kpis.names()) - set(store.stored_columns(asset, store_dir)):
+        state = None  # KPIs were registered after the asset was stored: rebuild it in full
+    size, digest, head = raw_digest(path_in, state.get('raw_size') if state is not None else None)
+    if state is not None and (head is None or head != state.get('raw_hash')):
+        state = None  # bars already cleaned were restated, not only appended to: rebuild in full
+        metrics.count('raw_restated')
+    # recorded with the state: the raw file as cleaned, and the date this run's rows follow
+    raw = {'raw_size': size, 'raw_hash': digest, 'appended_after': state['last_date'] if state is not None else None}
+    streaming = bool(stream_rows or max_memory_mb)
+    if metrics.enabled:
+        metrics.count('raw_bytes_read', os.path.getsize(path_in))
+    if state is not None:
+        compact = state.get('compact', False)  # every part of an asset uses the same dtypes
+    elif compact is None:
+        compact = streaming
+    if streaming:
+        return clean_equity_stream(path_in, path_out, asset, store_dir, state, stream_rows, max_memory_mb, compact,
+                                   raw)
     df = pd.read_csv(path_in, parse_dates=['Date'])
+    metrics.count('raw_rows_read', len(df))
     df = df.dropna(subset=['Close'])
     df = df.sort_values('Date').reset_index(drop=True)
-    df['Daily_Return'] = df['Close'].pct_change()
-    df['Cumulative_Return'] = (1 + df['Daily_Return']).cumprod() - 1
-    df['MA_20'] = df['Close'].rolling(20).mean()
-    df['MA_50'] = df['Close'].rolling(50).mean()
-    df['Volatility_7'] = df['Daily_Return'].rolling(7).std()
-    df['Volatility_30'] = df['Daily_Return'].rolling(30).std()
-    df['Spread'] = (df['High'] - df['Low']) / df['Close']
-    df.to_csv(path_out, index=False)
+    if state is not None:
+        # Bars on or before the last cleaned Date are already in the store.
+        df = df[df['Date'] > pd.Timestamp(state['last_date'])].reset_index(drop=True)
+    df, new_state = add_kpis(df, state)
+    if state is not None and df.empty:
+        return df
+    new_state.update(raw, compact=compact)
+    if state is not None:
+        store.append_asset(df, asset, store_dir, compact)
+    else:
+        store.write_asset(df, asset, store_dir, compact)
+    store.write_state(asset, new_state, store_dir)
+    if path_out:
+        _export_csv(df, path_out, append=state is not None)
     return df
 
+def stream_chunk_rows(max_memory_mb):
+    # Rows per chunk so that parsing a chunk, its KPI columns and the typed copy written to
+    # Parquet stay within max_memory_mb (per worker process).
+    return max(1000, int(max_memory_mb * 2**20 // STREAM_ROW_BYTES))
+
+def clean_equity_stream(path_in, path_out, asset, store_dir, state, stream_rows=None, max_memory_mb=None,
+                        compact=True, raw=None):
+    # Streaming mode for long (e.g. intraday) histories: the raw CSV, which must already be sorted
+    # by Date, is read in bounded chunks; the rolling state is carried from chunk to chunk and
+    # each chunk is written as a row group of one new Parquet part. Peak memory is set by the
+    # chunk size rather than the history length. Returns the last cleaned chunk.
+    rows = stream_rows or stream_chunk_rows(max_memory_mb)
+    last = pd.Timestamp(state['last_date']) if state is not None else None
+    writer = store.PartWriter(asset, store_dir, compact, append=state is not None)
+    out = None
+    for chunk in pd.read_csv(path_in, parse_dates=['Date'], chunksize=rows, dtype=RAW_DTYPES):
+        metrics.count('raw_rows_read', len(chunk))
+        chunk = chunk.dropna(subset=['Close'])
+        if not chunk['Date'].is_monotonic_increasing:
+            raise ValueError(f'{path_in} must be sorted by Date for streaming cleaning')
+        if last is not None:
+            chunk = chunk[chunk['Date'] > last]
+        if chunk.empty:
+            continue
+        out, state = add_kpis(chunk.reset_index(drop=True), state)
+        writer.write(out)
+        if path_out:
+            _export_csv(out, path_out, append=writer.append or writer.rows > len(out))
+        last = out['Date'].iloc[-1]
+    writer.close()
+    if out is None:
+        return pd.DataFrame(columns=['Date', 'Daily_Return'])
+    state.update(raw or {}, compact=compact)
+    store.write_state(asset, state, store_dir)
+    return out
+
+def clean_asset(path_in, path_out, asset, incremental=False, store_dir=STORE_DIR, **stream):
+    # Pool worker: cleans one asset and returns only its new dates and returns plus its latest
+    # snapshot row (not the frame, so little is pickled back to the parent). In streaming mode
+    # the returns are read back from the store (two columns) instead of being kept in memory.
+    streaming = bool(stream.get('stream_rows') or stream.get('max_memory_mb'))
+    df = clean_equity(path_in, path_out, asset=asset, store_dir=store_dir, incremental=incremental, **stream)
+    if not len(df):
+        return df['Date'].to_numpy('datetime64[ns]'), df['Daily_Return'].to_numpy('float64'), None
+    row = snapshot.latest_row(df)
+    if streaming:
+        df = store.read_asset(asset, columns=['Date', 'Daily_Return'], store_dir=store_dir)
+        after = store.read_state(asset, store_dir).get('appended_after')
+        if after is not None:
+            df = df[df['Date'] > pd.Timestamp(after)]
+    return df['Date'].to_numpy('datetime64[ns]'), df['Daily_Return'].to_numpy('float64'), row
+
+def clean_all(raw_dir=RAW_DIR, csv=False, incremental=False, workers=None, chunksize=1, store_dir=STORE_DIR,
+              **stream):
+    # Cleans every raw CSV in raw_dir (a directory or a list of them; asset names must be unique
+    # across them) over the process pool, then updates the returns matrix and the snapshot.
+    # stream takes clean_equity's stream_rows / max_memory_mb / compact.
+    # Returns (cleaned, failures, returns_matrix).
+    tasks = {}
+    for d in [raw_dir] if isinstance(raw_dir, str) else raw_dir:
+        for fname in sorted(os.listdir(d)):
+            if fname.endswith('.csv'):
+                name = fname.replace('.csv','')
+                if name in tasks:
+                    raise ValueError(f'Asset {name!r} is in both {os.path.dirname(tasks[name][0])} and {d}')
+                path_out = os.path.join(CLEAN_DIR, f'{name}_clean.csv') if csv else None
+                tasks[name] = (os.path.join(d, fname), path_out, name)
+    cleaned, failures = parallel.run_parallel(clean_asset, tasks, workers, chunksize,
+                                              incremental=incremental, store_dir=store_dir, **stream)
+    return cleaned, failures, publish(cleaned, store_dir, replace=not incremental)
+
+@metrics.timed('publish')
+def publish(cleaned, store_dir=STORE_DIR, replace=True):
+    # Merges clean_asset results ({asset: (dates, returns, snapshot row)}) into the returns
+    # matrix and the snapshot. Returns the new returns matrix.
+    rm = returns.update({a: (d, r) for a, (d, r, _) in cleaned.items()}, store_dir, replace=replace)
+    snapshot.update({a: row for a, (_, _, row) in cleaned.items() if row is not None}, store_dir)
+    return rm
+
+def publish_plane(store_dir=STORE_DIR):
+    # Publishes the data plane; only the assets cleaned since the last publish are read.
+    vdir, read = plane.publish(store_dir=store_dir)
+    print(f'Data plane: {os.path.basename(vdir)} published ({len(read)} assets read).')
+    return len(read)
+
+def clean_curve(path_in, name, store_dir=STORE_DIR):
+    # Pool worker: cleans one raw yield curve into the store and returns its row count.
+    return len(curves.clean_curve(path_in, name, store_dir).dates)
+
+def clean_curves(raw_dir=curves.RAW_DIR, workers=None, store_dir=STORE_DIR):
+    # Cleans every raw curve CSV in raw_dir over the process pool. Returns (rows, failures).
+    tasks = {f.replace('.csv', ''): (os.path.join(raw_dir, f), f.replace('.csv', ''))
+             for f in sorted(os.listdir(raw_dir)) if f.endswith('.csv')}
+    return parallel.run_parallel(clean_curve, tasks, workers, store_dir=store_dir)
+
 if __name__ == '__main__':
-    for fname in os.listdir(RAW_DIR):
-        if fname.endswith('.csv'):
-            name = fname.replace('.csv','')
-            print('Cleaning', fname)
-            clean_equity(os.path.join(RAW_DIR, fname), os.path.join(CLEAN_DIR, f'{name}_clean.csv'))
-    print('Cleaning complete.')
+    parser = argparse.ArgumentParser(description='Clean raw price CSVs and yield curves into the columnar store.')
+    parser.add_argument('--csv', action='store_true', help='also export data/cleaned/<asset>_clean.csv')
+    parser.add_argument('--incremental', action='store_true', help='only clean bars newer than the stored ones')
+    parser.add_argument('--workers', type=int, default=parallel.default_workers(), help='worker processes')
+    parser.add_argument('--chunksize', type=int, default=1, help='assets handed to a worker at a time')
+    parser.add_argument('--max-memory-mb', type=float, default=None,
+                        help='stream each raw file in chunks sized to stay under this many MB per worker')
+    parser.add_argument('--stream-rows', type=int, default=None, help='stream each raw file in chunks of this many rows')
+    parser.add_argument('--compact', action='store_true', default=None,
+                        help='store derived KPIs as float32 (the default when streaming)')
+    args = parser.parse_args()
+    metrics.start_run('02_data_cleaning')
+    print(f'Cleaning with {args.workers} workers')
+    raw_dirs = [d for d in RAW_DIRS if os.path.isdir(d)]
+    cleaned, failures, rm = clean_all(raw_dirs, csv=args.csv, incremental=args.incremental,
+                                      workers=args.workers, chunksize=args.chunksize,
+                                      stream_rows=args.stream_rows, max_memory_mb=args.max_memory_mb,
+                                      compact=args.compact)
+    parallel.report_failures(failures)
+    print(f'Cleaning complete: {len(cleaned)} assets, {sum(len(d) for d, _, _ in cleaned.values())} rows written.')
+    print(f'Returns matrix: {len(rm.assets)} assets x {len(rm.dates)} dates.')
+    publish_plane()
+    if os.path.isdir(curves.RAW_DIR):
+        curve_rows, curve_failures = clean_curves(workers=args.workers)
+        parallel.report_failures(curve_failures)
+        print(f'Yield curves: {len(curve_rows)} cleaned ({sum(curve_rows.values())} rows).')
+        failures.update(curve_failures)
+    sys.exit(1 if failures else 0)
@@ -1,31 +1,71 @@
 # Aggregates KPIs across cleaned assets and writes summary CSV.
+# Reads the latest-snapshot table written by the cleaning stage (one row per asset); if it is
+# missing (or --rebuild is given) it is rebuilt from the store's last rows in parallel. Latest
+# yield-curve slopes and butterflies go to latest_curve_metrics.csv when curves are stored.
 import pandas as pd
+import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import curves, kpis, metrics, parallel, snapshot
 
-CLEAN_DIR = 'data/cleaned'
 OUT_DIR = 'data/analytics'
 os.makedirs(OUT_DIR, exist_ok=True)
+ANNUALIZE = 252**0.5
 
+@metrics.timed('compute_latest_kpis')
 def compute_latest_kpis(df):
+    # KPIs the frame lacks (e.g. older cleaned files) are computed from its raw columns, when it
+    # has them, through the KPI registry.
+    wanted = ['Daily_Return', 'MA_20', 'MA_50', 'Volatility_30', 'Spread', 'Amihud']
+    missing = [c for c in wanted if c not in df and set(kpis.raw_inputs([c])) <= set(df.columns)]
+    if missing:
+        df, _ = kpis.compute(df.copy(), missing)
     last = df.iloc[-1]
     k = {}
     k['Latest_Close'] = last['Close']
     k['Latest_Return_pct'] = last['Daily_Return'] * 100
-    vol30 = df['Daily_Return'].rolling(30).std().iloc[-1]
-    k['30d_Volatility_annualized_pct'] = vol30 * (252**0.5) * 100 if not pd.isna(vol30) else None
+    vol30 = last.get('Volatility_30', None)
+    k['30d_Volatility_annualized_pct'] = vol30 * ANNUALIZE * 100 if not pd.isna(vol30) else None
     k['20d_MA'] = last.get('MA_20', None)
     k['50d_MA'] = last.get('MA_50', None)
     k['Latest_Spread_pct'] = last['Spread'] * 100 if 'Spread' in last else None
+    k['Latest_Amihud'] = last.get('Amihud', None)
     return k
 
-if __name__ == '__main__':
-    rows = []
-    for fname in os.listdir(CLEAN_DIR):
-        if fname.endswith('_clean.csv'):
-            df = pd.read_csv(os.path.join(CLEAN_DIR, fname), parse_dates=['Date'])
-            k = compute_latest_kpis(df)
-            k['asset'] = fname.replace('_clean.csv','')
-            rows.append(k)
-    out = pd.DataFrame(rows)
-    out.to_csv(os.path.join(OUT_DIR, 'latest_kpis.csv'), index=False)
+def latest_kpis_table(snap):
+    # Same KPIs as compute_latest_kpis, for every asset of a snapshot at once.
+    out = pd.DataFrame({
+        'Latest_Close': snap['Close'],
+        'Latest_Return_pct': snap['Daily_Return'] * 100,
+        '30d_Volatility_annualized_pct': snap['Volatility_30'] * ANNUALIZE * 100,
+        '20d_MA': snap['MA_20'],
+        '50d_MA': snap['MA_50'],
+        'Latest_Spread_pct': snap['Spread'] * 100,
+        'Latest_Amihud': snap['Amihud'],
+    }).rename_axis(None)
+    out['asset'] = snap.index
+    return out.sort_values('asset').reset_index(drop=True)
+
+@metrics.timed('save_latest')
+def save_latest(snap=None, workers=1):
+    # Writes latest_kpis.csv (and latest_curve_metrics.csv when curves are stored).
+    if snap is None:
+        snap = snapshot.load()
+    if snap is None:
+        snap = snapshot.build(workers=workers, write_out=True)
+    latest_kpis_table(snap).to_csv(os.path.join(OUT_DIR, 'latest_kpis.csv'), index=False)
     print('Saved analytics/latest_kpis.csv')
+    if curves.list_curves():
+        curves.latest_metrics().to_csv(os.path.join(OUT_DIR, 'latest_curve_metrics.csv'))
+        print('Saved analytics/latest_curve_metrics.csv')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aggregate latest KPIs across cleaned assets.')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the snapshot from the store first')
+    parser.add_argument('--workers', type=int, default=parallel.default_workers(), help='worker processes for a rebuild')
+    args = parser.parse_args()
+    metrics.start_run('03_kpi_calculations')
+    snap = snapshot.build(workers=args.workers, write_out=True) if args.rebuild else None
+    save_latest(snap, args.workers)
@@ -1,25 +1,45 @@
-# Example visualization using Plotly
-import pandas as pd
-import plotly.express as px
-
-df = pd.read_csv('data/cleaned/aapl_clean.csv', parse_dates=['Date'])
-fig = px.line(df, x='Date', y='Close', title='AAPL Price')
-fig.show()
-
-# Correlation heatmap example
-assets = ['aapl','infy','tcs']
-dfs = []
-for a in assets:
-    try:
-        d = pd.read_csv(f'data/cleaned/{a}_clean.csv', parse_dates=['Date'])
-        d = d[['Date','Daily_Return']].rename(columns={'Daily_Return':a})
-        dfs.append(d)
-    except Exception as e:
-        print('Missing', a)
-if dfs:
-    merged = dfs[0]
-    for d in dfs[1:]:
-        merged = merged.merge(d, on='Date', how='inner')
-    corr = merged.set_index('Date').corr()
-    fig2 = px.imshow(corr, text_auto=True, title='Return Correlation Matrix')
-    fig2.show()
+# Example visualizations using Plotly: an asset's price history and the correlation heatmap of
+# a few assets' returns. Importing it (scripts.load('04_visualizations')) draws nothing; plotly
+# is only imported once a figure is built.
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import returns, store
+
+ASSETS = ['aapl', 'infy', 'tcs']
+
+
+def price_chart(asset='aapl'):
+    import plotly.express as px
+    df = store.read_asset(asset, columns=['Date', 'Close'])
+    return px.line(df, x='Date', y='Close', title=f'{asset.upper()} Price')
+
+
+def correlation(assets=ASSETS):
+    # One vectorized pass over the date-aligned returns matrix; US and NSE names are compared on
+    # the sessions both markets traded, with returns carried over holidays.
+    rm = returns.get()
+    for a in assets:
+        if a not in rm:
+            print('Missing', a)
+    present = [a for a in assets if a in rm]
+    return rm.correlation(present, method='sessions') if present else None
+
+
+def correlation_heatmap(assets=ASSETS):
+    import plotly.express as px
+    corr = correlation(assets)
+    return None if corr is None else px.imshow(corr, text_auto=True, title='Return Correlation Matrix')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot a price history and a return correlation heatmap.')
+    parser.add_argument('--asset', default='aapl', help='asset whose price is plotted')
+    parser.add_argument('--assets', default=','.join(ASSETS), help='comma-separated assets for the heatmap')
+    args = parser.parse_args()
+    price_chart(args.asset).show()
+    fig = correlation_heatmap([a for a in args.assets.split(',') if a])
+    if fig is not None:
+        fig.show()
@@ -1,20 +1,20 @@
 # Produces a text summary of top movers and basic commentary.
-import pandas as pd
 import os
+import sys
 
-CLEAN_DIR = 'data/cleaned'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import metrics, snapshot
 
+@metrics.timed('top_movers')
 def top_movers(n=5):
-    rows = []
-    for fname in os.listdir(CLEAN_DIR):
-        if fname.endswith('_clean.csv'):
-            df = pd.read_csv(os.path.join(CLEAN_DIR, fname), parse_dates=['Date'])
-            last = df.iloc[-1]
-            rows.append({'asset': fname.replace('_clean.csv',''), 'return_pct': float(last['Daily_Return']*100)})
-    out = pd.DataFrame(rows).sort_values('return_pct', ascending=False)
-    return out
+    # Partial sort over the latest-snapshot table: no per-asset history is read.
+    return snapshot.top_movers(snapshot.get(), n)
 
-if __name__ == '__main__':
-    movers = top_movers(10)
+def report(n=10):
+    movers = top_movers(n)
     print('Top movers (latest daily return pct):')
-    print(movers.head(10).to_string(index=False))
+    print(movers.head(n).to_string(index=False))
+
+if __name__ == '__main__':
+    metrics.start_run('05_daily_market_summary')
+    report(10)
@@ -0,0 +1,51 @@
+# Morning risk run: brings the stored risk results (market_analytics/risk.py) up to date with the
+# published returns matrix, processing only the dates added since the last run, and prints the
+# portfolio VaR and the assets with the highest beta to the benchmark.
+#
+#   python notebooks/06_risk_engine.py                          # equal-weighted, beta to nifty
+#   python notebooks/06_risk_engine.py --weights book.csv       # asset,weight rows
+#   python notebooks/06_risk_engine.py --window 126 --full
+import argparse
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import metrics, returns, risk
+
+def load_weights(path):
+    if not path:
+        return None
+    df = pd.read_csv(path)
+    return dict(zip(df['asset'].str.lower(), df['weight'].astype(float)))
+
+def run(window=risk.WINDOW, halflife=risk.HALFLIFE, benchmark=risk.BENCHMARK, weights_path=None, full=False):
+    rm = returns.get()
+    if not rm.assets:
+        print('No returns published yet: skipping the risk run')
+        return 0
+    engine, days, rebuilt = risk.update(rm, window=window, halflife=halflife, benchmark=benchmark,
+                                        weights=load_weights(weights_path), full=full)
+    print(f"Risk: {days} date(s) processed{' (rebuilt)' if rebuilt else ''}, "
+          f"{len(engine.assets)} assets, window {engine.window}, half-life {engine.halflife}")
+    if len(engine.var):
+        print('Portfolio 1-day VaR (% of value) on', f'{engine.var.index[-1]:%Y-%m-%d}:')
+        print((engine.var.iloc[-1].drop('portfolio_return') * 100).round(3).to_string())
+    if engine.benchmark in engine.index:
+        betas = engine.betas().drop(index=engine.benchmark).sort_values('beta_rolling', ascending=False)
+        print(f'Highest betas to {engine.benchmark}:')
+        print(betas.head(10).round(3).to_string())
+    else:
+        print(f'Benchmark {engine.benchmark!r} has no returns: betas are NaN')
+    return days
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update rolling / EWMA covariances, betas and portfolio VaR.')
+    parser.add_argument('--window', type=int, default=risk.WINDOW, help='trailing dates (default: %(default)s)')
+    parser.add_argument('--halflife', type=float, default=risk.HALFLIFE, help='EWMA half-life in dates')
+    parser.add_argument('--benchmark', default=risk.BENCHMARK, help='asset the betas are measured against')
+    parser.add_argument('--weights', default=None, help='CSV of asset,weight (default: equal weights)')
+    parser.add_argument('--full', action='store_true', help='recompute from the start of the history')
+    args = parser.parse_args()
+    metrics.start_run('06_risk_engine')
+    run(args.window, args.halflife, args.benchmark, args.weights, args.full)
@@ -0,0 +1,64 @@
+# Backtests moving-average crossovers over every stored asset at once (market_analytics/
+# backtest.py), sweeping the grid of fast / slow windows over the process pool, and writes the
+# per-asset stats of every combination and one summary row per combination to data/analytics/.
+#
+#   python notebooks/07_backtest.py                                   # fast 10,20 x slow 50,100,200
+#   python notebooks/07_backtest.py --fast 5:55:5 --slow 60:260:20 --vol-target 0.1
+#   python notebooks/07_backtest.py --fast 20 --slow 100 --long-only --assets aapl,infy
+#
+# Windows are comma-separated lists or start:stop:step ranges.
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import backtest, metrics, parallel
+
+OUT_DIR = 'data/analytics'
+
+
+def windows(text):
+    if ':' in text:
+        return list(range(*(int(x) for x in text.split(':'))))
+    return [int(x) for x in text.split(',')]
+
+
+def run(fast=(10, 20), slow=(50, 100, 200), assets=None, workers=None, **settings):
+    universe = backtest.load(assets)
+    if not universe.assets:
+        print('No cleaned assets yet: skipping the backtest')
+        return None
+    combos = backtest.grid(fast, slow, **settings)
+    if not combos:
+        print('No (fast, slow) pair with fast < slow: nothing to backtest')
+        return None
+    stats, summary = backtest.sweep(universe, combos, workers)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    stats.to_csv(os.path.join(OUT_DIR, 'backtest_stats.csv'), index=False)
+    summary.to_csv(os.path.join(OUT_DIR, 'backtest_summary.csv'), index=False)
+    print(f'Backtest: {len(combos)} combination(s) x {len(universe.assets)} assets over {len(universe.dates)} dates')
+    print('Saved analytics/backtest_stats.csv and analytics/backtest_summary.csv')
+    print('Best combinations by Sharpe (equal-weight portfolio):')
+    best = summary.sort_values('sharpe', ascending=False).head(10)
+    print(best[['fast', 'slow'] + backtest.STATS[1:]].round(4).to_string(index=False))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest moving-average crossovers over the cleaned store.')
+    parser.add_argument('--fast', type=windows, default=[10, 20], help='fast MA windows (default: 10,20)')
+    parser.add_argument('--slow', type=windows, default=[50, 100, 200], help='slow MA windows (default: 50,100,200)')
+    parser.add_argument('--vol-target', type=float, default=None,
+                        help='size positions to this annualized volatility, e.g. 0.1 (default: +/-1 unit)')
+    parser.add_argument('--vol-window', type=int, default=backtest.VOL_WINDOW, help='returns the volatility is measured over')
+    parser.add_argument('--max-leverage', type=float, default=backtest.MAX_LEVERAGE, help='cap on a vol-targeted position')
+    parser.add_argument('--long-only', action='store_true', help='flat instead of short below the slow MA')
+    parser.add_argument('--cost-factor', type=float, default=backtest.COST_FACTOR,
+                        help='cost per unit traded, as a fraction of the Spread (default: %(default)s)')
+    parser.add_argument('--assets', default=None, help='comma-separated assets (default: all)')
+    parser.add_argument('--workers', type=int, default=parallel.default_workers(), help='processes for the sweep')
+    args = parser.parse_args()
+    metrics.start_run('07_backtest')
+    run(args.fast, args.slow, args.assets.lower().split(',') if args.assets else None, args.workers,
+        vol_target=args.vol_target, vol_window=args.vol_window, max_leverage=args.max_leverage,
+        long_only=args.long_only, cost_factor=args.cost_factor)
@@ -0,0 +1,54 @@
+# Sends synthetic intraday bars to the dashboard's live feed (market_analytics/live.py), for
+# trying live updates without a market data connection. Each asset's bars continue from its
+# latest stored close and date:
+#
+#   MARKET_FEED_PORT=8765 MARKET_LIVE=1 streamlit run dashboard/streamlit_app.py
+#   python notebooks/replay_feed.py --port 8765 --assets aapl,msft --interval 0.2
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import snapshot, store
+
+
+def replay(assets, port, host='127.0.0.1', interval=0.5, count=None, bar_minutes=1, seed=0):
+    # Every `interval` seconds sends one bar per asset, `bar_minutes` after the previous one.
+    snap = snapshot.get()
+    rng = np.random.default_rng(seed)
+    close = {a: float(snap.loc[a, 'Close']) for a in assets}
+    date = {a: pd.Timestamp(snap.loc[a, 'Date']) for a in assets}
+    sent = 0
+    with socket.create_connection((host, port)) as sock:
+        while count is None or sent < count:
+            lines = []
+            for a in assets:
+                prev, close[a] = close[a], close[a] * (1 + rng.normal(0, 0.001))
+                date[a] += pd.Timedelta(minutes=bar_minutes)
+                bar = {'asset': a, 'Date': date[a].isoformat(), 'Open': prev, 'High': max(prev, close[a]) * 1.0005,
+                       'Low': min(prev, close[a]) * 0.9995, 'Close': close[a], 'Volume': int(rng.integers(100, 10000))}
+                lines.append(json.dumps(bar) + '\n')
+            sock.sendall(''.join(lines).encode())
+            sent += 1
+            time.sleep(interval)
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay synthetic intraday bars into the live feed.')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MARKET_FEED_PORT', 8765)))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--assets', default=None, help='comma-separated assets (default: every stored asset)')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between rounds of bars')
+    parser.add_argument('--count', type=int, default=None, help='rounds to send (default: until interrupted)')
+    args = parser.parse_args()
+    assets = args.assets.split(',') if args.assets else store.list_assets()
+    try:
+        replay(assets, args.port, args.host, args.interval, args.count)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,113 @@
+# Runs the whole pipeline as one DAG of per-asset tasks (market_analytics/pipeline.py):
+#
+#   collect:<class>  ->  clean:<asset> ... -> publish -> kpis
+#                        clean:curve:<name> ...------>    summary
+#                                                         risk
+#                                                         plane
+#
+# Every clean task is fingerprinted from its raw CSV's content plus the code and settings that
+# produce it, so a run only re-cleans the assets whose raw data changed (appended bars only, or
+# the whole asset when earlier bars were restated); publish merges just those into the returns
+# matrix and the snapshot, and the aggregate stages rerun only when their inputs did.
+# Independent tasks run concurrently and each task's time is logged.
+#
+#   python notebooks/run_pipeline.py                         # clean + aggregate what changed
+#   python notebooks/run_pipeline.py --collect all --synthetic
+#   python notebooks/run_pipeline.py --dry-run               # list what would run
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import curves, metrics, parallel, pipeline, plane, returns, risk, scripts, snapshot, store
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'market_analytics')
+# library modules whose code shapes the cleaned data (a change re-cleans every asset)
+CLEAN_CODE = ['kpis', 'kernels', 'store', 'snapshot']
+CURVE_CODE = ['curves', 'store']
+
+
+def code(script, modules):
+    return [os.path.join(scripts.NOTEBOOKS_DIR, script + '.py')] + [os.path.join(PACKAGE_DIR, m + '.py') for m in modules]
+
+
+def publish(results, store_dir=store.STORE_DIR, replace=False):
+    # Gather task: the results of the clean tasks that ran, keyed clean:<asset>.
+    cleaned = {name.split(':', 1)[1]: r for name, r in results.items()}
+    if cleaned:
+        scripts.load('02_data_cleaning').publish(cleaned, store_dir, replace)
+    return len(cleaned)
+
+
+def build(collect_classes=(), collect_args=None, incremental=True, store_dir=store.STORE_DIR):
+    # The pipeline's tasks. Raw files are the ones on disk plus, for the classes being collected,
+    # the ones collection is about to write.
+    collect_mod = scripts.load('01_data_collection')
+    clean_mod = scripts.load('02_data_cleaning')
+    kpi_mod = scripts.load('03_kpi_calculations')
+    summary_mod = scripts.load('05_daily_market_summary')
+    risk_mod = scripts.load('06_risk_engine')
+    tasks = [pipeline.Task(f'collect:{c}', collect_mod.collect_class, args=(c,), kwargs=collect_args or {},
+                           always=True) for c in collect_classes]
+    cleans, curve_tasks = [], []
+    for asset_class, (raw_dir, symbols) in collect_mod.ASSET_CLASSES.items():
+        names = {f[:-len('.csv')] for f in os.listdir(raw_dir) if f.endswith('.csv')} if os.path.isdir(raw_dir) else set()
+        if asset_class in collect_classes:
+            names |= {n.lower() for n in symbols}
+        deps = [f'collect:{asset_class}'] if asset_class in collect_classes else []
+        for name in sorted(names):
+            path = os.path.join(raw_dir, f'{name}.csv')
+            if asset_class == 'bonds':
+                task = pipeline.Task(f'clean:curve:{name}', clean_mod.clean_curve, args=(path, name),
+                                     kwargs={'store_dir': store_dir}, deps=deps, inputs=[path],
+                                     outputs=[curves.curve_path(name, store_dir)],
+                                     code=code('02_data_cleaning', CURVE_CODE), process=True)
+                curve_tasks.append(task.name)
+            else:
+                task = pipeline.Task(f'clean:{name}', clean_mod.clean_asset, args=(path, None, name),
+                                     kwargs={'incremental': incremental, 'store_dir': store_dir}, deps=deps,
+                                     inputs=[path], outputs=[store.partition_dir(name, store_dir)],
+                                     code=code('02_data_cleaning', CLEAN_CODE), process=True)
+                cleans.append(task.name)
+            tasks.append(task)
+    tasks.append(pipeline.Task('publish', publish, kwargs={'store_dir': store_dir, 'replace': not incremental},
+                               deps=cleans, gather=True, code=code('run_pipeline', ['returns', 'snapshot'])))
+    snap = snapshot.snapshot_path(store_dir)
+    tasks.append(pipeline.Task('kpis', kpi_mod.save_latest, deps=['publish'] + curve_tasks,
+                               inputs=[snap, curves.curves_dir(store_dir)],
+                               outputs=[os.path.join(kpi_mod.OUT_DIR, 'latest_kpis.csv')]))
+    # the summary's product is its printout (a partial sort of the snapshot): shown on every run
+    tasks.append(pipeline.Task('summary', summary_mod.report, deps=['publish'], inputs=[snap], always=True))
+    # CURRENT names the published returns version, so its content changes with every publish
+    tasks.append(pipeline.Task('risk', risk_mod.run, deps=['publish'],
+                               inputs=[os.path.join(returns.returns_dir(store_dir), 'CURRENT')],
+                               outputs=[os.path.join(risk.risk_dir(store_dir), 'CURRENT')],
+                               code=code('06_risk_engine', ['risk', 'returns'])))
+    # publish rewrites the snapshot whenever an asset was cleaned
+    tasks.append(pipeline.Task('plane', clean_mod.publish_plane, kwargs={'store_dir': store_dir}, deps=['publish'],
+                               inputs=[snap], outputs=[os.path.join(plane.plane_dir(store_dir), 'CURRENT')],
+                               code=code('02_data_cleaning', ['plane', 'store'])))
+    return tasks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the pipeline, skipping tasks whose inputs are unchanged.')
+    parser.add_argument('--collect', default='', help="asset classes to fetch first, comma-separated or 'all'")
+    parser.add_argument('--synthetic', action='store_true', help='collect deterministic offline data')
+    parser.add_argument('--source-dir', default=None, help='collect from local CSVs in <dir>/<class>/')
+    parser.add_argument('--start', default='2020-01-01', help='collection start date')
+    parser.add_argument('--full', action='store_true', help='re-clean changed assets in full instead of appending')
+    parser.add_argument('--force', action='store_true', help='run every task, ignoring the cache')
+    parser.add_argument('--dry-run', action='store_true', help='only list the tasks that would run')
+    parser.add_argument('--workers', type=int, default=parallel.default_workers(), help='concurrent tasks')
+    args = parser.parse_args()
+    metrics.start_run('run_pipeline')
+    collect_mod = scripts.load('01_data_collection')
+    classes = list(collect_mod.ASSET_CLASSES) if args.collect == 'all' else [c for c in args.collect.split(',') if c]
+    tasks = build(classes, {'start': args.start, 'source_dir': args.source_dir, 'synthetic': args.synthetic},
+                  incremental=not args.full)
+    report = pipeline.Pipeline(tasks, workers=args.workers).run(force=args.force, dry_run=args.dry_run)
+    for stage, counts in pipeline.summarize(report).items():
+        detail = ', '.join(f'{counts[s]} {s}' for s in ('ran', 'cached', 'failed', 'blocked') if s in counts)
+        print(f"{stage:<10} {detail:<40} {counts['seconds']:9.3f}s" + ('  (dry run)' if args.dry_run else ''))
+    sys.exit(1 if any(r['status'] in ('failed', 'blocked') for r in report) else 0)
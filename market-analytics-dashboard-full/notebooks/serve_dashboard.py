@@ -0,0 +1,65 @@
+# Serves the dashboard from several worker processes behind the local load balancer
+# (market_analytics/balancer.py), so sessions are spread over CPU cores instead of sharing one
+# process. The data plane (market_analytics/plane.py) is published first, unless --no-publish,
+# so the workers map one shared copy of the cleaned data instead of each reading its own.
+#
+#   python notebooks/serve_dashboard.py --workers 4 --port 8501
+#   python -m market_analytics serve --workers 4
+#
+# Worker i listens on 127.0.0.1:<port + 1 + i>. With MARKET_FEED_PORT set, the balancer takes the
+# live feed on that port and copies it to the workers (MARKET_FEED_PORT + 1 + i); with
+# MARKET_METRICS_PORT set, worker i serves its metrics on MARKET_METRICS_PORT + i.
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import balancer, parallel, plane, store
+
+
+def start_workers(n, port, feed_port=None, metrics_port=None, args=()):
+    procs = []
+    for i in range(n):
+        env = dict(os.environ)
+        if feed_port:
+            env['MARKET_FEED_PORT'] = str(feed_port + 1 + i)
+        if metrics_port:
+            env['MARKET_METRICS_PORT'] = str(metrics_port + i)
+        procs.append(subprocess.Popen(
+            [sys.executable, '-m', 'market_analytics', 'dashboard', '--server.port', str(port + 1 + i),
+             '--server.address', '127.0.0.1', '--server.headless', 'true'] + list(args), env=env))
+    return procs
+
+
+def serve(workers, port=8501, host='127.0.0.1', publish=True, args=()):
+    if publish and store.list_assets():
+        vdir, read = plane.publish()
+        print(f'Data plane: {os.path.basename(vdir)} published ({len(read)} assets read).')
+    feed_port = int(os.environ['MARKET_FEED_PORT']) if os.environ.get('MARKET_FEED_PORT') else None
+    metrics_port = int(os.environ['MARKET_METRICS_PORT']) if os.environ.get('MARKET_METRICS_PORT') else None
+    procs = start_workers(workers, port, feed_port, metrics_port, args)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # stop the workers on kill too
+    lb = balancer.Balancer([('127.0.0.1', port + 1 + i) for i in range(workers)], host, port, feed_port,
+                           [('127.0.0.1', feed_port + 1 + i) for i in range(workers)] if feed_port else ())
+    try:
+        lb.run(ready=lambda: print(f'Dashboard: http://{host}:{port} ({workers} workers)', flush=True))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the dashboard from several processes behind a load balancer.')
+    parser.add_argument('--workers', type=int, default=parallel.default_workers(), help='dashboard server processes')
+    parser.add_argument('--port', type=int, default=8501, help='port of the balancer; workers use the next ones')
+    parser.add_argument('--host', default='127.0.0.1', help='address the balancer listens on')
+    parser.add_argument('--no-publish', action='store_true', help='serve the published data plane as it is')
+    args, rest = parser.parse_known_args()
+    serve(args.workers, args.port, args.host, not args.no_publish, rest)
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import backtest
+
+MARKETS = {'us1': 'A', 'us2': 'A', 'in1': 'B', 'in2': 'B'}
+COMBOS = [dict(fast=5, slow=20), dict(fast=10, slow=40, long_only=True),
+          dict(fast=5, slow=30, vol_target=0.1, vol_window=15), dict(fast=3, slow=8, vol_target=0.2, cost_factor=1.0)]
+
+
+def frames(n=300, seed=0):
+    # Two markets with their own holidays; in2 lists later and misses one of its market's sessions.
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range('2023-01-02', periods=n)
+    holidays = {'A': rng.choice(n, 12, replace=False), 'B': rng.choice(n, 12, replace=False)}
+    out = {}
+    for a, market in MARKETS.items():
+        keep = np.ones(n, dtype=bool)
+        keep[holidays[market]] = False
+        if a == 'in2':
+            keep[:100] = False
+            keep[150] = False
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+        spread = rng.uniform(0.005, 0.02, n)
+        if a == 'us2':
+            spread[60:65] = np.nan
+        out[a] = pd.DataFrame({'Date': days[keep], 'Close': close[keep], 'Spread': spread[keep]})
+    return out
+
+
+def reference(df, sessions, fast, slow, vol_target=None, vol_window=backtest.VOL_WINDOW,
+              max_leverage=backtest.MAX_LEVERAGE, long_only=False, cost_factor=backtest.COST_FACTOR):
+    # One asset in a pandas loop: its closes on its market's sessions (carried over the ones it
+    # has no bar on), positions from the previous close, costs on the change in position.
+    df = df.set_index('Date').reindex(sessions)
+    df = df.ffill()
+    r = df['Close'].pct_change(fill_method=None)
+    signal = np.sign(df['Close'].rolling(fast).mean() - df['Close'].rolling(slow).mean()).fillna(0)
+    if long_only:
+        signal = signal.clip(lower=0)
+    if vol_target:
+        size = (vol_target / (r.rolling(vol_window).std() * backtest.YEAR ** 0.5)).clip(upper=max_leverage)
+        signal = signal * size
+    w = signal.fillna(0)
+    held = w.shift(1).fillna(0)
+    return held * r.fillna(0) - (w - held).abs() * df['Spread'].fillna(0) * cost_factor
+
+
+def test_evaluate_matches_a_per_asset_loop():
+    data = frames()
+    u = backtest.from_frames(data, MARKETS)
+    for params in COMBOS:
+        result = backtest.evaluate(u, **params)
+        stats = result.stats
+        for i, a in enumerate(u.assets):
+            sessions = u.dates[u.session[i]]
+            want = reference(data[a], sessions, **params)
+            np.testing.assert_allclose(result.net[i, u.session[i]], want.to_numpy(), atol=1e-12, err_msg=a)
+            assert result.net[i, ~u.session[i]].sum() == 0.0  # other markets' dates earn nothing
+            assert stats.loc[a, 'pnl'] == pytest.approx(want.sum(), abs=1e-12)
+            listed = want.index >= data[a]['Date'].iloc[0]
+            assert stats.loc[a, 'days'] == listed.sum()
+            assert stats.loc[a, 'sharpe'] == pytest.approx(
+                want[listed].mean() / want[listed].std() * backtest.YEAR ** 0.5, rel=1e-9)
+
+
+def test_sweep_matches_evaluate():
+    u = backtest.from_frames(frames(), MARKETS)
+    stats, summary = backtest.sweep(u, COMBOS, workers=2)
+    assert len(stats) == len(COMBOS) * len(u.assets) and list(summary['combo']) == list(range(len(COMBOS)))
+    for i, params in enumerate(COMBOS):
+        result = backtest.evaluate(u, **params)
+        got = stats[stats['combo'] == i].set_index('asset')[backtest.STATS]
+        pd.testing.assert_frame_equal(got, result.stats[backtest.STATS], check_dtype=False)
+        assert summary.loc[i, 'sharpe'] == pytest.approx(result.portfolio['sharpe'], nan_ok=True)
+
+
+def test_grid_keeps_fast_below_slow():
+    combos = backtest.grid([10, 50], [20, 50], vol_target=0.1)
+    assert [(c['fast'], c['slow']) for c in combos] == [(10, 20), (10, 50)]
+    assert all(c['vol_target'] == 0.1 for c in combos)
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import scripts, store
+
+clean_mod = scripts.load('02_data_cleaning')
+
+
+def raw_bars(n=300, seed=0):
+    # A raw OHLCV frame of n business days, with a missing Close.
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    close[40] = np.nan
+    return pd.DataFrame({'Date': pd.bdate_range('2020-01-01', periods=n), 'Open': close, 'High': close * 1.01,
+                         'Low': close * 0.99, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(1000, 10000, n)})
+
+
+@pytest.mark.parametrize('stream', [{}, {'stream_rows': 64}])
+def test_incremental_appends_match_a_full_clean(tmp_path, stream):
+    raw = raw_bars()
+    path = str(tmp_path / 'aaa.csv')
+    for end in (120, 121, 250, len(raw)):  # three appends, one of a single bar
+        raw.iloc[:end].to_csv(path, index=False)
+        clean_mod.clean_equity(path, store_dir=str(tmp_path / 'inc'), incremental=True, **stream)
+    clean_mod.clean_equity(path, store_dir=str(tmp_path / 'full'), **stream)
+    inc = store.read_asset('aaa', store_dir=str(tmp_path / 'inc'))
+    full = store.read_asset('aaa', store_dir=str(tmp_path / 'full'))
+    assert len(full) == len(raw) - 1
+    pd.testing.assert_frame_equal(inc, full, rtol=1e-6 if stream else 1e-12)
+
+
+def test_incremental_run_without_new_bars(tmp_path):
+    path = str(tmp_path / 'aaa.csv')
+    raw_bars(50).to_csv(path, index=False)
+    clean_mod.clean_equity(path, store_dir=str(tmp_path), incremental=True)
+    assert clean_mod.clean_equity(path, store_dir=str(tmp_path), incremental=True).empty
+    assert store.row_count('aaa', str(tmp_path)) == 49
+
+
+@pytest.mark.parametrize('stream', [{}, {'stream_rows': 64}])
+def test_restated_bars_are_cleaned_in_full(tmp_path, stream):
+    raw = raw_bars()
+    path = str(tmp_path / 'aaa.csv')
+    raw.iloc[:200].to_csv(path, index=False)
+    clean_mod.clean_asset(path, None, 'aaa', incremental=True, store_dir=str(tmp_path / 'inc'), **stream)
+    raw.iloc[:250].to_csv(path, index=False)  # a pure append: only the new bars are cleaned
+    dates, _, _ = clean_mod.clean_asset(path, None, 'aaa', incremental=True, store_dir=str(tmp_path / 'inc'), **stream)
+    assert len(dates) == 50
+    raw.loc[100, 'Close'] *= 1.05  # restated bar, plus new ones
+    raw.to_csv(path, index=False)
+    dates, rets, _ = clean_mod.clean_asset(path, None, 'aaa', incremental=True, store_dir=str(tmp_path / 'inc'),
+                                           **stream)
+    assert len(dates) == len(raw) - 1
+    clean_mod.clean_equity(path, store_dir=str(tmp_path / 'full'), **stream)
+    inc = store.read_asset('aaa', store_dir=str(tmp_path / 'inc'))
+    full = store.read_asset('aaa', store_dir=str(tmp_path / 'full'))
+    pd.testing.assert_frame_equal(inc, full)
+    np.testing.assert_allclose(rets, full['Daily_Return'], rtol=1e-6)
@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import collect
+
+
+class FailingSource(collect.SyntheticSource):
+    # Synthetic bars up to `end`, except for the symbols in `dead`, which always fail.
+    def __init__(self, dead, end):
+        super().__init__(origin='2024-01-01')
+        self.dead, self.end = set(dead), end
+
+    def fetch(self, symbol, start=None, end=None, interval='1d'):
+        if symbol in self.dead:
+            raise ValueError(f'no data for {symbol}')
+        return super().fetch(symbol, start, self.end, interval)
+
+
+def test_failing_symbol_does_not_stall_the_others(tmp_path):
+    equities = {'AAA': 'AAA', 'BBB': 'BBB', 'DEAD': 'DEAD'}
+    kwargs = dict(start='2024-01-01', out_dir=str(tmp_path), workers=2, rate=None, retries=1, backoff=0)
+    rows, failures = collect.collect(equities, source=FailingSource(['DEAD'], '2024-03-01'), **kwargs)
+    assert set(rows) == {'AAA', 'BBB'} and set(failures) == {'DEAD'}
+    with open(tmp_path / collect.CHECKPOINT) as f:
+        state = json.load(f)
+    assert state['done'] == [] and state['failed'] == ['DEAD']
+
+    # the next run (same day, DEAD still failing) fetches the healthy names' new bars
+    rows, failures = collect.collect(equities, source=FailingSource(['DEAD'], '2024-04-01'), **kwargs)
+    assert rows['AAA'] > 0 and rows['BBB'] > 0 and set(failures) == {'DEAD'}
+    last = collect.last_stored_date(str(tmp_path / 'aaa.csv'))
+    assert last >= pd.Timestamp('2024-03-25')
+
+
+def test_interrupted_run_resumes(tmp_path):
+    checkpoint = collect.Checkpoint(str(tmp_path / collect.CHECKPOINT), 'key')
+    checkpoint.mark('AAA')
+    assert collect.Checkpoint(str(tmp_path / collect.CHECKPOINT), 'key').done == {'AAA'}
+    assert collect.Checkpoint(str(tmp_path / collect.CHECKPOINT), 'other').done == set()
+    checkpoint.finish({})
+    assert not os.path.exists(tmp_path / collect.CHECKPOINT)
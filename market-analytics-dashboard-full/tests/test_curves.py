@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import curves
+
+NAN = np.nan
+
+
+def curve():
+    # Three dates: every tenor quoted; 10Y missing (interpolated); quoted out to 5Y only.
+    labels = ['10Y', '3M', '2Y', '5Y', '360M']
+    values = [[4.0, 5.0, 4.5, 4.2, 4.4],
+              [NAN, 5.0, 4.5, 4.2, 4.4],
+              [NAN, 5.0, 4.5, 4.2, NAN]]
+    return curves.Curve('ust', pd.bdate_range('2024-01-01', periods=3), labels, values)
+
+
+def test_tenors_are_sorted_by_maturity():
+    c = curve()
+    assert c.labels == ['3M', '2Y', '5Y', '10Y', '360M']
+    np.testing.assert_allclose(c.tenors, [0.25, 2, 5, 10, 30])
+    with pytest.raises(ValueError):
+        curves.tenor_years('10X')
+
+
+def test_at_interpolates_and_extrapolates_flat():
+    y = curve().at(['1M', '7Y', '10Y', '40Y'])
+    np.testing.assert_allclose(y[0], [5.0, 4.2 - 0.2 * 2 / 5, 4.0, 4.4])
+    np.testing.assert_allclose(y[1], [5.0, 4.2 + 0.2 * 2 / 25, 4.2 + 0.2 * 5 / 25, 4.4])
+    np.testing.assert_allclose(y[2], [5.0, 4.2, 4.2, 4.2])
+
+
+def test_legs_beyond_the_quoted_tenors_are_nan():
+    c = curve()
+    y = c.legs(['1M', '2Y', '10Y', '30Y'])
+    assert np.isnan(y[:, 0]).all()  # below 3M on every date
+    np.testing.assert_allclose(y[:2, 1:], [[4.5, 4.0, 4.4], [4.5, 4.24, 4.4]])
+    assert y[2, 1] == 4.5 and np.isnan(y[2, 2:]).all()
+    m = c.metrics()
+    np.testing.assert_allclose(m['Slope_2s10s'][:2], [-0.5, 4.24 - 4.5])
+    assert np.isnan(m['Slope_2s10s'][2]) and np.isnan(m['Slope_5s30s'][2]) and np.isnan(m['Fly_5s10s30s'][2])
+    assert m['Slope_3m10y'][0] == pytest.approx(-1.0)
+
+
+def test_clean_and_store_round_trip(tmp_path):
+    raw = pd.DataFrame({'Date': ['2024-01-03', '2024-01-02', '2024-01-02', '2024-01-04'],
+                        '2Y': [4.1, 4.0, 4.05, 'n/a'], '10Y': [3.9, 3.8, 3.85, None]})
+    path = tmp_path / 'ust.csv'
+    raw.to_csv(path, index=False)
+    c = curves.clean_curve(str(path), store_dir=str(tmp_path))
+    assert c.labels == ['2Y', '10Y'] and len(c.dates) == 2
+    np.testing.assert_allclose(c.values, [[4.05, 3.85], [4.1, 3.9]])
+    assert curves.list_curves(str(tmp_path)) == ['ust']
+    np.testing.assert_array_equal(curves.load('ust', str(tmp_path)).values, c.values)
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import kernels
+
+RTOL = 1e-12
+needs_numba = pytest.mark.skipif(not kernels.HAVE_NUMBA, reason='numba is not installed')
+ENGINES = [pytest.param('numba', marks=needs_numba), 'numpy', 'pandas', 'python']
+
+
+def series(case, n=400, seed=0):
+    # (close, high, low) of an edge case.
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, n))
+    if case == 'flat':
+        close[100:160] = close[100]  # stale quotes: zero-variance windows
+    elif case == 'gapped':
+        close[[0, 5, 120, 121, 300]] = np.nan
+    elif case == 'short':
+        close = close[:12]
+    elif case == 'single':
+        close = close[:1]
+    return close, close * 1.01, close * 0.99
+
+
+def assert_close(got, ref):
+    for name, r in ref.items():
+        g = got[name]
+        np.testing.assert_array_equal(np.isnan(g), np.isnan(r), err_msg=name)
+        ok = ~np.isnan(r)
+        assert np.all(np.abs(g[ok] - r[ok]) <= RTOL * np.maximum(1, np.abs(r[ok]))), name
+
+
+@pytest.mark.parametrize('case', ['random', 'flat', 'gapped', 'short', 'single'])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_engine_matches_pandas(engine, case):
+    close, high, low = series(case)
+    ref, ref_factor = kernels.fused_kpis(close, high, low, engine='pandas')
+    got, factor = kernels.fused_kpis(close, high, low, engine=engine)
+    assert_close(got, ref)
+    assert factor == pytest.approx(ref_factor, rel=RTOL)
+
+
+@pytest.mark.parametrize('cut', [1, 7, 30, 51, 200, 399])
+@pytest.mark.parametrize('case', ['random', 'gapped'])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_incremental_runs_match_one_run(engine, case, cut):
+    # Two runs, the second carrying the last closes (as much as the windows need) and the
+    # cumulative factor, give the columns of one run over the whole series.
+    close, high, low = series(case)
+    ref, ref_factor = kernels.fused_kpis(close, high, low, engine='pandas')
+    tail = min(cut, 50)
+    first, f1 = kernels.fused_kpis(close[:cut], high[:cut], low[:cut], engine=engine)
+    second, f2 = kernels.fused_kpis(close[cut - tail:], high[cut:], low[cut:], start=tail, factor=f1, engine=engine)
+    assert_close({k: np.concatenate([first[k], second[k]]) for k in ref}, ref)
+    assert f2 == pytest.approx(ref_factor, rel=RTOL)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_no_new_bars(engine):
+    close, high, low = series('random', n=60)
+    cols, factor = kernels.fused_kpis(close, high[:0], low[:0], start=60, factor=1.5, engine=engine)
+    assert factor == 1.5 and all(len(v) == 0 for v in cols.values())
+
+
+def test_numba_engine_without_numba(monkeypatch):
+    # Without numba, asking for its engine fails loudly, and its kernel's body still runs (and
+    # matches pandas) in the interpreter as the 'python' engine.
+    monkeypatch.setattr(kernels, 'HAVE_NUMBA', False)
+    close, high, low = series('random')
+    with pytest.raises(ValueError, match='numba'):
+        kernels.fused_kpis(close, high, low, engine='numba')
+    assert_close(kernels.fused_kpis(close, high, low, engine='python')[0],
+                 kernels.fused_kpis(close, high, low, engine='pandas')[0])
@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import kpis, live, store
+
+
+def write_store(store_dir, asset, n=80, seed=0):
+    # A cleaned asset of n daily bars ending 2024-06-28, straight into the store.
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    df = pd.DataFrame({'Date': pd.bdate_range(end='2024-06-28', periods=n), 'Open': close, 'High': close * 1.01,
+                       'Low': close * 0.99, 'Close': close, 'Adj Close': close, 'Volume': 1e6})
+    df, _ = kpis.compute(df)
+    store.write_asset(df, asset, str(store_dir))
+    return df
+
+
+def test_fed_bars_snapshot_the_session_return(tmp_path):
+    daily = write_store(tmp_path, 'aaa')
+    service = live.LiveService(str(tmp_path), str(tmp_path / 'cleaned'), poll=60, throttle=0.01).start()
+    try:
+        prev = daily['Close'].iloc[-1]
+        closes = [prev * 1.01, prev * 1.03, prev * 1.0504]
+        bars = [{'asset': 'aaa', 'Date': f'2024-07-01T14:{30 + i}', 'Close': c} for i, c in enumerate(closes)]
+        service.loop.call_soon_threadsafe(service.feed_bars, bars)
+        deadline = time.time() + 10
+        while service.stats['publishes'] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        row = service.snapshot().loc['aaa']
+        assert row['Close'] == closes[-1]
+        assert np.isclose(row['Daily_Return'], closes[-1] / prev - 1)
+        # the daily KPIs are those of the last stored session, not moved by minute bars
+        for c in ('MA_20', 'MA_50', 'Volatility_30'):
+            assert np.isclose(row[c], daily[c].iloc[-1])
+        rm = service.returns()
+        assert np.isclose(rm.values[rm.assets.index('aaa'), -1], closes[-1] / prev - 1)
+    finally:
+        service.stop()
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import kpis, plane, snapshot, store
+
+
+def cleaned(n, seed, start='2024-01-01'):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    df = pd.DataFrame({'Date': pd.bdate_range(start, periods=n), 'Open': close, 'High': close * 1.01,
+                       'Low': close * 0.99, 'Close': close, 'Adj Close': close, 'Volume': 1000})
+    return kpis.compute(df)
+
+
+def assert_matches_store(p, asset, store_dir, clean_dir):
+    df = store.read_asset(asset, store_dir=store_dir, clean_dir=clean_dir)
+    got = p.frame(asset)
+    np.testing.assert_array_equal(got['Date'].to_numpy('datetime64[ns]'), df['Date'].to_numpy('datetime64[ns]'))
+    for c in ('Close', 'Volume', 'MA_20', 'Volatility_30', 'Amihud'):
+        np.testing.assert_allclose(got[c], df[c].to_numpy('float64'), rtol=1e-6, err_msg=f'{asset} {c}')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_publish_then_reuse_unchanged_assets(tmp_path, workers):
+    store_dir, clean_dir = str(tmp_path / 'store'), str(tmp_path / 'cleaned')
+    states = {}
+    for seed, (a, n) in enumerate([('aaa', 120), ('bbb', 80), ('ccc', 100)]):
+        df, states[a] = cleaned(n, seed)
+        store.write_asset(df, a, store_dir)
+    os.makedirs(clean_dir)
+    cleaned(60, 9)[0].to_csv(store.csv_path('ddd', clean_dir), index=False)  # a legacy CSV asset
+
+    vdir, read = plane.publish(store_dir=store_dir, clean_dir=clean_dir, workers=workers)
+    assert read == ['aaa', 'bbb', 'ccc', 'ddd']
+    p = plane.attach(store_dir)
+    assert p.version == os.path.basename(vdir) and p.assets == read
+    for a in read:
+        assert p.current(a, store_dir, clean_dir)
+        assert_matches_store(p, a, store_dir, clean_dir)
+    with pytest.raises(ValueError):
+        p.frame('aaa')['Close'].to_numpy()[0] = 0.0  # the mapped arrays are read-only
+    last = snapshot.asset_row('bbb', store_dir, clean_dir)
+    assert p.snapshot().loc['bbb', 'Close'] == pytest.approx(last['Close'])
+
+    # append to bbb: only bbb is read again, the others are copied from the previous version
+    more = pd.DataFrame({'Date': pd.bdate_range('2024-05-01', periods=5), 'Open': 100.0, 'High': 101.0,
+                         'Low': 99.0, 'Close': 100.0, 'Adj Close': 100.0, 'Volume': 1000})
+    store.append_asset(kpis.compute(more, state=states['bbb'])[0], 'bbb', store_dir)
+    assert not p.current('bbb', store_dir, clean_dir)
+    vdir2, read = plane.publish(store_dir=store_dir, clean_dir=clean_dir, workers=workers)
+    assert read == ['bbb']
+    p2 = plane.attach(store_dir)
+    assert len(p2.frame('bbb')) == 85
+    for a in p2.assets:
+        assert_matches_store(p2, a, store_dir, clean_dir)
+    # the first version stays readable (and on disk) for readers that attached before the swap
+    assert p.frame('aaa')['Close'].iloc[-1] == p2.frame('aaa')['Close'].iloc[-1]
+    plane.publish(store_dir=store_dir, clean_dir=clean_dir, workers=workers)
+    assert sorted(os.listdir(plane.plane_dir(store_dir))) == ['CURRENT', 'v2', 'v3']
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import kpis, query, store
+
+ASSETS = ['aaa', 'bbb', 'ccc', 'ddd']
+
+
+def cleaned(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    df = pd.DataFrame({'Date': pd.bdate_range('2024-01-01', periods=n), 'Open': close, 'High': close * 1.01,
+                       'Low': close * 0.98, 'Close': close, 'Adj Close': close, 'Volume': 1000})
+    return kpis.compute(df)[0]
+
+
+@pytest.fixture
+def store_dirs(tmp_path):
+    # aaa and bbb in two parts, ccc ending earlier, ddd only as a legacy cleaned CSV.
+    # Returns (store_dir, clean_dir, {asset: frame}).
+    store_dir, clean_dir = str(tmp_path / 'store'), str(tmp_path / 'cleaned')
+    frames = {a: cleaned(150 if a == 'ccc' else 200, seed) for seed, a in enumerate(ASSETS)}
+    for a in ('aaa', 'bbb'):
+        store.write_asset(frames[a].iloc[:120], a, store_dir)
+        store.append_asset(frames[a].iloc[120:].reset_index(drop=True), a, store_dir)
+    store.write_asset(frames['ccc'], 'ccc', store_dir)
+    os.makedirs(clean_dir)
+    frames['ddd'].to_csv(store.csv_path('ddd', clean_dir), index=False)
+    return store_dir, clean_dir, frames
+
+
+def test_scan_filters_like_pandas(store_dirs):
+    store_dir, clean_dir, frames = store_dirs
+    got = query.scan(['Close', 'Volatility_30'], where=[('Volatility_30', '>', 0.02)], start='2024-03-01',
+                     store_dir=store_dir, clean_dir=clean_dir)
+    want = pd.concat([f.assign(asset=a) for a, f in frames.items()])
+    want = want[(want['Volatility_30'] > 0.02) & (want['Date'] >= '2024-03-01')]
+    assert list(got.columns) == ['asset', 'Date', 'Close', 'Volatility_30']
+    assert len(got) == len(want) and set(got['asset']) == set(want['asset'])
+    assert got['Close'].sum() == pytest.approx(want['Close'].sum())
+
+
+def test_screen_on_a_date(store_dirs):
+    store_dir, clean_dir, frames = store_dirs
+    date = frames['aaa']['Date'].iloc[140]
+    rows = {a: f[f['Date'] == date].iloc[0] for a, f in frames.items()}
+    got = query.screen([('Volatility_30', '>', 0.0)], date, ['Close'], store_dir=store_dir, clean_dir=clean_dir)
+    assert list(got.columns) == ['Date', 'Close'] and sorted(got.index) == ASSETS
+    for a in ASSETS:
+        assert got.loc[a, 'Close'] == pytest.approx(rows[a]['Close'])
+    cut = float(np.median([r['Daily_Return'] for r in rows.values()]))
+    up = query.screen(ds.field('Daily_Return') > cut, date, store_dir=store_dir, clean_dir=clean_dir)
+    assert sorted(up.index) == sorted(a for a, r in rows.items() if r['Daily_Return'] > cut)
+
+    # default date: the latest in the store, which ccc did not reach
+    latest = query.screen(store_dir=store_dir, clean_dir=clean_dir)
+    assert sorted(latest.index) == ['aaa', 'bbb', 'ddd']
+    assert query.latest_date(store_dir=store_dir, clean_dir=clean_dir) == frames['aaa']['Date'].iloc[-1]
+
+
+def test_aggregate_matches_groupby(store_dirs):
+    store_dir, clean_dir, frames = store_dirs
+    data = query.dataset(store_dir, clean_dir)
+    got = query.aggregate({'vol': ('Volatility_30', 'mean'), 'n': ('Close', 'count'), 'hi': ('Close', 'max')},
+                          start='2024-02-01', data=data)
+    for a, f in frames.items():
+        f = f[f['Date'] >= '2024-02-01']
+        assert got.loc[a, 'vol'] == pytest.approx(f['Volatility_30'].mean())
+        assert got.loc[a, 'n'] == len(f) and got.loc[a, 'hi'] == pytest.approx(f['Close'].max())
+    total = query.aggregate({'n': ('Close', 'count')}, by=(), data=data)
+    assert total['n'].iloc[0] == sum(len(f) for f in frames.values())
+    with pytest.raises(ValueError):
+        query.aggregate({'x': ('Close', 'median')}, data=data)
+
+
+def test_drawdowns_match_a_running_peak(store_dirs):
+    store_dir, clean_dir, frames = store_dirs
+    got = query.drawdowns(3, start='2024-02-01', store_dir=store_dir, clean_dir=clean_dir)
+    want = {}
+    for a, f in frames.items():
+        close = f.loc[f['Date'] >= '2024-02-01', 'Close']
+        want[a] = (close / close.cummax() - 1).min() * 100
+    worst = sorted(want, key=want.get)[:3]
+    assert list(got['asset']) == worst
+    np.testing.assert_allclose(got['drawdown_pct'], [want[a] for a in worst])
+    assert (got['peak'] < got['trough']).all()
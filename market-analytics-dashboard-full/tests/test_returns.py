@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import returns
+
+
+def matrix(n_assets=5, n_dates=200, seed=0):
+    # Correlated returns with a different run of missing dates per asset.
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.01, n_dates)
+    values = common + rng.normal(0, 0.01, (n_assets, n_dates))
+    for i in range(n_assets):
+        values[i, rng.choice(n_dates, 10 * i, replace=False)] = np.nan
+    dates = pd.bdate_range('2024-01-01', periods=n_dates).to_numpy('datetime64[ns]')
+    return returns.ReturnsMatrix([f'a{i}' for i in range(n_assets)], dates, values)
+
+
+def ewm_corr(x, y, halflife):
+    # Weighted Pearson correlation over the dates both have, weights halving every halflife back.
+    w = 0.5 ** ((len(x) - 1 - np.arange(len(x))) / halflife)
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    w, x, y = w[ok] / w[ok].sum(), x[ok], y[ok]
+    cov = w @ ((x - w @ x) * (y - w @ y))
+    return cov / np.sqrt((w @ (x - w @ x) ** 2) * (w @ (y - w @ y) ** 2))
+
+
+def test_pairwise_matches_pandas():
+    rm = matrix()
+    got = rm.correlation(method='pairwise')
+    pd.testing.assert_frame_equal(got, rm.frame().corr(min_periods=2), check_names=False, rtol=1e-10)
+
+
+def test_inner_and_window_match_pandas():
+    rm = matrix()
+    df = rm.frame()
+    pd.testing.assert_frame_equal(rm.correlation(method='inner'), df.dropna().corr(), check_names=False, rtol=1e-10)
+    pd.testing.assert_frame_equal(rm.correlation(['a1', 'a3'], window=60), df[['a1', 'a3']].iloc[-60:].corr(),
+                                  check_names=False, rtol=1e-10)
+
+
+def test_ewma_correlation():
+    rm = matrix()
+    got = rm.correlation(halflife=20).to_numpy()
+    x = np.asarray(rm.values)
+    for i in range(len(rm.assets)):
+        for j in range(len(rm.assets)):
+            assert got[i, j] == pytest.approx(ewm_corr(x[i], x[j], 20), rel=1e-10)
+
+
+def test_too_few_shared_dates_is_nan():
+    x = np.array([[0.01, np.nan, 0.02, 0.03], [np.nan, 0.01, 0.02, np.nan], [np.nan] * 4])
+    corr = returns.corr_matrix(x)
+    assert np.isnan(corr[0, 1]) and np.isnan(corr[2, 2]) and corr[0, 0] == 1.0
+
+
+def test_merge_appends_or_replaces_rows():
+    d = pd.bdate_range('2024-01-01', periods=4).to_numpy('datetime64[ns]')
+    rm = returns.merge(None, {'a': (d[:3], np.array([0.1, 0.2, 0.3]))})
+    appended = returns.merge(rm, {'a': (d[3:], np.array([0.4])), 'b': (d[1:2], np.array([0.5]))}, replace=False)
+    assert appended.assets == ['a', 'b']
+    np.testing.assert_array_equal(appended.values[0], [0.1, 0.2, 0.3, 0.4])
+    replaced = returns.merge(rm, {'a': (d[2:], np.array([0.6, 0.7]))})
+    np.testing.assert_array_equal(replaced.values[0], [np.nan, np.nan, 0.6, 0.7])
+
+
+def test_published_matrix_round_trips(tmp_path):
+    rm = matrix()
+    returns.publish(rm, str(tmp_path))
+    returns.publish(rm, str(tmp_path))
+    loaded = returns.load(str(tmp_path))
+    assert loaded.assets == rm.assets and sorted(os.listdir(tmp_path / 'returns')) == ['CURRENT', 'v1', 'v2']
+    np.testing.assert_array_equal(loaded.values, rm.values)
+    np.testing.assert_array_equal(loaded.dates, rm.dates)
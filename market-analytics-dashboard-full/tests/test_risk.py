@@ -0,0 +1,91 @@
+import os
+import sys
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_analytics import returns, risk
+
+WINDOW, HALFLIFE = 60, 10.0
+
+
+def matrix(n_dates=200, seed=0):
+    # Four assets driven by the benchmark (nifty), each with its own missing dates.
+    rng = np.random.default_rng(seed)
+    bench = rng.normal(0, 0.01, n_dates)
+    values = np.vstack([bench] + [b * bench + rng.normal(0, 0.005, n_dates) for b in (0.5, 1.0, 1.5)])
+    for i in range(1, 4):
+        values[i, rng.choice(n_dates, 8 * i, replace=False)] = np.nan
+    dates = pd.bdate_range('2024-01-01', periods=n_dates).to_numpy('datetime64[ns]')
+    return returns.ReturnsMatrix(['nifty', 'aaa', 'bbb', 'ccc'], dates, values)
+
+
+def truncated(rm, t):
+    return returns.ReturnsMatrix(rm.assets, rm.dates[:t], rm.values[:, :t])
+
+
+def ewm_cov(x, y, decay):
+    # Exponentially weighted (ddof=0) covariance over the dates both have.
+    w = decay ** np.arange(len(x) - 1, -1, -1)
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    w, x, y = w[ok] / w[ok].sum(), x[ok], y[ok]
+    return w @ ((x - w @ x) * (y - w @ y))
+
+
+def test_covariances_match_direct_computation(tmp_path):
+    rm = matrix()
+    engine, days, rebuilt = risk.update(rm, WINDOW, HALFLIFE, store_dir=str(tmp_path))
+    assert days == 200 and rebuilt
+    window = rm.frame().iloc[-WINDOW:]
+    pd.testing.assert_frame_equal(engine.covariance(), window.cov(min_periods=2), check_names=False, rtol=1e-9)
+    ewma = engine.covariance(kind='ewma').to_numpy()
+    x = np.asarray(rm.values)
+    for i in range(4):
+        for j in range(4):
+            assert ewma[i, j] == pytest.approx(ewm_cov(x[i], x[j], engine.decay), rel=1e-9)
+
+
+def test_betas_and_var(tmp_path):
+    rm = matrix()
+    engine = risk.update(rm, WINDOW, HALFLIFE, store_dir=str(tmp_path))[0]
+    window = rm.frame().iloc[-WINDOW:]
+    for a in ('aaa', 'bbb', 'ccc'):
+        pair = window[[a, 'nifty']].dropna()
+        beta = pair.cov().loc[a, 'nifty'] / pair['nifty'].var()
+        assert engine.betas().loc[a, 'beta_rolling'] == pytest.approx(beta, rel=1e-9)
+    assert engine.betas().loc['nifty', 'beta_rolling'] == pytest.approx(1.0)
+
+    # equal weights, a missing return counting as 0
+    rp = window.fillna(0.0).mean(axis=1).to_numpy()
+    last = engine.var.iloc[-1]
+    assert last['portfolio_return'] == pytest.approx(rp[-1])
+    assert last['hist_var_95'] == pytest.approx(-np.quantile(rp, 0.05))
+    hist = engine.var['hist_var_99'].to_numpy()
+    assert np.isnan(hist[:WINDOW - 1]).all() and not np.isnan(hist[WINDOW - 1:]).any()
+    mean, cov = engine._moments('rolling')
+    w = engine.weights
+    assert last['param_var_99'] == pytest.approx(NormalDist().inv_cdf(0.99) * np.sqrt(w @ cov @ w) - w @ mean)
+
+
+def test_incremental_update_matches_a_full_run(tmp_path):
+    rm = matrix()
+    for t in (50, 51, 130):
+        risk.update(truncated(rm, t), WINDOW, HALFLIFE, store_dir=str(tmp_path / 'inc'))
+    engine, days, rebuilt = risk.update(rm, WINDOW, HALFLIFE, store_dir=str(tmp_path / 'inc'))
+    assert days == 70 and not rebuilt
+    full = risk.update(rm, WINDOW, HALFLIFE, store_dir=str(tmp_path / 'full'))[0]
+    for kind in ('rolling', 'ewma'):
+        pd.testing.assert_frame_equal(engine.covariance(kind=kind), full.covariance(kind=kind), rtol=1e-9)
+    np.testing.assert_allclose(engine.beta_rolling, full.beta_rolling, rtol=1e-9)
+    np.testing.assert_allclose(engine.beta_ewma, full.beta_ewma, rtol=1e-9)
+    pd.testing.assert_frame_equal(engine.var[['portfolio_return', 'hist_var_95']],
+                                  full.var[['portfolio_return', 'hist_var_95']], rtol=1e-9)
+
+    # a restated return already processed starts the run over
+    values = np.array(rm.values)
+    values[1, 10] += 0.01
+    assert risk.update(returns.ReturnsMatrix(rm.assets, rm.dates, values), WINDOW, HALFLIFE,
+                       store_dir=str(tmp_path / 'inc'))[2]